@@ -1,16 +1,160 @@
-from fastapi import FastAPI, Request, Response
+import asyncio
+import hashlib
+import json
+from typing import Dict
 
+from fastapi.security import APIKeyHeader
+from starlette.responses import Response
+from starlette.types import Scope
+
+from app.env import API_KEYS_PATH, USER_CACHE_SIZE, USER_CACHE_TTL, USER_NEGATIVE_CACHE_TTL
+from app.lib.cache import LRUCache
+from app.lib.context import current_user
+from app.lib.exceptions import Forbidden, MalformedAPIKey, Unauthorized
 from app.logger import logger
 from app.models.user import User
 
+# API keys longer than this are turned away without being looked up
+MAX_API_KEY_LENGTH = 256
+
+# Paths anyone can request without an API key: the API docs (so they can be read, and the key entered into them), and
+#   the Prometheus metrics (so a standard scrape config can read them)
+PUBLIC_PATHS = ("/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json", "/_prometheus")
+
+# Declares the X-API-Key header checked by `authenticate` in the OpenAPI schema, so the API docs can send it. Add it as
+#   a dependency of the routers that need a key. The check itself is done by `authenticate`, so this never turns a
+#   request away
+api_key_header = APIKeyHeader(
+    name="X-API-Key", auto_error=False, description="The API key of the user the request is made on behalf of"
+)
+
+
+class UserResolver:
+    """Looks up the user an API key belongs to. Implement this to authenticate users against wherever their details
+    actually live"""
+
+    async def resolve(self, api_key: str) -> User | None:
+        """Get the user the API key belongs to, or None if it doesn't belong to anyone"""
+        raise NotImplementedError("Please Implement this method")
+
+
+class StaticUserResolver(UserResolver):
+    """Resolves users from a fixed set of API keys, held in memory. Good for testing and small deployments
+
+    :arg users: The user each API key belongs to
+    """
+
+    def __init__(self, users: Dict[str, User]):
+        self.users = users
+
+    @classmethod
+    def from_file(cls, path: str) -> "StaticUserResolver":
+        """Load the API keys from a JSON file, mapping each key to the user it belongs to (eg:
+        `{"some-key": {"username": "someone", "roles": ["admin"]}}`)"""
+        with open(path) as f:
+            users = {key: User(**user) for key, user in json.load(f).items()}
+        logger.info(f"Loaded {len(users)} API keys from {path}")
+        return cls(users)
+
+    async def resolve(self, api_key: str) -> User | None:
+        return self.users.get(api_key)
+
+
+class CachedUserResolver(UserResolver):
+    """Caches the users another resolver looks up, so the (likely remote) lookup only happens once per API key every so
+    often, rather than on every request. Keys that don't belong to anyone are cached too, for a shorter time, so a
+    client retrying with a bad key doesn't cause a lookup every time. Concurrent lookups of the same key share the one
+    call to the resolver. Failed lookups aren't cached
+
+    Entries are keyed on a hash of the API key, so the keys themselves aren't kept around
+
+    :arg resolver: Where users are actually looked up
+    :arg max_size: Max number of users cached (0 disables caching)
+    :arg ttl: Seconds a user is cached for
+    :arg negative_ttl: Seconds an API key that doesn't belong to anyone is cached for
+    """
+
+    def __init__(self, resolver: UserResolver, max_size: int, ttl: float, negative_ttl: float):
+        self.resolver = resolver
+        self.users = LRUCache(max_size=max_size, ttl=ttl)
+        self.unknown = LRUCache(max_size=max_size, ttl=negative_ttl)
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def resolve(self, api_key: str) -> User | None:
+        digest = hashlib.sha256(api_key.encode()).hexdigest()
+        user = self.users.get(digest)
+        if user is not None:
+            return user
+        if self.unknown.get(digest):
+            return None
+
+        pending = self._pending.get(digest)
+        if pending is None:
+            pending = self._pending[digest] = asyncio.ensure_future(self._load(digest, api_key))
+            pending.add_done_callback(lambda _: self._pending.pop(digest, None))
+
+        # Shielded, so a request that goes away while waiting doesn't cancel the lookup for everyone else
+        return await asyncio.shield(pending)
+
+    async def _load(self, digest: str, api_key: str) -> User | None:
+        user = await self.resolver.resolve(api_key)
+        if user is None:
+            self.unknown.put(digest, True)
+        else:
+            self.users.put(digest, user)
+        return user
+
+
+# Without any API keys to check against, every request is made as this user
+DEMO_USER = User(username="Demo User", roles=["admin"])
+
+user_resolver: UserResolver | None = None
+if API_KEYS_PATH:
+    user_resolver = CachedUserResolver(
+        StaticUserResolver.from_file(API_KEYS_PATH),
+        max_size=USER_CACHE_SIZE,
+        ttl=USER_CACHE_TTL,
+        negative_ttl=USER_NEGATIVE_CACHE_TTL,
+    )
+else:
+    logger.warning("API_KEYS_PATH is not set, so requests aren't authenticated")
+
+
+def get_api_key(scope: Scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            try:
+                return value.decode("ascii")
+            except UnicodeDecodeError:
+                raise MalformedAPIKey("API key must be ASCII")
+    return None
+
+
+async def authenticate(scope: Scope) -> Response | None:
+    """Request pipeline stage (see app/api/middlewares/pipeline.py) that works out who is making the request from the
+    X-API-Key header, and attaches them to the request state
+
+    To turn a request away, return a response for it, or raise an `APIException`. Requests for `PUBLIC_PATHS` are let
+    through as they are, without a user
+    """
+    if scope["path"] in PUBLIC_PATHS:
+        return None
 
-def attach_user_authentication(app: FastAPI):
-    logger.debug("Attaching user authentication middleware to app")
+    if user_resolver is None:
+        user = DEMO_USER
+    else:
+        api_key = get_api_key(scope)
+        if not api_key:
+            raise Unauthorized("X-API-Key header is missing")
+        if len(api_key) > MAX_API_KEY_LENGTH:
+            raise MalformedAPIKey(f"API key is longer than {MAX_API_KEY_LENGTH} characters")
 
-    # TODO: Handle user authentication here. Get user details from somewhere and attach the user Object into state
+        user = await user_resolver.resolve(api_key)
+        if user is None:
+            raise Forbidden("Unknown API key")
 
-    @app.middleware("http")
-    async def add_user_to_request(request: Request, call_next) -> Response:
+    scope.setdefault("state", {})["user"] = user
 
-        request.state.user = User(username="Demo User", roles=["admin"])
-        return await call_next(request)
+    # Services are shared between requests, and pick the user up from here
+    current_user.set(user)
+    return None
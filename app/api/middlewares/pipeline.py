@@ -0,0 +1,150 @@
+import itertools
+from typing import Awaitable, Callable, Sequence
+from uuid import uuid4
+
+from fastapi import FastAPI
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.lib.context import current_timings, current_user
+from app.lib.exceptions import APIException, ServerError
+from app.lib.prometheus import requests_in_flight, request_duration
+from app.lib.timing import RequestTimings
+from app.logger import get_logger
+
+logger = get_logger()
+
+# A step run on every request before it's handed to the app (eg: working out who the user is). A stage can stop the
+#   request from going any further by returning a response (which is sent instead), or raising an `APIException`
+Stage = Callable[[Scope], Awaitable[Response | None]]
+
+# Request IDs are a random prefix, unique to this process, followed by a counter. That's far cheaper than a fresh uuid4
+#   per request (no call out to the OS for randomness), still unique across processes, and still looks like a UUID
+_request_id_prefix = str(uuid4())[:24]
+_request_id_counter = itertools.count()
+
+
+def new_request_id() -> str:
+    return f"{_request_id_prefix}{next(_request_id_counter) % 16**12:012x}"
+
+
+def error_response(request_id: str, e: Exception) -> JSONResponse:
+    """Build the response for an exception that escaped the app"""
+    response = {
+        "requestID": request_id,
+        "success": False,
+        "details": {
+            "statusCode": 500,
+            "errorCode": ServerError.error_code,
+            "errorMessage": "Internal Server Error",
+            "errorDetails": "",
+        },
+    }
+
+    match e:
+
+        case APIException():
+            if isinstance(e, ServerError):
+                logger.exception("API Server Error Thrown")
+
+            response["details"]["statusCode"] = e.status_code
+            response["details"]["errorCode"] = e.error_code
+            response["details"]["errorMessage"] = e.error_message
+            response["details"]["errorDetails"] = e.exception_message
+
+        case Exception():
+            logger.exception(f"Request failed due to unhandled exception: {e}")
+
+    return JSONResponse(content=response, status_code=response["details"]["statusCode"])
+
+
+class RequestPipeline:
+    """The one middleware every request passes through. It tags the request with an ID, runs it through each of the
+    stages (see `Stage`) and then the app, maps exceptions that escape to error responses, times the request (see
+    app/lib/timing.py), and logs it once it's done.
+
+    This is a plain ASGI middleware rather than `@app.middleware("http")` ones, each of which would run the rest of the
+    app in a separate task, and pass the response back through a stream, for every request. Responses are passed
+    straight through untouched (other than their headers), so streamed ones (eg: exports) stay streamed
+
+    :arg app: The app to hand requests to
+    :arg stages: Run in order, before the app, on every request
+    """
+
+    def __init__(self, app: ASGIApp, stages: Sequence[Stage] = ()):
+        self.app = app
+        self.stages = tuple(stages)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = new_request_id()
+
+        # Everything that happens while handling the request (eg: calls to OpenSearch) is timed into here
+        timings = RequestTimings()
+        current_timings.set(timings)
+        requests_in_flight.inc()
+        status = 500
+        started = None
+
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status, started
+            if message["type"] == "http.response.start":
+                # The breakdown is taken as the response starts, so sending the body isn't counted as part of it
+                status, started = message["status"], timings.summary()
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = request_id
+                headers["Server-Timing"] = timings.server_timing(started)
+            await send(message)
+
+        with logger.contextualize(request_id=request_id):
+            try:
+                for stage in self.stages:
+                    response = await stage(scope)
+                    if response is not None:
+                        await response(scope, receive, send_with_headers)
+                        break
+                else:
+                    await self.app(scope, receive, send_with_headers)
+
+            except Exception as e:
+                # Once the response has started there's no changing it, all we can do is log what happened
+                if started is not None:
+                    logger.exception(f"Request failed after the response was started: {e}")
+                else:
+                    await error_response(request_id, e)(scope, receive, send_with_headers)
+
+            finally:
+                requests_in_flight.dec()
+                total = timings.summary()["total"]
+                timing = started or timings.summary()
+                route = scope.get("route")
+                raw_path = (scope.get("root_path", "") + route.path) if route else None
+
+                # Paths that didn't match a route are lumped together, as they could be anything
+                request_duration.observe(total / 1000, scope["method"], raw_path or "unmatched", str(status))
+
+                duration = f"{total:.2f}"
+                user = current_user.get()
+                logger.bind(
+                    method=scope["method"],
+                    path=scope["path"],
+                    raw_path=raw_path or scope["path"],
+                    code=status,
+                    duration=duration,
+                    username=user.username if user else None,
+                    cluster_ms=round(timing["cluster"], 2),
+                    cluster_calls=timing["cluster_calls"],
+                    cluster_took_ms=timing["cluster_took"],
+                    serialization_ms=round(timing["serialization"], 2),
+                    app_ms=round(timing["app"], 2),
+                    opensearch=[vars(call) for call in timings.calls],
+                ).info(f"{scope['method']} {scope['path']} -> [{status}] in {duration}ms")
+
+
+def attach_pipeline(app: FastAPI, stages: Sequence[Stage] = ()):
+    logger.debug("Attaching request pipeline middleware to app")
+    app.add_middleware(RequestPipeline, stages=stages)
@@ -1,40 +1,46 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
+from app.lib.pagination import get_pagination_links
+from app.lib.timing import TimedRoute
 from app.models.audit import Audit
-from app.models.pagination import SortingArgs, FilteringArgs, PaginationArgs, PaginatedAuditList
+from app.models.pagination import SortingArgs, FilteringArgs, PaginationArgs, PaginatedAuditList, TimeRangeArgs
 from app.service.audit import AuditService
 from app.service.factory import get_audit_service
 
-audit_router = APIRouter(prefix="/audit", tags=["Audit"])
+audit_router = APIRouter(prefix="/audit", tags=["Audit"], route_class=TimedRoute)
 
 
 @audit_router.get("/tags/{tag_id}", tags=["Paginated"])
 async def list_the_audit_record_for_the_supplied_tag(
     tag_id: UUID,
+    request: Request,
     audit_service: AuditService = Depends(get_audit_service),
     pagination=Depends(PaginationArgs),
     filtering=Depends(FilteringArgs),
     sorting=Depends(SortingArgs),
+    time_range=Depends(TimeRangeArgs),
 ) -> PaginatedAuditList:
     query = {"term": {"tag_id": str(tag_id)}}
-    res = await audit_service.list(pagination, filtering, sorting, extra_filter=query)
-    count = await audit_service.count({"query": {"bool": {"filter": query}}})
+    res = await audit_service.list(pagination, filtering, sorting, extra_filter=query, time_range=time_range)
     ret = [Audit(**i["_source"]) for i in res.data]
-    return PaginatedAuditList(limit=res.limit, offset=res.offset, total=res.total, items=ret)
+    links = get_pagination_links(request, pagination, res)
+    return PaginatedAuditList(limit=res.limit, offset=res.offset, total=res.total, links=links, items=ret)
 
 
 @audit_router.get("/users/{username}", tags=["Paginated"])
 async def list_the_audit_record_for_the_supplied_user(
     username: str,
+    request: Request,
     audit_service: AuditService = Depends(get_audit_service),
     pagination=Depends(PaginationArgs),
     filtering=Depends(FilteringArgs),
     sorting=Depends(SortingArgs),
+    time_range=Depends(TimeRangeArgs),
 ) -> PaginatedAuditList:
     query = {"term": {"user": username}}
-    res = await audit_service.list(pagination, filtering, sorting, extra_filter=query)
-    count = await audit_service.count({"query": {"bool": {"filter": query}}})
+    res = await audit_service.list(pagination, filtering, sorting, extra_filter=query, time_range=time_range)
     ret = [Audit(**i["_source"]) for i in res.data]
-    return PaginatedAuditList(limit=res.limit, offset=res.offset, total=res.total, items=ret)
+    links = get_pagination_links(request, pagination, res)
+    return PaginatedAuditList(limit=res.limit, offset=res.offset, total=res.total, links=links, items=ret)
@@ -2,7 +2,9 @@ from uuid import UUID
 
 from fastapi import APIRouter
 
-comment_router = APIRouter(prefix="/comments", tags=["Comments"])
+from app.lib.timing import TimedRoute
+
+comment_router = APIRouter(prefix="/comments", tags=["Comments"], route_class=TimedRoute)
 
 
 @comment_router.get("/{comment_id}")
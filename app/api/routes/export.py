@@ -0,0 +1,82 @@
+import zlib
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends
+from starlette.responses import StreamingResponse
+
+from app.lib.timing import TimedRoute
+from app.models.audit import Audit
+from app.models.pagination import FilteringArgs, TimeRangeArgs
+from app.models.tag import Tag, TagHistory
+from app.service.audit import AuditService
+from app.service.factory import get_tag_service, get_tag_history_service, get_audit_service
+from app.service.tag import TagService
+from app.service.tag_history import TagHistoryService
+
+export_router = APIRouter(prefix="/export", tags=["Export"], route_class=TimedRoute)
+
+
+async def gzipped(lines: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Compress a stream of lines on the fly"""
+    compressor = zlib.compressobj(wbits=31)  # 31 gives us a gzip header and trailer
+    async for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def ndjson_response(lines: AsyncIterator[str], name: str, gzip: bool) -> StreamingResponse:
+    """Stream the supplied lines out as an NDJSON download, optionally gzipped"""
+    headers = {"Content-Disposition": f'attachment; filename="{name}.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        lines = gzipped(lines)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+
+@export_router.get("/tags")
+async def export_all_tags(
+    tag_service: TagService = Depends(get_tag_service),
+    include_deleted: bool = False,
+    gzip: bool = False,
+    filtering=Depends(FilteringArgs),
+) -> StreamingResponse:
+    """Stream out every Tag as NDJSON, one Tag per line"""
+
+    async def lines():
+        async for doc in tag_service.scan(filtering, include_deleted=include_deleted):
+            yield Tag(doc).model_dump_json() + "\n"
+
+    return ndjson_response(lines(), "tags", gzip)
+
+
+@export_router.get("/history")
+async def export_all_tag_history(
+    history_service: TagHistoryService = Depends(get_tag_history_service),
+    gzip: bool = False,
+    filtering=Depends(FilteringArgs),
+) -> StreamingResponse:
+    """Stream out every historical version of every Tag as NDJSON, one version per line"""
+
+    async def lines():
+        async for source in history_service.scan_versions(filtering):
+            yield TagHistory.from_source(source).model_dump_json() + "\n"
+
+    return ndjson_response(lines(), "history", gzip)
+
+
+@export_router.get("/audit")
+async def export_the_audit_log(
+    audit_service: AuditService = Depends(get_audit_service),
+    gzip: bool = False,
+    filtering=Depends(FilteringArgs),
+    time_range=Depends(TimeRangeArgs),
+) -> StreamingResponse:
+    """Stream out the whole audit log (or the part of it within a time range) as NDJSON, one entry per line"""
+
+    async def lines():
+        async for doc in audit_service.scan(filtering, time_range=time_range):
+            yield Audit(**doc["_source"]).model_dump_json() + "\n"
+
+    return ndjson_response(lines(), "audit", gzip)
@@ -1,33 +1,24 @@
 from fastapi import APIRouter, Depends
 
+from app.lib.cache import RefreshingCache
+from app.lib.timing import TimedRoute
 from app.service.audit import AuditService
-from app.service.factory import get_tag_service, get_audit_service
-from app.service.tag import TagService
+from app.service.factory import get_audit_service, get_tag_metrics_cache
 
-metrics_router = APIRouter(prefix="/metrics", tags=["Metrics"])
+metrics_router = APIRouter(prefix="/metrics", tags=["Metrics"], route_class=TimedRoute)
 
 
 # TODO: Most of these routes should likely be cached to avoid undue burden on the cluster
 
 
 @metrics_router.get("/tags")
-async def get_tag_metrics(tag_service: TagService = Depends(get_tag_service)):
-    """Return a dict of metrics around total tags, number recent edits, etc"""
-    clauses = await tag_service.count_clauses()
-    patterns = await tag_service.count_patterns()
-    total_tags_including_deleted = await tag_service.count(include_deleted=True)
-    tag_count_excluding_deleted = await tag_service.count()
-    return (
-        clauses
-        | patterns
-        | {
-            "tags": {
-                "count": total_tags_including_deleted,
-                "deleted": total_tags_including_deleted - tag_count_excluding_deleted,
-                "published": "TODO",
-            },
-        }
-    )
+async def get_tag_metrics(cache: RefreshingCache = Depends(get_tag_metrics_cache)):
+    """Return a dict of metrics around total tags, number recent edits, etc. These are served from a cache that's
+    refreshed in the background, the `cache` key says how old (in seconds) the values are, and whether they came from
+    the cache
+    """
+    metrics, age, cached = await cache.get()
+    return metrics | {"cache": {"cached": cached, "age": round(age, 3)}}
 
 
 @metrics_router.get("/audit")
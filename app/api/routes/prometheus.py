@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from app.lib.prometheus import registry
+from app.lib.timing import TimedRoute
+
+prometheus_router = APIRouter(prefix="/_prometheus", tags=["Monitoring"], route_class=TimedRoute)
+
+
+@prometheus_router.get("", response_class=PlainTextResponse)
+async def get_prometheus_metrics() -> PlainTextResponse:
+    """Health and performance of the app itself (request latency by route, OpenSearch call latency, cache hit ratios,
+    etc) in the Prometheus text exposition format, for scraping. Values are for this process only, since it started"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,26 +1,53 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query, Request
 
+from app.lib.etag import etag_matches, listing_etag, not_modified
+from app.lib.pagination import get_pagination_links
+from app.lib.responses import ModelResponse
+from app.lib.timing import TimedRoute
 from app.models.pagination import PaginationArgs, FilteringArgs, SortingArgs, PaginatedTagHistoryList
-from app.models.tag import TagHistory
+from app.models.tag import TagDiff, TagHistory
 from app.service.factory import get_tag_history_service
 from app.service.tag_history import TagHistoryService
 
-tag_history_router = APIRouter(prefix="/tags/history", tags=["Tag History"])
+tag_history_router = APIRouter(prefix="/tags/history", tags=["Tag History"], route_class=TimedRoute)
 
 
-@tag_history_router.get("/{tag_id}", tags=["Paginated"])
+@tag_history_router.get("/{tag_id}", tags=["Paginated"], response_model=PaginatedTagHistoryList)
 async def list_all_historical_changes_for_a_tag(
     tag_id: UUID,
+    request: Request,
     history_service: TagHistoryService = Depends(get_tag_history_service),
     pagination=Depends(PaginationArgs),
     filtering=Depends(FilteringArgs),
     sorting=Depends(SortingArgs),
-) -> PaginatedTagHistoryList:
+    if_none_match: str = Header(None, description="The ETag of a copy of this page already held"),
+) -> ModelResponse:
     query = {"term": {"id": str(tag_id)}}
-    res = await history_service.list(
-        pagination, filtering, sorting, extra_filter=query
+    res = await history_service.list(pagination, filtering, sorting, extra_filter=query)
+    links = get_pagination_links(request, pagination, res)
+
+    etag = listing_etag(res, links)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    ret = [TagHistory.from_source(source) for source in await history_service.expand(res.data)]
+    return ModelResponse(
+        PaginatedTagHistoryList.model_construct(
+            limit=res.limit, offset=res.offset, total=res.total, links=links, items=ret
+        ),
+        headers={"ETag": etag},
     )
-    ret = [TagHistory(**i["_source"]) for i in res.data]
-    return PaginatedTagHistoryList(limit=res.limit, offset=res.offset, total=res.total, items=ret)
+
+
+@tag_history_router.get("/{tag_id}/diff", response_model=TagDiff)
+async def diff_two_versions_of_a_tag(
+    tag_id: UUID,
+    from_version: int = Query(alias="from", ge=1, description="The version to diff from"),
+    to_version: int = Query(alias="to", ge=1, description="The version to diff to"),
+    history_service: TagHistoryService = Depends(get_tag_history_service),
+) -> ModelResponse:
+    """Only what changed between the two versions is returned, rather than both of them whole. Patterns and references
+    are matched up by their IDs, so changing what a pattern matches on shows as one pattern removed and another added"""
+    return ModelResponse(await history_service.diff(tag_id, from_version, to_version))
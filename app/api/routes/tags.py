@@ -1,74 +1,152 @@
+from typing import List, Union
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from starlette.responses import RedirectResponse
+from fastapi import APIRouter, Depends, Header, Request
+from starlette.responses import JSONResponse, RedirectResponse
 
+from app.env import IMPORT_CHUNK_SIZE
+from app.lib.bulk import parse_bulk_body, validate_in_batches
+from app.lib.etag import document_etag, etag_matches, fields_variant, listing_etag, not_modified
+from app.lib.pagination import get_pagination_links
+from app.lib.responses import ModelResponse, write_error_headers
 from app.lib.sequence import get_sequence
-from app.models.pagination import PaginationArgs, FilteringArgs, SortingArgs, PaginatedTagList
+from app.lib.timing import TimedRoute
+from app.models.bulk import ImportItemResult, ImportReport
+from app.models.pagination import FieldArgs, PaginationArgs, FilteringArgs, SortingArgs, PaginatedTagList
+from app.models.pagination import PaginatedTagSummaryList
 from app.models.sequence import DocumentSequence
-from app.models.tag import Create, Tag
+from app.models.tag import Create, Tag, TagItemOp, TagSummary, TAG_META_FIELDS, TAG_SOURCE_FIELDS
+from app.models.tag import Import
 from app.models.tag import Pattern
 from app.models.tag import Reference
 from app.models.tag import Update
+from app.models.service import ReturnModel
 from app.service.factory import get_tag_service
 from app.service.tag import TagService
 
-tags_router = APIRouter(prefix="/tags", tags=["Tags"])
+tags_router = APIRouter(prefix="/tags", tags=["Tags"], route_class=TimedRoute)
 
+IfNoneMatch = Header(None, description="The ETag of a copy already held, which isn't sent again if it's still current")
 
-@tags_router.get("/", tags=["Paginated"])
+
+def tag_response(tag: ReturnModel) -> ModelResponse:
+    """Respond with a whole Tag, along with its ETag, and any of its history or audit writes that failed (see
+    `write_error_headers`)"""
+    return ModelResponse(Tag(tag), headers={"ETag": document_etag(tag.data)} | write_error_headers(tag))
+
+
+@tags_router.get("/", tags=["Paginated"], response_model=Union[PaginatedTagList, PaginatedTagSummaryList])
 async def list_all_tags(
+    request: Request,
     tag_service: TagService = Depends(get_tag_service),
     include_deleted: bool = False,
     pagination=Depends(PaginationArgs),
     filtering=Depends(FilteringArgs),
     sorting=Depends(SortingArgs),
-) -> PaginatedTagList:
-    listing = await tag_service.list(pagination, filtering, sorting, include_deleted=include_deleted)
-    ret = [Tag(tag) for tag in listing.data]
-
-    return PaginatedTagList(limit=listing.limit, offset=listing.offset, total=listing.total, items=ret)
-
-
-@tags_router.get("/{tag_id}")
+    fields=Depends(FieldArgs),
+    if_none_match: str = IfNoneMatch,
+) -> ModelResponse:
+    """List Tags. Pass `fields` to get only some of the fields of each Tag (see `TagSummary`), which for Tags with lots
+    of patterns is a much smaller, and faster, response"""
+    includes, excludes = fields.split(TAG_SOURCE_FIELDS, always=TAG_META_FIELDS)
+    listing = await tag_service.list(
+        pagination, filtering, sorting, include_deleted=include_deleted, fields=includes, exclude_fields=excludes
+    )
+    links = get_pagination_links(request, pagination, listing)
+
+    etag = listing_etag(listing, links, fields_variant(includes, excludes))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    if includes is None and excludes is None:
+        ret = [Tag(tag) for tag in listing.data]
+        return ModelResponse(
+            PaginatedTagList.model_construct(
+                limit=listing.limit, offset=listing.offset, total=listing.total, links=links, items=ret
+            ),
+            headers={"ETag": etag},
+        )
+
+    ret = [TagSummary.from_doc(tag) for tag in listing.data]
+    return ModelResponse(
+        PaginatedTagSummaryList.model_construct(
+            limit=listing.limit, offset=listing.offset, total=listing.total, links=links, items=ret
+        ),
+        headers={"ETag": etag},
+    )
+
+
+@tags_router.get("/{tag_id}", response_model=Union[Tag, TagSummary])
 async def get_a_tag_by_id(
     tag_id: UUID,
     tag_service: TagService = Depends(get_tag_service),
     include_deleted: bool = False,
-) -> Tag:
-    """Retrieve a single Tag by its' ID"""
-    tag = await tag_service.get(tag_id, allow_deleted=include_deleted)
-    return Tag(tag)
+    fields=Depends(FieldArgs),
+    if_none_match: str = IfNoneMatch,
+) -> ModelResponse:
+    """Retrieve a single Tag by its' ID. Pass `fields` to get only some of its fields (see `TagSummary`). Pass the ETag
+    of a copy already held as If-None-Match, and it won't be sent again (304) if it's still current"""
+    includes, excludes = fields.split(TAG_SOURCE_FIELDS, always=TAG_META_FIELDS)
+    tag = await tag_service.get(tag_id, allow_deleted=include_deleted, fields=includes, exclude_fields=excludes)
 
+    etag = document_etag(tag.data, fields_variant(includes, excludes))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
 
-@tags_router.post("/")
+    if includes is None and excludes is None:
+        return ModelResponse(Tag(tag), headers={"ETag": etag})
+    return ModelResponse(TagSummary.from_doc(tag), headers={"ETag": etag})
+
+
+@tags_router.post("/", response_model=Tag)
 async def create_a_new_tag(
     new_tag: Create,
     tag_service: TagService = Depends(get_tag_service),
-) -> Tag:
+) -> ModelResponse:
     tag = await tag_service.create(new_tag.model_dump())
-    return Tag(tag)
+    return tag_response(tag)
+
+
+@tags_router.post("/_bulk")
+async def import_tags_in_bulk(
+    request: Request,
+    tag_service: TagService = Depends(get_tag_service),
+) -> ImportReport:
+    """Create many Tags at once, including their patterns and references. The body is either a JSON array of Tags, or
+    NDJSON (one Tag per line) sent with a Content-Type of `application/x-ndjson`. Every Tag is validated and written on
+    its own, and the outcome of each one is reported back in the order they were sent"""
+    items = await parse_bulk_body(request)
+    valid, results = await validate_in_batches(Import, items, IMPORT_CHUNK_SIZE)
+
+    created = await tag_service.bulk_create([tag.model_dump() for _, tag in valid])
+    for (index, _), result in zip(valid, created):
+        results.append(ImportItemResult(index=index, **result))
 
+    results.sort(key=lambda i: i.index)
+    succeeded = len([i for i in results if i.status == "created"])
+    return ImportReport(total=len(items), created=succeeded, failed=len(items) - succeeded, items=results)
 
-@tags_router.patch("/{tag_id}")
+
+@tags_router.patch("/{tag_id}", response_model=Tag)
 async def update_an_existing_tag(
     tag_id: UUID,
     payload: Update,
     tag_service: TagService = Depends(get_tag_service),
     sequence: DocumentSequence = Depends(get_sequence),
-) -> Tag:
+) -> ModelResponse:
     # We need to use exclude_unset here as all fields are optional. Missing fields otherwise get the default assigned
     #   value from the model, but we wan't _nothing_, since under the hood we're doing a dict merge from existing
     tag = await tag_service.update(tag_id, sequence, payload.model_dump(exclude_unset=True))
-    return Tag(tag)
+    return tag_response(tag)
 
 
 @tags_router.delete("/{tag_id}")
 async def delete_a_tag(
     tag_id: UUID, sequence: DocumentSequence = Depends(get_sequence), tag_service: TagService = Depends(get_tag_service)
-) -> None:
+) -> JSONResponse:
     """Performs a soft-deletion of the supplied tag, provided that the supplied sequence passes validation"""
-    await tag_service.delete(tag_id, sequence)
+    tag = await tag_service.delete(tag_id, sequence)
+    return JSONResponse(None, headers=write_error_headers(tag))
 
 
 @tags_router.get("/{tag_id}/comments", tags=["Comments", "Paginated"])
@@ -91,54 +169,89 @@ async def update_a_comment_for_the_supplied_tag(tag_id: UUID, comment_id: UUID)
     return RedirectResponse(url=f"/comments/{comment_id}", status_code=301)
 
 
-@tags_router.post("/{tag_id}/references")
+@tags_router.post("/{tag_id}/references", response_model=Tag)
 async def add_a_new_reference(
     tag_id: UUID,
     payload: Reference,
     tag_service: TagService = Depends(get_tag_service),
     sequence: DocumentSequence = Depends(get_sequence),
-) -> Tag:
+) -> ModelResponse:
     tag = await tag_service.create_reference(tag_id, sequence, payload.model_dump())
-    return Tag(tag)
+    return tag_response(tag)
 
 
-@tags_router.delete("/{tag_id}/references/{reference_id}")
+@tags_router.delete("/{tag_id}/references/{reference_id}", response_model=Tag)
 async def delete_a_reference(
     tag_id: UUID,
     reference_id: str,
     tag_service: TagService = Depends(get_tag_service),
     sequence: DocumentSequence = Depends(get_sequence),
-) -> Tag:
+) -> ModelResponse:
     tag = await tag_service.delete_reference(tag_id, sequence, reference_id)
-    return Tag(tag)
+    return tag_response(tag)
 
 
-@tags_router.put("/{tag_id}/references/{reference_id}")
+@tags_router.put("/{tag_id}/references/{reference_id}", response_model=Tag)
 async def update_a_reference_on_the_supplied_tag(
     tag_id: UUID,
     reference_id: str,
     payload: Reference,
     tag_service: TagService = Depends(get_tag_service),
     sequence: DocumentSequence = Depends(get_sequence),
-) -> Tag:
+) -> ModelResponse:
     tag = await tag_service.update_reference(tag_id, sequence, reference_id, payload.model_dump())
-    return Tag(tag)
+    return tag_response(tag)
 
 
-@tags_router.post("/{tag_id}/patterns")
+@tags_router.post("/{tag_id}/patterns", response_model=Tag)
 async def add_a_new_pattern(
     tag_id: UUID,
     payload: Pattern,
     tag_service: TagService = Depends(get_tag_service),
     sequence: DocumentSequence = Depends(get_sequence),
-) -> Tag:
+) -> ModelResponse:
     tag = await tag_service.create_pattern(tag_id, sequence, payload.model_dump())
-    return Tag(tag)
+    return tag_response(tag)
 
 
-@tags_router.delete("/{tag_id}/patterns/{pattern_id}")
-async def delete_a_pattern_from_a_tag(tag_id: UUID, pattern_id: str) -> Tag: ...
+@tags_router.patch("/{tag_id}/patterns", response_model=Tag)
+async def change_patterns_and_references_of_a_tag(
+    tag_id: UUID,
+    ops: List[TagItemOp],
+    tag_service: TagService = Depends(get_tag_service),
+    sequence: DocumentSequence = Depends(get_sequence),
+) -> ModelResponse:
+    """Add, update, and remove any number of the patterns and references of a Tag in one go. The changes are applied in
+    the order supplied, and are saved as a single new version of the Tag. If any of them can't be made, none are
+
+        [
+            {"op": "add", "path": "patterns", "value": {...}},
+            {"op": "update", "path": "patterns", "id": "<pattern id>", "value": {...}},
+            {"op": "remove", "path": "references", "id": "<reference id>"}
+        ]
+    """
+    tag = await tag_service.apply_item_ops(tag_id, sequence, [op.model_dump() for op in ops])
+    return tag_response(tag)
+
+
+@tags_router.delete("/{tag_id}/patterns/{pattern_id}", response_model=Tag)
+async def delete_a_pattern_from_a_tag(
+    tag_id: UUID,
+    pattern_id: str,
+    tag_service: TagService = Depends(get_tag_service),
+    sequence: DocumentSequence = Depends(get_sequence),
+) -> ModelResponse:
+    tag = await tag_service.delete_pattern(tag_id, sequence, pattern_id)
+    return tag_response(tag)
 
 
-@tags_router.put("/{tag_id}/patterns/{pattern_id}")
-async def update_the_supplied_pattern_for_a_tag(tag_id: UUID, pattern_id: str, payload: Pattern) -> Tag: ...
+@tags_router.put("/{tag_id}/patterns/{pattern_id}", response_model=Tag)
+async def update_the_supplied_pattern_for_a_tag(
+    tag_id: UUID,
+    pattern_id: str,
+    payload: Pattern,
+    tag_service: TagService = Depends(get_tag_service),
+    sequence: DocumentSequence = Depends(get_sequence),
+) -> ModelResponse:
+    tag = await tag_service.update_pattern(tag_id, sequence, pattern_id, payload.model_dump())
+    return tag_response(tag)
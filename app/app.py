@@ -1,13 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Security
 
-from app.api.middlewares.authentication import attach_user_authentication
-from app.api.middlewares.request_logging import attach_request_logging
+from app.api.middlewares.authentication import PUBLIC_PATHS, api_key_header, authenticate
+from app.api.middlewares.pipeline import attach_pipeline
 from app.api.routes.audit import audit_router
 from app.api.routes.comments import comment_router
+from app.api.routes.export import export_router
 from app.api.routes.metrics import metrics_router
+from app.api.routes.prometheus import prometheus_router
 from app.api.routes.tag_history import tag_history_router
 from app.api.routes.tags import tags_router
 from app.env import CYCLE_INDEX_TEMPLATES
+from app.lifespan import lifespan
 from app.logger import logger
 
 tags_metadata = [
@@ -28,6 +31,10 @@ tags_metadata = [
     # },
     {"name": "Comments", "description": "Comment management"},
     {"name": "Audit", "description": "Methods to view the audit log for the system"},
+    {
+        "name": "Export",
+        "description": "Stream out complete copies of the catalog, its history, and the audit log as NDJSON",
+    },
     {
         "name": "Paginated",
         "description": "These endpoints are paginated. See the pagination model for details on response type",
@@ -36,6 +43,10 @@ tags_metadata = [
         "name": "Metrics",
         "description": "Methods to view statistics and metrics around what's what in the tagging system",
     },
+    {
+        "name": "Monitoring",
+        "description": "The health and performance of the app itself, for scraping by Prometheus",
+    },
 ]
 
 description = """
@@ -76,20 +87,17 @@ app_args = {
     "openapi_tags": tags_metadata,
     "title": "Egregore: A Hunting Catalog for Everyone",
     "description": description,
+    "lifespan": lifespan,
 }
 
 if CYCLE_INDEX_TEMPLATES:
-    from app.development import lifecycle_manager  # noqa
-
     logger.info("Index cycling is ENABLED")
-    app_args["lifespan"] = lifecycle_manager
 
 
 app = FastAPI(**app_args)
 
 logger.info("Attaching middlewares to app")
-attach_request_logging(app)
-attach_user_authentication(app)
+attach_pipeline(app, stages=[authenticate])
 
 routers = [
     tags_router,
@@ -97,7 +105,11 @@ routers = [
     audit_router,
     comment_router,
     metrics_router,
+    export_router,
+    prometheus_router,
 ]
 for router in routers:
     logger.info(f"Loading router for {router.prefix}")
-    app.include_router(router)
+    # Routers that need an API key say so in the docs, which is what lets the docs send one
+    public = router.prefix in PUBLIC_PATHS
+    app.include_router(router, dependencies=[] if public else [Security(api_key_header)])
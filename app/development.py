@@ -16,9 +16,9 @@ async def lifecycle_manager(app: FastAPI):
     manager = Manager(client, logger)
     if CYCLE_INDEX_TEMPLATES:
 
-        # Create all of our index templates
-        await manager.create_component_templates()
-        await manager.create_templates()
+        # Create all of our index templates, and the first of the indexes that roll over (which are put under their
+        #   lifecycle policies as they're created)
+        await manager.setup()
 
         # Since this is a context manager, this yield is where the rest of the app runs
         yield
@@ -6,12 +6,29 @@ def get_bool(value: str) -> bool:
     return value in ["true", "yes", "1", "on"]
 
 
+def get_mapping(value: str) -> dict:
+    """Parse a string of comma separated key=value pairs into a dict"""
+    pairs = [pair.split("=", 1) for pair in str(value).split(",") if "=" in pair]
+    return {key.strip(): val.strip() for key, val in pairs}
+
+
 DEVELOPMENT = get_bool(env.get("DEVELOPMENT", False))
 LOG_LEVEL = env.get("LOG_LEVEL", "INFO")
 
 # If set to "json", will output logs in JSON format
 LOG_OUTPUT = env.get("LOG_OUTPUT", "")
 
+# A JSON file of API keys, mapping each key to the user it belongs to (eg: {"some-key": {"username": "someone",
+#   "roles": ["admin"]}}). Requests must then carry one of the keys in their X-API-Key header. If unset, requests aren't
+#   authenticated, and are all made as a demo user
+API_KEYS_PATH = env.get("API_KEYS_PATH", None)
+
+# Users are cached by API key for up to USER_CACHE_TTL seconds, holding at most USER_CACHE_SIZE of them. API keys that
+#   don't belong to anyone are cached for USER_NEGATIVE_CACHE_TTL seconds
+USER_CACHE_SIZE = int(env.get("USER_CACHE_SIZE", 1000))
+USER_CACHE_TTL = float(env.get("USER_CACHE_TTL", 300))
+USER_NEGATIVE_CACHE_TTL = float(env.get("USER_NEGATIVE_CACHE_TTL", 30))
+
 # Set up env vars for connecting to our OpenSearch cluster
 OPENSEARCH_HOST = env.get("OPENSEARCH_HOST", "localhost")
 OPENSEARCH_PORT = 9200 if not env.get("OPENSEARCH_PORT") else int(env.get("OPENSEARCH_PORT"))
@@ -20,9 +37,74 @@ OPENSEARCH_USER = env.get("OPENSEARCH_USER", "admin")
 OPENSEARCH_PASS = env.get("OPENSEARCH_PASS", "admin")
 OPENSEARCH_INDEX_PREFIX = env.get("OPENSEARCH_INDEX_PREFIX", "egregore-")
 
+# Connection pool settings for the client. Max open sockets to the cluster, seconds an idle socket is kept alive for,
+#   request timeout in seconds, and how failed requests (and, optionally, timed out ones) are retried
+OPENSEARCH_POOL_SIZE = int(env.get("OPENSEARCH_POOL_SIZE", 10))
+OPENSEARCH_KEEPALIVE_TIMEOUT = float(env.get("OPENSEARCH_KEEPALIVE_TIMEOUT", 15))
+OPENSEARCH_TIMEOUT = float(env.get("OPENSEARCH_TIMEOUT", 10))
+OPENSEARCH_MAX_RETRIES = int(env.get("OPENSEARCH_MAX_RETRIES", 3))
+OPENSEARCH_RETRY_ON_TIMEOUT = get_bool(env.get("OPENSEARCH_RETRY_ON_TIMEOUT", False))
+
+# Overrides for the refresh policy each service uses when writing to its index, as comma separated index=policy pairs
+#   (eg: "tags-latest=wait_for,tags-audit=false"). Valid policies are true, wait_for, and false
+OPENSEARCH_REFRESH_POLICIES = get_mapping(env.get("OPENSEARCH_REFRESH_POLICIES", ""))
+
+# Listing totals are counted as part of the listing search itself. Counting stops at this many matching docs (the total
+#   is then reported as this value), which keeps listings over huge indexes cheap. Set to 0 to always count exactly
+LISTING_TOTAL_HITS_LIMIT = int(env.get("LISTING_TOTAL_HITS_LIMIT", 0))
+
+# How long the point in time behind a cursor paginated listing is kept open between page reads (OpenSearch time units)
+CURSOR_KEEP_ALIVE = env.get("CURSOR_KEEP_ALIVE", "5m")
+
+# Number of docs read from OpenSearch per request when streaming out an export
+EXPORT_BATCH_SIZE = int(env.get("EXPORT_BATCH_SIZE", 1000))
+
 # Controls whether we're going to be loading and subsequently unloading the index templates on startup and shutdown
 #   of the app. Good for dev when things may be changing
 CYCLE_INDEX_TEMPLATES = get_bool(env.get("CYCLE_INDEX_TEMPLATES", False))
 
 # On shutdown, will nuke the indexes. This requires that CYCLE_INDEX_TEMPLATES also be set to take effect
 PURGE_INDEXES_ON_SHUTDOWN = get_bool(env.get("PURGE_INDEXES_ON_SHUTDOWN", False))
+
+# Audit entries are written to OpenSearch in the background, in batches. The queue is bounded; when it fills up,
+#   requests wait for the writer to catch up. Entries that can't be written are spilled to AUDIT_SPILL_PATH and replayed
+#   on start. Spilled entries that can't be read back are moved to AUDIT_SPILL_PATH.bad
+AUDIT_QUEUE_SIZE = int(env.get("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(env.get("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(env.get("AUDIT_FLUSH_INTERVAL", 1.0))
+AUDIT_SPILL_PATH = env.get("AUDIT_SPILL_PATH", "audit-spill.ndjson")
+
+# Catalog metrics (/metrics/tags) are served from a cache that's refreshed in the background every
+#   METRICS_REFRESH_INTERVAL seconds. Should refreshes keep failing, values older than METRICS_CACHE_TTL are reloaded
+METRICS_REFRESH_INTERVAL = float(env.get("METRICS_REFRESH_INTERVAL", 60))
+METRICS_CACHE_TTL = float(env.get("METRICS_CACHE_TTL", 300))
+
+# Bulk imports write this many tags per bulk call, with at most IMPORT_CONCURRENCY of those calls in flight at once
+IMPORT_CHUNK_SIZE = max(int(env.get("IMPORT_CHUNK_SIZE", 500)), 1)
+IMPORT_CONCURRENCY = max(int(env.get("IMPORT_CONCURRENCY", 4)), 1)
+
+# Tags are cached in memory by ID for up to TAG_CACHE_TTL seconds, holding at most TAG_CACHE_SIZE of them. Writes made
+#   by this process keep the cache current, but with multiple workers a read may be up to TAG_CACHE_TTL seconds stale.
+#   Set TAG_CACHE_SIZE to 0 to disable
+TAG_CACHE_SIZE = int(env.get("TAG_CACHE_SIZE", 1000))
+TAG_CACHE_TTL = float(env.get("TAG_CACHE_TTL", 30))
+
+# Tag history keeps a whole copy of a tag every HISTORY_SNAPSHOT_INTERVAL versions, and only what changed since the last
+#   copy for the versions in between (1 keeps a whole copy of every version). The last HISTORY_SNAPSHOT_CACHE_SIZE
+#   copies written or read are kept in memory, as each new version is worked out against its copy
+HISTORY_SNAPSHOT_INTERVAL = max(int(env.get("HISTORY_SNAPSHOT_INTERVAL", 10)), 1)
+HISTORY_SNAPSHOT_CACHE_SIZE = int(env.get("HISTORY_SNAPSHOT_CACHE_SIZE", 1000))
+
+# The last HISTORY_DIFF_CACHE_SIZE diffs between versions of a tag are kept in memory. Set to 0 to disable
+HISTORY_DIFF_CACHE_SIZE = int(env.get("HISTORY_DIFF_CACHE_SIZE", 1000))
+
+# Audit and history are written to a series of indexes through an alias, moving on to a new index once the current one
+#   holds ROLLOVER_MAX_SIZE of data or ROLLOVER_MAX_DOCS docs, or is ROLLOVER_MAX_AGE old. ROLLOVER_WARM_AFTER after an
+#   index has rolled over, it's made read only, merged down, and kept with ROLLOVER_WARM_REPLICAS replicas. Indexes
+#   are deleted ROLLOVER_DELETE_AFTER after they were created, leave it empty to keep them forever
+ROLLOVER_MAX_SIZE = env.get("ROLLOVER_MAX_SIZE", "30gb")
+ROLLOVER_MAX_DOCS = int(env.get("ROLLOVER_MAX_DOCS", 50_000_000))
+ROLLOVER_MAX_AGE = env.get("ROLLOVER_MAX_AGE", "30d")
+ROLLOVER_WARM_AFTER = env.get("ROLLOVER_WARM_AFTER", "7d")
+ROLLOVER_WARM_REPLICAS = int(env.get("ROLLOVER_WARM_REPLICAS", 1))
+ROLLOVER_DELETE_AFTER = env.get("ROLLOVER_DELETE_AFTER", "")
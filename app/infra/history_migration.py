@@ -0,0 +1,114 @@
+"""Rewrite the tag history index so every version is stored the way `TagHistoryService` stores new ones: a snapshot
+every `--interval` versions, and only the changes since the snapshot for the versions in between, all under IDs made
+from the tag ID and version. Versions written before history was stored this way are whole copies under random IDs, so
+this is what shrinks those. It can be run again at any time (eg: to move to a different interval), as it rebuilds the
+whole of every version before writing it back
+
+The history of each tag is read, rebuilt, and written back in turn, with the old docs deleted once their replacements
+are written. Stop the app first, as versions written while this runs could be stored against snapshots it replaces
+
+    python -m app.infra.history_migration --interval 10 --dry-run
+"""
+
+import argparse
+import asyncio
+import json
+from typing import List
+
+from opensearchpy import AsyncOpenSearch
+
+from app.env import HISTORY_SNAPSHOT_INTERVAL
+from app.lib.opensearch import client
+from app.logger import logger
+from app.models.pagination import SortingArgs
+from app.service.tag_history import TagHistoryService, encode_version, history_doc_id, snapshot_version_of
+
+
+def encode_history(sources: List[dict], interval: int) -> List[tuple]:
+    """Store the supplied versions of a tag against snapshots every `interval` versions, returning the ID and body of
+    the doc of every version. A version whose snapshot is missing from the history becomes a snapshot itself"""
+    by_version = {source["version"]: source for source in sources}
+    docs = []
+    for version, source in sorted(by_version.items()):
+        snapshot_version = snapshot_version_of(version, interval)
+        snapshot = by_version.get(snapshot_version) if snapshot_version != version else None
+        body = encode_version(snapshot, source, snapshot_version) if snapshot is not None else source
+        docs.append((history_doc_id(source["id"], version), body))
+    return docs
+
+
+async def migrate_tag(history_service: TagHistoryService, hits: List[dict], interval: int, dry_run: bool) -> tuple:
+    """Rebuild and rewrite the history of one tag, returning the bytes of history stored for it before and after"""
+    sources = await history_service.expand(hits)
+    docs = encode_history(sources, interval)
+
+    before = sum(len(json.dumps(hit["_source"])) for hit in hits)
+    after = sum(len(json.dumps(body)) for _, body in docs)
+    if dry_run:
+        return before, after
+
+    body = []
+    for doc_id, doc in docs:
+        body.append({"index": {"_index": history_service.index_name_write, "_id": doc_id}})
+        body.append(doc)
+    written = await send_bulk(history_service, hits, body)
+
+    # Old docs are only removed once the docs replacing them are in place. Those in the index being written to under
+    #   the right ID were just overwritten, but any in indexes that have since rolled over are still to go
+    body = [
+        {"delete": {"_index": hit["_index"], "_id": hit["_id"]}}
+        for hit in hits
+        if (hit["_index"], hit["_id"]) not in written
+    ]
+    if body:
+        await send_bulk(history_service, hits, body)
+    return before, after
+
+
+async def send_bulk(history_service: TagHistoryService, hits: List[dict], body: List[dict]) -> set:
+    """Send a bulk request for the history of one tag, returning the (index, ID) of every doc written"""
+    res = await history_service.client.bulk(body=body)
+    if res.get("errors"):
+        failed = [item for item in res.get("items", []) if next(iter(item.values())).get("error")]
+        raise RuntimeError(f"Failed to rewrite the history of Tag [{hits[0]['_source']['id']}]: {failed[:5]}")
+    return {(item["_index"], item["_id"]) for item in (next(iter(item.values())) for item in res.get("items", []))}
+
+
+async def migrate(client: AsyncOpenSearch, interval: int, dry_run: bool) -> None:
+    # Snapshots are read straight from the history being migrated, never from a cache
+    history_service = TagHistoryService(client, snapshot_interval=interval)
+    tags = versions = before = after = 0
+
+    # Sorting on the tag ID brings all of the versions of each tag together
+    hits: List[dict] = []
+    async for hit in history_service.scan(sorting=SortingArgs(sort_by="id", sort_order="asc")):
+        if hits and hit["_source"]["id"] != hits[0]["_source"]["id"]:
+            tag_before, tag_after = await migrate_tag(history_service, hits, interval, dry_run)
+            tags, versions, before, after = tags + 1, versions + len(hits), before + tag_before, after + tag_after
+            hits = []
+        hits.append(hit)
+
+    if hits:
+        tag_before, tag_after = await migrate_tag(history_service, hits, interval, dry_run)
+        tags, versions, before, after = tags + 1, versions + len(hits), before + tag_before, after + tag_after
+
+    logger.info(
+        f"{'Would have migrated' if dry_run else 'Migrated'} {versions} versions of {tags} Tags, from "
+        f"{before / 1024:.1f}KB to {after / 1024:.1f}KB of history"
+    )
+
+
+async def main(args):
+    try:
+        await migrate(client, args.interval, args.dry_run)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--interval", type=int, default=HISTORY_SNAPSHOT_INTERVAL, help="Versions between snapshots of each Tag"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report how much smaller the history would be")
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,13 @@
+"""Sets up everything the app needs in OpenSearch: ISM policies, component and index templates, and the first index of
+each series of indexes that roll over (see `Manager.setup`). Run this before the app is first started, and again after
+upgrading it. It's safe to run at any time, as anything already set up is updated or left alone. The app checks the
+indexes that roll over are set up when it starts, and refuses to start if they aren't
+
+    python -m app.infra.manager
+"""
+
+import argparse
+import asyncio
 import json
 import pathlib
 from typing import Callable
@@ -6,7 +16,16 @@ import loguru
 import opensearchpy
 from opensearchpy import AsyncOpenSearch
 
-from app.env import OPENSEARCH_INDEX_PREFIX
+from app.env import (
+    OPENSEARCH_INDEX_PREFIX,
+    ROLLOVER_MAX_SIZE,
+    ROLLOVER_MAX_DOCS,
+    ROLLOVER_MAX_AGE,
+    ROLLOVER_WARM_AFTER,
+    ROLLOVER_WARM_REPLICAS,
+    ROLLOVER_DELETE_AFTER,
+)
+from app.lib.opensearch import client
 from app.logger import logger
 
 
@@ -36,6 +55,14 @@ class Manager:
         "tag.component.json",
     ]
 
+    # Indexes that grow forever, so are written as a series of indexes that roll over to a new one as they grow. Each is
+    #   written to through its -write alias (only ever the newest index), and read from through its -read alias (all of
+    #   them). Their lifecycle (when to roll over, and what happens to them after) is managed by an ISM policy
+    rollover_indexes = [
+        "tags-audit",
+        "tags-history",
+    ]
+
     def __init__(self, client: AsyncOpenSearch, logger: loguru.logger):
         self.client = client
         self.logger = logger
@@ -50,11 +77,20 @@ class Manager:
         self.logger.debug(f"{func.__dict__['__wrapped__'].__name__}({args['name']})")
         return await func(**args)
 
+    async def setup(self):
+        """Sets up everything the app needs before it can start. The templates need to exist before any index is
+        created, and the policies before the first index of each series that rolls over, so it's put under them"""
+        await self.create_ism_policies()
+        await self.create_component_templates()
+        await self.create_templates()
+        await self.create_rollover_indexes()
+
     async def nuke(self):
         """Bigg hammer - deletes everything. Data, Indexes, Templates, etc"""
         await self.delete_indexes()
         await self.delete_templates()
         await self.delete_component_templates()
+        await self.delete_ism_policies()
 
     async def delete_indexes(self):
         """Deletes all indexes"""
@@ -104,6 +140,140 @@ class Manager:
             if "audit" not in name and "comment" not in name:
                 data["composed_of"] = [f"{OPENSEARCH_INDEX_PREFIX}{data['composed_of'][0]}"]
 
+            # Indexes that roll over are written and read through aliases, which are prefixed just like the indexes
+            if data["_meta"]["name"] in self.rollover_indexes:
+                settings = data["template"]["settings"]
+                alias_setting = "plugins.index_state_management.rollover_alias"
+                settings[alias_setting] = f"{OPENSEARCH_INDEX_PREFIX}{settings[alias_setting]}"
+                data["template"]["aliases"] = {
+                    f"{OPENSEARCH_INDEX_PREFIX}{alias}": value for alias, value in data["template"]["aliases"].items()
+                }
+
             data["index_patterns"] = [f"{OPENSEARCH_INDEX_PREFIX}{data['index_patterns'][0]}"]
             args = {"name": name, "body": data}
             await self._call_client(self.client.indices.put_index_template, args)
+
+    @staticmethod
+    def _rollover_policy(name: str) -> dict:
+        """The ISM policy for a series of indexes that roll over. The newest index (hot) rolls over once it's big
+        enough, has enough docs, or is old enough. Some time after rolling over, an index is only ever read (warm), so
+        it's made read only, merged down to a single segment, and kept with fewer replicas. Optionally, indexes are
+        deleted once they're old enough"""
+        index = f"{OPENSEARCH_INDEX_PREFIX}{name}"
+        rollover = {
+            "min_size": ROLLOVER_MAX_SIZE,
+            "min_doc_count": ROLLOVER_MAX_DOCS,
+            "min_index_age": ROLLOVER_MAX_AGE,
+        }
+        states = [
+            {
+                "name": "hot",
+                "actions": [{"rollover": rollover}],
+                "transitions": [{"state_name": "warm", "conditions": {"min_rollover_age": ROLLOVER_WARM_AFTER}}],
+            },
+            {
+                "name": "warm",
+                "actions": [
+                    {"read_only": {}},
+                    {"force_merge": {"max_num_segments": 1}},
+                    {"replica_count": {"number_of_replicas": ROLLOVER_WARM_REPLICAS}},
+                ],
+                "transitions": [],
+            },
+        ]
+        if ROLLOVER_DELETE_AFTER:
+            states[-1]["transitions"] = [
+                {"state_name": "delete", "conditions": {"min_index_age": ROLLOVER_DELETE_AFTER}}
+            ]
+            states.append({"name": "delete", "actions": [{"delete": {}}], "transitions": []})
+
+        return {
+            "policy": {
+                "description": f"Rolls over {index}, and retires the indexes that have rolled over",
+                "default_state": "hot",
+                "states": states,
+                # New indexes in the series are put under this policy as they're created
+                "ism_template": [{"index_patterns": [f"{index}-*"], "priority": 100}],
+            }
+        }
+
+    async def create_ism_policies(self):
+        """Creates (or updates) the ISM policy of each series of indexes that roll over. An updated policy only applies
+        to indexes created from then on. Needs the ISM plugin, which the OpenSearch distribution comes with"""
+        self.logger.warning("Creating all ISM policies")
+        for name in self.rollover_indexes:
+            policy_id = f"{OPENSEARCH_INDEX_PREFIX}{name}-rollover"
+            try:
+                params = {}
+                try:
+                    current = await self.client.index_management.get_policy(policy=policy_id)
+                    params = {"if_seq_no": current["_seq_no"], "if_primary_term": current["_primary_term"]}
+                except opensearchpy.exceptions.NotFoundError:
+                    pass
+                await self.client.index_management.put_policy(
+                    policy=policy_id, body=self._rollover_policy(name), params=params
+                )
+            except opensearchpy.exceptions.TransportError:
+                self.logger.exception(f"Failed to create ISM policy {policy_id}, {name} won't roll over")
+
+    async def delete_ism_policies(self):
+        """Deletes the ISM policies of all series of indexes that roll over"""
+        self.logger.warning("Deleting all ISM policies")
+        for name in self.rollover_indexes:
+            try:
+                await self.client.index_management.delete_policy(policy=f"{OPENSEARCH_INDEX_PREFIX}{name}-rollover")
+            except opensearchpy.exceptions.TransportError:
+                self.logger.exception(f"Failed to delete the ISM policy of {name}")
+
+    async def create_rollover_indexes(self):
+        """Creates the first index of each series of indexes that roll over, which is the index written to until the
+        first rollover (those after it are created by the rollovers, and put behind the read alias by their template).
+        An index written before rollover was set up (under the plain name) is added to the read alias, so its docs can
+        still be read. Series that are already set up are left alone. This needs to happen before anything is written,
+        or the first write creates an index under the name of the write alias, which can't roll over"""
+        for name in self.rollover_indexes:
+            index = f"{OPENSEARCH_INDEX_PREFIX}{name}"
+            write_alias, read_alias = f"{index}-write", f"{index}-read"
+            if await self.client.indices.exists_alias(name=write_alias):
+                continue
+            if await self.client.indices.exists(index=write_alias):
+                self.logger.error(f"{write_alias} is an index rather than an alias, so {name} can't roll over")
+                continue
+
+            self.logger.warning(f"Creating the first index of {name}")
+            # The write alias isn't marked as the write index, so that rollovers move it to the new index rather than
+            #   adding the new index to it. Then it only ever points at the one index, which realtime GETs need
+            await self.client.indices.create(
+                index=f"{index}-000001", body={"aliases": {write_alias: {}, read_alias: {}}}
+            )
+            if await self.client.indices.exists(index=index):
+                self.logger.warning(f"Adding {index} (written before rollover was set up) to {read_alias}")
+                await self.client.indices.put_alias(index=index, name=read_alias)
+
+    async def check_rollover_indexes(self):
+        """Raises if any series of indexes that roll over isn't set up. Its write alias would otherwise be created as an
+        index by the first write to it, which can never roll over, and whose docs are never read"""
+        for name in self.rollover_indexes:
+            index = f"{OPENSEARCH_INDEX_PREFIX}{name}"
+            write_alias = f"{index}-write"
+            if await self.client.indices.exists_alias(name=write_alias):
+                continue
+            if await self.client.indices.exists(index=write_alias):
+                raise RuntimeError(
+                    f"{write_alias} is an index rather than an alias, so {name} can't roll over. Move its docs into "
+                    f"{index} (eg: with the reindex API), delete it, and run `python -m app.infra.manager`"
+                )
+            raise RuntimeError(f"{write_alias} doesn't exist. Run `python -m app.infra.manager` to set up the indexes")
+
+
+async def main():
+    try:
+        await Manager(client, logger).setup()
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    asyncio.run(main())
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import time
+from typing import List, Tuple
+
+import opensearchpy
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.serializer import JSONSerializer
+
+from app.env import AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_SPILL_PATH
+from app.lib.opensearch import client
+from app.lib.prometheus import secondary_write_duration, secondary_write_docs, CallbackGauge, registry
+from app.logger import logger
+
+# A queued audit entry is just the index it's destined for, and the body of the doc
+QueuedAction = Tuple[str, dict]
+
+# Statuses from the bulk API that are worth trying again later. Everything else (mapping errors, etc) never will succeed
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+
+class AuditWriter:
+    """Buffers audit entries in memory and ships them to OpenSearch in batches through the bulk API.
+
+    Entries are flushed whenever `batch_size` entries have been collected, or `flush_interval` seconds have passed since
+    the first entry of the batch arrived, whichever comes first. The queue is bounded, so when OpenSearch can't keep up
+    callers wait on `submit` (backpressure) instead of the process growing without limit.
+
+    If a batch can't be delivered (cluster down, rejected for being overloaded), the entries are appended to a local
+    NDJSON spill file and replayed the next time the writer starts, so audit entries aren't lost.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenSearch,
+        max_queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        spill_path: str = AUDIT_SPILL_PATH,
+    ):
+        self.client = client
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.serializer = JSONSerializer()
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        """Number of entries waiting to be written"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Start the background flushing task. Any entries previously spilled to disk are replayed first"""
+        if self.running:
+            return
+
+        logger.info("Starting audit writer", batch_size=self.batch_size, flush_interval=self.flush_interval)
+        await self._replay_spill()
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop accepting entries, and wait for everything still queued to be flushed"""
+        if not self.running:
+            return
+
+        logger.info("Stopping audit writer, draining queue", queued=self._queue.qsize())
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, index: str, body: dict) -> None:
+        """Queue an audit entry for writing. Blocks when the queue is full, until the flusher catches up"""
+        if not self.running:
+            raise RuntimeError("Audit writer has not been started")
+        await self._queue.put((index, body))
+
+    async def _run(self) -> None:
+        """Main loop. Collect up a batch of entries, and flush them. A `None` on the queue signals shutdown"""
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Anything that was put on the queue by a waiting producer after our sentinel still needs to go out
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                leftovers.append(item)
+        if leftovers:
+            await self._flush(leftovers)
+
+    def _bulk_body(self, batch: List[QueuedAction]) -> List[dict]:
+        body = []
+        for index, doc in batch:
+            body.append({"index": {"_index": index}})
+            body.append(doc)
+        return body
+
+    async def _flush(self, batch: List[QueuedAction]) -> None:
+        """Send a batch of entries to OpenSearch. Never raises, as this runs in the background with no one to catch"""
+        start = time.perf_counter()
+        try:
+            res = await self.client.bulk(body=self._bulk_body(batch))
+
+        except (opensearchpy.exceptions.ConnectionError, opensearchpy.exceptions.TransportError) as e:
+            logger.warning(f"Unable to write {len(batch)} audit entries, spilling to disk: {e}")
+            secondary_write_docs.inc("audit_writer", "spilled", amount=len(batch))
+            self._spill(batch)
+            return
+
+        except Exception:
+            logger.exception(f"Unexpected failure writing {len(batch)} audit entries, spilling to disk")
+            secondary_write_docs.inc("audit_writer", "spilled", amount=len(batch))
+            self._spill(batch)
+            return
+
+        finally:
+            secondary_write_duration.observe(time.perf_counter() - start, "audit_writer")
+
+        if not res.get("errors"):
+            logger.debug(f"Flushed {len(batch)} audit entries")
+            secondary_write_docs.inc("audit_writer", "written", amount=len(batch))
+            return
+
+        retry, rejected = [], 0
+        for action, item in zip(batch, res.get("items", [])):
+            result = item.get("index", {})
+            if result.get("status", 500) in RETRYABLE_STATUSES:
+                retry.append(action)
+            elif result.get("error"):
+                rejected += 1
+                logger.error("Audit entry rejected by OpenSearch", error=result["error"], entry=action[1])
+
+        secondary_write_docs.inc("audit_writer", "written", amount=len(batch) - len(retry) - rejected)
+        secondary_write_docs.inc("audit_writer", "failed", amount=rejected)
+
+        if retry:
+            logger.warning(f"{len(retry)} audit entries were rejected as retryable, spilling to disk")
+            secondary_write_docs.inc("audit_writer", "spilled", amount=len(retry))
+            self._spill(retry)
+
+    def _spill(self, batch: List[QueuedAction]) -> None:
+        try:
+            with open(self.spill_path, "a") as handle:
+                for index, doc in batch:
+                    handle.write(self.serializer.dumps({"_index": index, "_source": doc}) + "\n")
+
+        except OSError:
+            # Nothing else we can do at this point, so at least get the entries into the logs
+            logger.exception("Failed to spill audit entries to disk")
+            for index, doc in batch:
+                logger.error("Dropped audit entry", index=index, entry=doc)
+
+    async def _replay_spill(self) -> None:
+        """Send any audit entries that were previously spilled to disk. Entries that fail again are re-spilled"""
+        # The spill file is moved out of the way first, so anything failing again gets spilled to a fresh file. One left
+        #   over from before means the last replay never finished (eg: the app was stopped partway), so it goes first.
+        #   Entries it already sent are sent again, as a duplicate audit entry is better than a lost one
+        replay_path = f"{self.spill_path}.replay"
+        if os.path.exists(replay_path):
+            await self._replay_file(replay_path)
+
+        if os.path.exists(self.spill_path):
+            os.replace(self.spill_path, replay_path)
+            await self._replay_file(replay_path)
+
+    async def _replay_file(self, replay_path: str) -> None:
+        """Send the audit entries in a spill file, then remove it. Lines that can't be read (eg: the last line, if the
+        app died while spilling) are moved to a .bad file alongside it to be looked at, rather than stopping the app
+        from starting"""
+        batch, bad = [], []
+        with open(replay_path, "r") as handle:
+            for number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = self.serializer.loads(line)
+                    batch.append((entry["_index"], entry["_source"]))
+                except (opensearchpy.exceptions.SerializationError, KeyError, TypeError):
+                    logger.error("Unreadable spilled audit entry", path=replay_path, line=number)
+                    bad.append(line if line.endswith("\n") else line + "\n")
+                    continue
+
+                if len(batch) >= self.batch_size:
+                    await self._flush(batch)
+                    batch = []
+
+        if batch:
+            await self._flush(batch)
+
+        if bad:
+            bad_path = f"{self.spill_path}.bad"
+            logger.error(f"Moving {len(bad)} unreadable spilled audit entries to {bad_path}")
+            with open(bad_path, "a") as handle:
+                handle.writelines(bad)
+
+        logger.info("Replayed spilled audit entries", path=replay_path)
+        os.remove(replay_path)
+
+
+audit_writer = AuditWriter(client)
+
+registry.register(
+    CallbackGauge(
+        "egregore_audit_queue_depth",
+        "Audit entries waiting to be written by the background audit writer",
+        lambda: {(): audit_writer.queued},
+    )
+)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Any, List, Tuple, Type
+
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+
+from app.lib.exceptions import ClientError
+from app.models.bulk import ImportItemResult
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class UnparsableItem:
+    """Stands in for an NDJSON line that isn't valid JSON, so it can be reported alongside everything else"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+async def parse_bulk_body(request: Request) -> List[Any]:
+    """Read the items out of a bulk request body. NDJSON bodies (by Content-Type) have one item per line, anything else
+    must be a JSON array of items"""
+    raw = await request.body()
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if media_type in NDJSON_MEDIA_TYPES:
+        items = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(UnparsableItem(f"Invalid JSON: {e}"))
+
+    else:
+        try:
+            items = json.loads(raw)
+        except ValueError as e:
+            raise ClientError(f"Invalid JSON: {e}")
+
+        if not isinstance(items, list):
+            raise ClientError("Request body must be a JSON array, or NDJSON")
+
+    if not items:
+        raise ClientError("No items were supplied")
+
+    return items
+
+
+async def validate_in_batches(
+    model: Type[BaseModel], items: List[Any], batch_size: int
+) -> Tuple[List[Tuple[int, BaseModel]], List[ImportItemResult]]:
+    """Validate every item against the supplied model, returning the valid ones (with their position in the request),
+    and a failed result for each invalid one. Validation is CPU bound, so we hand control back to the event loop between
+    batches to keep large imports from stalling every other request"""
+    valid = []
+    invalid = []
+    for start in range(0, len(items), batch_size):
+        for index, item in enumerate(items[start : start + batch_size], start=start):
+            if isinstance(item, UnparsableItem):
+                invalid.append(ImportItemResult(index=index, status="invalid", error=item.error))
+                continue
+
+            try:
+                valid.append((index, model.model_validate(item)))
+            except ValidationError as e:
+                invalid.append(
+                    ImportItemResult(index=index, status="invalid", error=json.loads(e.json(include_url=False)))
+                )
+
+        await asyncio.sleep(0)
+
+    return valid, invalid
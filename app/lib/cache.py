@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Tuple
+
+from app.logger import logger
+
+
+class RefreshingCache:
+    """Holds the result of an expensive async call, and keeps it fresh by re-running the call in the background on an
+    interval, so readers never have to wait on it. If there's no value yet, or the background refreshes have been
+    failing long enough that the value is older than `ttl`, the next reader loads it (only one load runs at a time)
+
+    :arg name: A human-readable name for what's cached, used in logs
+    :arg loader: Async callable that produces the value
+    :arg refresh_interval: Seconds between background refreshes
+    :arg ttl: Max age in seconds of a value before readers stop accepting it
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Awaitable[Any]], refresh_interval: float, ttl: float):
+        self.name = name
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._value: Any = None
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def age(self) -> float | None:
+        """Seconds since the value was loaded, None if it never has been"""
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    async def get(self) -> Tuple[Any, float, bool]:
+        """Get the value, along with its age in seconds, and whether it came from the cache"""
+        age = self.age
+        if age is not None and age <= self.ttl:
+            self.hits += 1
+            return self._value, age, True
+
+        self.misses += 1
+        async with self._lock:
+            # Someone else may have loaded it while we were waiting on the lock
+            age = self.age
+            if age is not None and age <= self.ttl:
+                return self._value, age, True
+
+            await self.refresh()
+            return self._value, self.age, False
+
+    async def refresh(self) -> None:
+        """Load a new value into the cache"""
+        value = await self.loader()
+        self._value = value
+        self._loaded_at = time.monotonic()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                logger.debug(f"Refreshed cached {self.name}")
+            except Exception:
+                logger.exception(f"Failed to refresh cached {self.name}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self) -> None:
+        """Start refreshing the value in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class LRUCache:
+    """A size bounded cache that evicts the least recently used entry when full, and treats entries older than `ttl` as
+    missing. Counts hits and misses. Not thread safe, but doesn't need to be as everything runs on the one event loop
+
+    :arg max_size: Max number of entries held. 0 disables caching entirely
+    :arg ttl: Max age in seconds of an entry
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Any, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key) -> Any:
+        """Get the value for the key, or None if it's not cached (or has expired)"""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value) -> None:
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,12 @@
+from contextvars import ContextVar
+
+from app.models.user import User
+
+""" Per-request state that's needed deep inside the app (eg: by services, which are shared between requests) lives in
+these context vars, rather than being passed down through every call """
+
+# The user the current request is being made by. Set by the authentication stage of the request pipeline
+current_user: ContextVar[User | None] = ContextVar("current_user", default=None)
+
+# Timings (eg: of calls made to OpenSearch) collected while handling the current request. Set by the request pipeline
+current_timings: ContextVar["RequestTimings | None"] = ContextVar("current_timings", default=None)
@@ -0,0 +1,63 @@
+"""ETags for conditional requests. A single doc's ETag is its sequence, which changes on every write to it, so clients
+can send it back with If-None-Match to skip re-downloading a doc they already have, or with If-Match (in place of the
+sequence query param) when changing it. A listing's ETag is a hash of the docs on the page and the links to the other
+pages, which is cheap to work out from the search result, before any of it is loaded into models or serialized"""
+
+import hashlib
+import json
+from typing import List
+
+from starlette.responses import Response
+
+from app.lib.exceptions import ClientError
+from app.lib.timing import mark_endpoint_done
+from app.models.pagination import PaginationLinkObject
+from app.models.sequence import DocumentSequence
+from app.models.service import ReturnModel
+
+
+def fields_variant(includes: List[str] | None, excludes: List[str] | None) -> str:
+    """Tell apart the ETags of responses holding different fields of the same doc(s). Empty if all fields are held"""
+    if includes is None and excludes is None:
+        return ""
+    spec = json.dumps([sorted(includes) if includes is not None else None, sorted(excludes or [])])
+    return hashlib.sha1(spec.encode()).hexdigest()[:8]
+
+
+def document_etag(doc: dict, variant: str = "") -> str:
+    """The ETag of a single doc, as returned from OpenSearch (including the _ fields)"""
+    sequence = DocumentSequence(seq_no=doc["_seq_no"], primary_term=doc["_primary_term"])
+    value = sequence.encoded_string.decode()
+    return f'"{value}:{variant}"' if variant else f'"{value}"'
+
+
+def listing_etag(listing: ReturnModel, links: PaginationLinkObject, variant: str = "") -> str:
+    """The ETag of a page of a listing. Changes whenever any doc on the page does, or the page moves"""
+    page = [[doc["_id"], doc["_seq_no"], doc["_primary_term"]] for doc in listing.data]
+    state = json.dumps([listing.total, links.model_dump(), page, variant])
+    return f'"{hashlib.sha1(state.encode()).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header holds the supplied ETag. Compared weakly, as If-None-Match always is"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+
+
+def not_modified(etag: str) -> Response:
+    """Tell the client the copy it already holds is current, rather than sending it again"""
+    mark_endpoint_done()
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def sequence_from_etag(etag: str) -> DocumentSequence:
+    """Read the sequence back out of a doc's ETag (as sent in an If-Match header)"""
+    etag = etag.strip()
+    if etag.startswith("W/") or etag == "*" or "," in etag:
+        raise ClientError("If-Match must be the single ETag of the doc being changed")
+
+    value = etag.strip('"').split(":")[0]
+    return DocumentSequence(sequence_str=value)
@@ -1,6 +1,96 @@
-from opensearchpy import AsyncOpenSearch
+import time
+from asyncio import get_running_loop
+from typing import List
+
+import aiohttp
+from opensearchpy import AsyncOpenSearch, AIOHttpConnection, AsyncTransport
+from opensearchpy._async.http_aiohttp import OpenSearchClientResponse
+
+from app.env import (
+    OPENSEARCH_HOST,
+    OPENSEARCH_PORT,
+    OPENSEARCH_USER,
+    OPENSEARCH_PASS,
+    OPENSEARCH_CA_PATH,
+    OPENSEARCH_POOL_SIZE,
+    OPENSEARCH_KEEPALIVE_TIMEOUT,
+    OPENSEARCH_TIMEOUT,
+    OPENSEARCH_MAX_RETRIES,
+    OPENSEARCH_RETRY_ON_TIMEOUT,
+)
+from app.lib.context import current_timings
+from app.lib.prometheus import opensearch_call_duration, opensearch_call_errors
+from app.lib.timing import describe_call
+from app.logger import logger
+
+
+class InstrumentedTransport(AsyncTransport):
+    """The stock transport, but every call is timed. Timings are recorded in the Prometheus metrics, and for calls made
+    while handling a request, against that request too (see app/lib/timing.py)"""
+
+    async def perform_request(self, method: str, url: str, *args, **kwargs):
+        operation, index = describe_call(method, url)
+        start = time.perf_counter()
+        res = None
+        try:
+            res = await super().perform_request(method, url, *args, **kwargs)
+            return res
+        except Exception:
+            opensearch_call_errors.inc(operation, index or "")
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            opensearch_call_duration.observe(duration, operation, index or "")
+
+            timings = current_timings.get()
+            if timings is not None:
+                took = res.get("took") if isinstance(res, dict) else None
+                timings.add_call(operation, index, round(duration * 1000, 3), took)
+
+
+class PooledConnection(AIOHttpConnection):
+    """The stock aiohttp connection, but with control over how long idle pooled sockets are kept alive for, and the
+    ability to trace what the pool is doing (see bench/connection_reuse.py)
+
+    Neither can be set through the stock connection's arguments, so this builds the session itself, the same way the
+    stock connection does. That relies on its internals, which is why opensearch-py is pinned in requirements.txt. If
+    those change, the stock session is used instead, without either setting
+
+    :arg keepalive_timeout: Seconds an idle socket is kept in the pool before being closed
+    :arg trace_configs: Optional. aiohttp trace configs attached to the session
+    """
+
+    def __init__(self, *args, keepalive_timeout: float = 15, trace_configs: List[aiohttp.TraceConfig] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._keepalive_timeout = keepalive_timeout
+        self._trace_configs = trace_configs
+
+    async def _create_aiohttp_session(self) -> None:
+        if not hasattr(self, "_ssl_context"):
+            logger.warning("The OpenSearch connection has changed, so pooled sockets can't be tuned or traced")
+            await super()._create_aiohttp_session()
+            return
+
+        if self.loop is None:
+            self.loop = get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=("accept", "accept-encoding"),
+            auto_decompress=True,
+            loop=self.loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=OpenSearchClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit,
+                keepalive_timeout=self._keepalive_timeout,
+                use_dns_cache=True,
+                enable_cleanup_closed=True,
+                ssl=self._ssl_context,
+            ),
+            trust_env=self._trust_env,
+            trace_configs=self._trace_configs,
+        )
 
-from app.env import OPENSEARCH_HOST, OPENSEARCH_PORT, OPENSEARCH_USER, OPENSEARCH_PASS, OPENSEARCH_CA_PATH
 
 # https://github.com/opensearch-project/opensearch-py/blob/main/guides/async.md
 client_args = {
@@ -11,10 +101,24 @@ client_args = {
     "verify_certs": False,
     "ssl_assert_hostname": False,
     "ssl_show_warn": False,
+    "transport_class": InstrumentedTransport,
+    "connection_class": PooledConnection,
+    "maxsize": OPENSEARCH_POOL_SIZE,
+    "keepalive_timeout": OPENSEARCH_KEEPALIVE_TIMEOUT,
+    "timeout": OPENSEARCH_TIMEOUT,
+    "max_retries": OPENSEARCH_MAX_RETRIES,
+    "retry_on_timeout": OPENSEARCH_RETRY_ON_TIMEOUT,
 }
 
 if OPENSEARCH_CA_PATH:
     client_args["ca_certs"] = OPENSEARCH_CA_PATH
     client_args["verify_certs"] = True
 
-client = AsyncOpenSearch(**client_args)
+
+def create_client(**overrides) -> AsyncOpenSearch:
+    """Create a new client. Sockets aren't opened until the first request is made, and are pooled from then on"""
+    return AsyncOpenSearch(**(client_args | overrides))
+
+
+# The one client shared by the whole app. Its pool is closed by the app lifespan on shutdown
+client = create_client()
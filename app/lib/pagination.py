@@ -0,0 +1,34 @@
+from fastapi import Request
+
+from app.models.pagination import PaginationArgs, PaginationLinkObject
+from app.models.service import ReturnModel
+
+
+def get_pagination_links(request: Request, pagination: PaginationArgs, listing: ReturnModel) -> PaginationLinkObject:
+    """Build the links to the other pages of a listing, keeping all of the other query params of the request. Offset
+    paginated listings link by offset, and cursor paginated listings link by cursor (there's no last page for those)"""
+    url = request.url
+
+    if pagination.cursor is not None:
+        return PaginationLinkObject(
+            first=str(url.include_query_params(cursor="")),
+            next=str(url.include_query_params(cursor=listing.next_cursor)) if listing.next_cursor else "",
+            previous=str(url.include_query_params(cursor=listing.previous_cursor)) if listing.previous_cursor else "",
+        )
+
+    limit = max(listing.limit, 1)
+    last_offset = max(listing.total - 1, 0) // limit * limit
+    return PaginationLinkObject(
+        first=str(url.include_query_params(offset=0, limit=limit)),
+        last=str(url.include_query_params(offset=last_offset, limit=limit)),
+        next=(
+            str(url.include_query_params(offset=listing.offset + limit, limit=limit))
+            if listing.offset + limit < listing.total
+            else ""
+        ),
+        previous=(
+            str(url.include_query_params(offset=max(listing.offset - limit, 0), limit=limit))
+            if listing.offset > 0
+            else ""
+        ),
+    )
@@ -0,0 +1,218 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Tuple
+
+""" A small, dependency free take on Prometheus instrumentation, for watching the health of the app (as opposed to the
+catalog statistics served under /metrics). Everything is recorded on the event loop, which only ever runs one thing at a
+time, so recording is just a dict lookup and an increment, with no locks. Don't record from threads
+
+Values are rendered in the Prometheus text exposition format on demand (see app/api/routes/prometheus.py) """
+
+LabelValues = Tuple[str, ...]
+
+# Bucket bounds, in seconds, for latency histograms. Covers sub-millisecond cache hits through to slow bulk writes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base for all metric types
+
+    :arg name: The metric name, including any unit suffix (eg: _seconds, _total)
+    :arg documentation: What the metric measures, rendered as its HELP text
+    :arg labels: Names of the labels every value is recorded with
+    """
+
+    type: str
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError("Please Implement this method")
+
+
+class Counter(Metric):
+    """A value that only ever goes up"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Gauge(Counter):
+    """A value that goes up and down"""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """A gauge whose values are read from somewhere else when rendered, rather than being recorded as they change. Good
+    for exposing state that's already being tracked (eg: cache sizes)
+
+    :arg callback: Returns the current value for each set of label values
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        labels: Tuple[str, ...] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.callback().items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class CallbackCounter(CallbackGauge):
+    """A counter whose values are read from somewhere else when rendered"""
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    """Counts observations into buckets. Buckets are stored individually, and only made cumulative when rendered
+
+    :arg buckets: Upper bounds of the buckets, in ascending order. A +Inf bucket is always added
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Per set of label values: the count in each bucket (the last being +Inf), then the sum of all observations
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> Iterator[str]:
+        bounds = self.buckets + (float("inf"),)
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = format_labels(self.labels, labels, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total[0])}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}"
+
+
+class Registry:
+    """Holds every metric the app exposes"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Requests. The route is the template (eg: /tags/{tag_id}) rather than the actual path, to keep the number of label
+#   values bounded
+requests_in_flight = registry.register(Gauge("egregore_requests_in_flight", "Requests currently being handled"))
+request_duration = registry.register(
+    Histogram(
+        "egregore_request_duration_seconds",
+        "Time taken to handle a request, by route template",
+        labels=("method", "route", "status"),
+    )
+)
+
+# Calls made to OpenSearch, from requests and background tasks alike
+opensearch_call_duration = registry.register(
+    Histogram(
+        "egregore_opensearch_call_duration_seconds",
+        "Time taken by calls to OpenSearch, as seen by the app (including retries)",
+        labels=("operation", "index"),
+    )
+)
+opensearch_call_errors = registry.register(
+    Counter(
+        "egregore_opensearch_call_errors_total",
+        "Calls to OpenSearch that raised an error",
+        labels=("operation", "index"),
+    )
+)
+
+# Writes of history and audit docs, which happen alongside (unit of work), or in the background of (audit writer), the
+#   writes they record
+secondary_write_duration = registry.register(
+    Histogram(
+        "egregore_secondary_write_duration_seconds",
+        "Time taken to write a batch of history and audit docs",
+        labels=("writer",),
+    )
+)
+secondary_write_docs = registry.register(
+    Counter(
+        "egregore_secondary_write_docs_total",
+        "History and audit docs written, by whether they were written successfully",
+        labels=("writer", "outcome"),
+    )
+)
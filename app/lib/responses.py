@@ -0,0 +1,35 @@
+import json
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from app.lib.timing import mark_endpoint_done
+from app.models.service import ReturnModel
+
+
+class ModelResponse(JSONResponse):
+    """A JSON response straight from a pydantic model, serialized by pydantic itself.
+
+    Returning a model from a route has FastAPI validate it all over again against the response model before serializing
+    it, which for large listings costs as much as building the models did. Returning one of these skips all of that, so
+    only return models that are already valid (ie: were built by us). Set `response_model` on the route, so the docs
+    still describe what's returned
+    """
+
+    def __init__(self, content: BaseModel, status_code: int = 200, **kwargs):
+        # What's left from here is serializing the response, which is timed on its own
+        mark_endpoint_done()
+        super().__init__(content, status_code=status_code, **kwargs)
+
+    def render(self, content: BaseModel) -> bytes:
+        return content.__pydantic_serializer__.to_json(content)
+
+
+def write_error_headers(ret: ReturnModel) -> dict:
+    """Headers reporting the secondary writes (history, audit) of a mutation that failed, if any did. The change itself
+    was made, so it's still a success, but the caller is told what's missing from the record of it. The header is a JSON
+    list of the index, ID (if the doc had one), and status of each write that failed"""
+    if not ret.write_errors:
+        return {}
+    failed = [{"index": error["index"], "id": error["id"], "status": error["status"]} for error in ret.write_errors]
+    return {"X-Write-Errors": json.dumps(failed, separators=(",", ":"))}
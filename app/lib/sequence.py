@@ -1,7 +1,16 @@
-from fastapi import Query
+from fastapi import Header, Query
 
+from app.lib.etag import sequence_from_etag
+from app.lib.exceptions import ClientError
 from app.models.sequence import DocumentSequence
 
 
-def get_sequence(sequence: str = Query()) -> DocumentSequence:
-    return DocumentSequence(sequence_str=sequence)
+def get_sequence(
+    sequence: str = Query(None, description="The sequence of the doc being changed, as last read"),
+    if_match: str = Header(None, description="The ETag of the doc being changed, in place of the sequence"),
+) -> DocumentSequence:
+    if sequence:
+        return DocumentSequence(sequence_str=sequence)
+    if if_match:
+        return sequence_from_etag(if_match)
+    raise ClientError("The sequence of the doc being changed must be supplied, as a sequence or an If-Match header")
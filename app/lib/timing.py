@@ -0,0 +1,130 @@
+import functools
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, List
+
+from fastapi.routing import APIRoute
+
+from app.lib.context import current_timings
+
+""" Breaks down where the time spent handling a request went. Every call made to OpenSearch is recorded against the
+request it was made for (see `InstrumentedTransport`), the end of the route's own code is marked by `TimedRoute`, and
+the request logging middleware ties it all together into the request log line, and a `Server-Timing` header """
+
+
+@dataclass
+class ClusterCall:
+    """A single call made to OpenSearch
+
+    :arg operation: What kind of call it was (search, get, index, bulk, ...)
+    :arg index: The index the call targeted, if any
+    :arg duration: Milliseconds the call took, as seen by the app (including retries)
+    :arg took: Milliseconds OpenSearch says it spent on it, for calls that report it
+    """
+
+    operation: str
+    index: str | None
+    duration: float
+    took: int | None = None
+
+
+class RequestTimings:
+    """Timings collected while handling a single request. All times are in milliseconds
+
+    - cluster: Total time spent waiting on OpenSearch. Calls made concurrently are each counted in full
+    - serialization: Time from the route returning to the response being ready, which is FastAPI validating and
+      serializing whatever the route returned
+    - app: Everything else (middlewares, dependencies, the route's own code)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls: List[ClusterCall] = []
+        self.endpoint_done: float | None = None
+
+    def add_call(self, operation: str, index: str | None, duration: float, took: int | None = None) -> None:
+        self.calls.append(ClusterCall(operation, index, duration, took))
+
+    def summary(self, end: float = None) -> dict:
+        """The totals for the request, as of `end` (or now)"""
+        end = end if end is not None else time.perf_counter()
+        total = (end - self.start) * 1000
+        cluster = sum(call.duration for call in self.calls)
+        serialization = (end - self.endpoint_done) * 1000 if self.endpoint_done is not None else 0.0
+        return {
+            "total": total,
+            "cluster": cluster,
+            "cluster_calls": len(self.calls),
+            "cluster_took": sum(call.took for call in self.calls if call.took is not None),
+            "serialization": serialization,
+            "app": max(total - cluster - serialization, 0.0),
+        }
+
+    @staticmethod
+    def server_timing(summary: dict) -> str:
+        """Format a summary as the value of a Server-Timing header"""
+        return ", ".join(
+            [
+                f'cluster;dur={summary["cluster"]:.2f};desc="{summary["cluster_calls"]} calls, '
+                f'took {summary["cluster_took"]}ms"',
+                f"serialization;dur={summary['serialization']:.2f}",
+                f"app;dur={summary['app']:.2f}",
+                f"total;dur={summary['total']:.2f}",
+            ]
+        )
+
+
+def describe_call(method: str, url: str) -> tuple[str, str | None]:
+    """Work out what a call to OpenSearch was doing, and to which index, from its method and URL"""
+    parts = [part for part in url.split("?", 1)[0].split("/") if part]
+    index = parts[0] if parts and not parts[0].startswith("_") else None
+    endpoint = next((part for part in parts if part.startswith("_")), None)
+
+    match endpoint, method:
+        case None, _:
+            return method.lower(), index
+        case "_doc", "GET":
+            return "get", index
+        case "_doc", "DELETE":
+            return "delete", index
+        case "_doc" | "_create", _:
+            return "index", index
+        case "_search", _ if parts[-1] == "point_in_time":
+            return ("delete_pit" if method == "DELETE" else "create_pit"), index
+        case _:
+            return endpoint.lstrip("_"), index
+
+
+def mark_endpoint_done() -> None:
+    """Mark the route's own code as done. Only the first mark counts, so a route can mark it early (eg: before building
+    its own response) without `TimedRoute` moving it afterwards"""
+    timings = current_timings.get()
+    if timings is not None and timings.endpoint_done is None:
+        timings.endpoint_done = time.perf_counter()
+
+
+class TimedRoute(APIRoute):
+    """A route that marks when the route's own code finishes, so the time FastAPI then spends serializing the response
+    can be told apart from the rest"""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def timed(*args, **kw):
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    mark_endpoint_done()
+
+        else:
+
+            @functools.wraps(endpoint)
+            def timed(*args, **kw):
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    mark_endpoint_done()
+
+        super().__init__(path, timed, **kwargs)
@@ -0,0 +1,46 @@
+from contextlib import asynccontextmanager, AsyncExitStack
+
+import opensearchpy
+from fastapi import FastAPI
+
+from app.env import CYCLE_INDEX_TEMPLATES
+from app.infra.manager import Manager
+from app.lib.audit_writer import audit_writer
+from app.lib.opensearch import client
+from app.logger import logger
+from app.service.factory import tag_metrics_cache
+
+""" This file defines the context manager that FAPI uses during start/shutdown, for everything that runs alongside the
+app (background writers, etc). Index template cycling for development is layered in here too when it's enabled """
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with AsyncExitStack() as stack:
+        # The client is shared by everything below, so it's the last thing closed. This releases the pooled sockets
+        stack.push_async_callback(client.close)
+
+        if CYCLE_INDEX_TEMPLATES:
+            from app.development import lifecycle_manager  # noqa
+
+            # Templates need to exist before anything (eg: spilled audit entries) gets written
+            await stack.enter_async_context(lifecycle_manager(app))
+
+        # Writing to a series of indexes that roll over before it's set up would create an index that never rolls over,
+        #   so refuse to start instead. Without a cluster to check there's nothing to write to, so the app still starts
+        try:
+            await Manager(client, logger).check_rollover_indexes()
+        except opensearchpy.exceptions.ConnectionError:
+            logger.warning("Unable to reach OpenSearch, so couldn't check its indexes are set up")
+
+        logger.debug("Starting background audit writer with app lifecycle")
+        await audit_writer.start()
+        stack.push_async_callback(audit_writer.stop)
+
+        logger.debug("Starting background refresh of cached metrics")
+        await tag_metrics_cache.start()
+        stack.push_async_callback(tag_metrics_cache.stop)
+
+        # Since this is a context manager, this yield is where the rest of the app runs. On the way out, the stack is
+        #   unwound in reverse, so the audit queue is drained before any indexes get cycled
+        yield
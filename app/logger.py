@@ -1,10 +1,98 @@
+import atexit
+import json
 import sys
+import threading
+from queue import SimpleQueue, Empty
+from typing import TextIO
 
 from loguru import logger
 
 from app.env import LOG_LEVEL, DEVELOPMENT, LOG_OUTPUT
 
-logger_args = {"level": LOG_LEVEL, "colorize": False, "serialize": False}
+
+def serialize_record(message) -> str:
+    """Serialize a log message the same way loguru does with `serialize=True`"""
+    record = message.record
+    exception = record["exception"]
+    if exception is not None:
+        exception = {
+            "type": None if exception.type is None else exception.type.__name__,
+            "value": exception.value,
+            "traceback": bool(exception.traceback),
+        }
+
+    serializable = {
+        "text": str(message),
+        "record": {
+            "elapsed": {"repr": record["elapsed"], "seconds": record["elapsed"].total_seconds()},
+            "exception": exception,
+            "extra": record["extra"],
+            "file": {"name": record["file"].name, "path": record["file"].path},
+            "function": record["function"],
+            "level": {"icon": record["level"].icon, "name": record["level"].name, "no": record["level"].no},
+            "line": record["line"],
+            "message": record["message"],
+            "module": record["module"],
+            "name": record["name"],
+            "process": {"id": record["process"].id, "name": record["process"].name},
+            "thread": {"id": record["thread"].id, "name": record["thread"].name},
+            "time": {"repr": record["time"], "timestamp": record["time"].timestamp()},
+        },
+    }
+    return json.dumps(serializable, default=str, ensure_ascii=False) + "\n"
+
+
+class QueuedSink:
+    """A loguru sink that hands messages off to a background thread to be written, so logging never makes the event
+    loop wait on the output stream (eg: a pipe to a log shipper that's fallen behind). When logging JSON, messages are
+    serialized on that thread too. Messages still waiting to be written are flushed out when the process exits
+
+    Unlike loguru's own `enqueue=True`, messages are passed through an in-process queue, so they aren't pickled
+
+    :arg stream: Where messages are written to
+    :arg serialize: Write messages as JSON, in the same shape as loguru's `serialize=True`
+    """
+
+    def __init__(self, stream: TextIO, serialize: bool = False):
+        self.stream = stream
+        self.serialize = serialize
+        self._queue = SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def __call__(self, message) -> None:
+        self._queue.put(message)
+
+    def _run(self) -> None:
+        while True:
+            # Write out everything that's waiting before flushing, rather than flushing every message
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+
+            for message in batch:
+                if message is None:
+                    self.stream.flush()
+                    return
+                try:
+                    self.stream.write(serialize_record(message) if self.serialize else message)
+                except Exception as e:
+                    sys.stderr.write(f"Failed to write log message: {e}\n")
+            self.stream.flush()
+
+    def stop(self) -> None:
+        """Write out everything still queued, and stop the thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+logger_args = {"level": LOG_LEVEL, "colorize": False}
+serialize = False
 
 if DEVELOPMENT:
     logger.warning("Running in dev mode!")
@@ -12,14 +100,14 @@ if DEVELOPMENT:
 
 if LOG_OUTPUT.lower() == "json":
     logger.info("Using JSON logging (colored output is disabled)")
-    logger_args["serialize"] = True
+    serialize = True
     logger_args["colorize"] = False
 
 logger.remove(0)
 
 # Set the default value of our extra request_id
 logger.configure(extra={"request_id": "00000000-0000-0000-0000-000000000000"})
-logger.add(sys.stdout, **logger_args)
+logger.add(QueuedSink(sys.stdout, serialize=serialize), **logger_args)
 
 
 def get_logger() -> logger:
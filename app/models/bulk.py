@@ -0,0 +1,22 @@
+from typing import List, Optional, Any
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class ImportItemResult(BaseModel):
+    """The outcome of importing a single item. `index` is the position of the item in the request"""
+
+    index: int
+    status: str
+    id: Optional[UUID] = None
+    error: Optional[Any] = None
+
+
+class ImportReport(BaseModel):
+    """Summary of a bulk import, along with the outcome of every item"""
+
+    total: int
+    created: int
+    failed: int
+    items: List[ImportItemResult] = []
@@ -1,9 +1,13 @@
-from typing import Optional, Annotated, List
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from typing import Optional, Annotated, Iterable, List, Literal, Any, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
+from app.lib.exceptions import ClientError
 from app.models.audit import Audit
-from app.models.tag import Tag, TagHistory
+from app.models.tag import Tag, TagHistory, TagSummary
 
 
 class FilteringArgs(BaseModel):
@@ -15,14 +19,89 @@ class SortingArgs(BaseModel):
     sort_order: Optional[Annotated[str, "The direction to sort by, defaulting to descending"]] = "desc"
 
 
+class TimeRangeArgs(BaseModel):
+    since: Optional[Annotated[datetime, "Only return records created at or after this ISO formatted timestamp"]] = None
+    until: Optional[Annotated[datetime, "Only return records created at or before this ISO formatted timestamp"]] = None
+
+    def query(self, field: str = "created") -> dict | None:
+        """A range query on the supplied field for the time range, or None if there are no bounds"""
+        bounds = {}
+        if self.since is not None:
+            bounds["gte"] = self.since.isoformat()
+        if self.until is not None:
+            bounds["lte"] = self.until.isoformat()
+        # Timestamps are stored with a fixed format, but may be supplied in any ISO format
+        return {"range": {field: bounds | {"format": "strict_date_optional_time"}}} if bounds else None
+
+
+class FieldArgs(BaseModel):
+    fields: Optional[
+        Annotated[
+            str,
+            "Comma separated names of the only fields to return (eg: name,type,groups,updated). Prefix a field with - "
+            "to return everything but it instead (eg: -patterns,-references)",
+        ]
+    ] = None
+
+    def split(self, allowed: Iterable[str], always: Iterable[str] = ()) -> Tuple[List[str] | None, List[str] | None]:
+        """Split the fields into those to include and those to exclude, as None when there aren't any. Fields that are
+        always returned anyway can be asked for, but aren't included in either
+        :arg allowed: The names of the fields that can be asked for
+        :arg always: The names of the fields that are always returned"""
+        if not self.fields:
+            return None, None
+
+        includes, excludes, only_always = [], [], False
+        for field in [field.strip() for field in self.fields.split(",") if field.strip()]:
+            name = field.removeprefix("-")
+            if name in always:
+                only_always = only_always or not field.startswith("-")
+                continue
+            if name not in allowed:
+                raise ClientError(f"Unknown field [{name}]. Fields are: {', '.join(sorted(allowed))}")
+            (excludes if field.startswith("-") else includes).append(name)
+
+        # Asking only for fields that are always returned still means nothing else should be
+        if not includes and not excludes:
+            return ([] if only_always else None), None
+        return includes or None, excludes or None
+
+
 class PaginationArgs(BaseModel):
     limit: Optional[Annotated[int, "The maximum number of records to return per page"]] = 10
     offset: Optional[Annotated[int, "The index in the array of results at which to start reading"]] = 0
+    cursor: Optional[
+        Annotated[
+            str,
+            "Page with a cursor instead of an offset, for walking deep into large result sets. Pass an empty value to "
+            "start, then follow the next/previous links",
+        ]
+    ] = None
+
+
+class PageCursor(BaseModel):
+    """The opaque cursor handed out for cursor based pagination. It's the point in time (PIT) the results are being
+    read from, the sort values of the hit to continue from, and the direction being read in"""
+
+    pit: str
+    after: List[Any]
+    direction: Literal["next", "previous"] = "next"
+
+    @property
+    def encoded_string(self) -> str:
+        return urlsafe_b64encode(self.model_dump_json().encode()).decode("ascii")
+
+    @classmethod
+    def decode(cls, cursor_str: str) -> "PageCursor":
+        try:
+            return cls(**json.loads(urlsafe_b64decode(cursor_str.encode("ascii"))))
+        except (ValueError, TypeError, ValidationError):
+            raise ClientError("Invalid cursor provided. Decoding failed.")
 
 
 class PaginationLinkObject(BaseModel):
     first: str
-    last: str
+    last: Optional[str] = ""
     next: Optional[str] = ""
     previous: Optional[str] = ""
 
@@ -33,13 +112,17 @@ class PaginatedModelBase(BaseModel):
     limit: int
     offset: int
     total: int
-    # links: PaginationLinkObject
+    links: Optional[PaginationLinkObject] = None
 
 
 class PaginatedTagList(PaginatedModelBase):
     items: List[Tag] = []
 
 
+class PaginatedTagSummaryList(PaginatedModelBase):
+    items: List[TagSummary] = []
+
+
 class PaginatedTagHistoryList(PaginatedModelBase):
     items: List[TagHistory] = []
 
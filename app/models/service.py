@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List
 
 
@@ -9,15 +9,21 @@ class ReturnModel:
 
     :arg data: The data to return, either a dict, or list of dicts that represent complete ES docs
     :arg audit_message: Optional. The message consumed by the @audit decorator when it's used
+    :arg write_errors: Optional. Secondary writes (history, audit) that failed when the unit of work was committed
     :arg total: Optional. The total number of items in the index, only used for listing methods
     :arg limit: Optional. The limit used in the query, only used for listing methods
     :arg offset: Optional. The offset used in the query, only used for listing methods
+    :arg next_cursor: Optional. The cursor for the next page, only used for cursor paginated listings
+    :arg previous_cursor: Optional. The cursor for the previous page, only used for cursor paginated listings
     """
 
     data: dict | List[dict] = None
     audit_message: str = None
+    write_errors: List[dict] = field(default_factory=list)
 
     # Specific to paginated (listing) methods
     total: int = 0
     limit: int = 0
     offset: int = 0
+    next_cursor: str = None
+    previous_cursor: str = None
@@ -1,10 +1,11 @@
 import hashlib
 import json
 from datetime import datetime
-from typing import List, Optional, Annotated
+from functools import cached_property
+from typing import Any, Dict, List, Literal, Optional, Annotated, Union
 from uuid import UUID
 
-from pydantic import BaseModel, computed_field, Field
+from pydantic import BaseModel, computed_field, Field, model_serializer, model_validator
 
 from app.lib.constants import TagTypes
 from app.models.fields import (
@@ -38,7 +39,27 @@ PatternEnd = Annotated[
 ]
 
 
-class Reference(BaseModel):
+class DeterministicIDModel(BaseModel):
+    """Base for models whose ID is derived from their content. The ID is computed at most once per instance, and since
+    it's persisted along with the rest of the model, models loaded from a stored doc take the ID from the doc instead
+    of recomputing it (see `rehydrate_ids`). IDs supplied in user input are always ignored"""
+
+    def rehydrate_id(self, data: dict) -> None:
+        """Take the ID from the stored doc this instance was loaded from"""
+        if data.get("id"):
+            # Seed the cached_property below, so it never needs to compute the ID
+            self.__dict__["id"] = data["id"]
+
+    def compute_id(self) -> str:
+        raise NotImplementedError("Please Implement this method")
+
+    @computed_field(return_type=str)
+    @cached_property
+    def id(self):
+        return self.compute_id()
+
+
+class Reference(DeterministicIDModel):
     """Model representing one reference. Tags can have N references"""
 
     name: str
@@ -46,29 +67,25 @@ class Reference(BaseModel):
     description: str
     source: str
 
-    @computed_field(return_type=str)
-    @property
-    def id(self):
+    def compute_id(self) -> str:
         """The deterministic ID is computed as the sha1 of the URL. This is the only input for generation as everything
         else is human editable"""
         return hashlib.sha1(self.link.encode()).hexdigest()
 
 
-class PatternClause(BaseModel):
+class PatternClause(DeterministicIDModel):
     """Model representing any one Clause for a given Tag pattern (patterns are comprised of N clauses)"""
 
     field: TagPatternField
     operator: TagPatternOperator
     value: TagPatternValue
 
-    @computed_field(return_type=str)
-    @property
-    def id(self):
+    def compute_id(self) -> str:
         """The deterministic ID is the sha1 of the field, operator, and value"""
         return hashlib.sha1(f"{self.field}{self.operator}{self.value}".encode()).hexdigest()
 
 
-class Pattern(BaseModel):
+class Pattern(DeterministicIDModel):
     """Model representing any one pattern of a Tag, Tags have N patterns"""
 
     start: PatternStart = None
@@ -76,9 +93,7 @@ class Pattern(BaseModel):
     operator: str
     clauses: List[PatternClause]
 
-    @computed_field(return_type=str)
-    @property
-    def id(self):
+    def compute_id(self) -> str:
         # Sort the clauses in this pattern in a deterministic way before hashing it. This ensures that the
         # order of the clauses in the pattern doesn't matter as far as the deterministic ID is concerned
         sorted_data = sorted(self.clauses, key=lambda i: (i.field, i.operator, i.value))
@@ -96,6 +111,14 @@ class Create(BaseModel):
     visibility: TagVisibility
 
 
+class Import(Create):
+    """Model used to describe a tag being imported in bulk. Unlike when creating a single tag, patterns and references
+    can be supplied up front"""
+
+    patterns: Optional[List[Pattern]] = []
+    references: Optional[List[Reference]] = []
+
+
 class Update(Create):
     """Same as the Create model, but all fields are optional"""
 
@@ -106,6 +129,50 @@ class Update(Create):
     visibility: Optional[TagVisibility] = ""
 
 
+class ItemOp(BaseModel):
+    """One change to a list field of a tag. Adds take a `value`, updates take the `id` of the item to change and a
+    `value` to change it to, and removes take just the `id`"""
+
+    op: Literal["add", "update", "remove"]
+    id: Optional[str] = None
+    # What the item is added or changed to. Each list field narrows this to the model of its items
+    value: Optional[Any] = None
+
+    @model_validator(mode="after")
+    def check_arguments(self):
+        if self.op != "add" and not self.id:
+            raise ValueError(f"An id is required to {self.op} an item")
+        if self.op != "remove" and self.value is None:
+            raise ValueError(f"A value is required to {self.op} an item")
+        return self
+
+
+class PatternOp(ItemOp):
+    path: Literal["patterns"]
+    value: Optional[Pattern] = None
+
+
+class ReferenceOp(ItemOp):
+    path: Literal["references"]
+    value: Optional[Reference] = None
+
+
+# One of a batch of changes to the patterns and references of a tag, in the spirit of a JSON Patch operation
+TagItemOp = Annotated[Union[PatternOp, ReferenceOp], Field(discriminator="path")]
+
+
+def rehydrate_ids(tag: BaseModel, data: dict) -> None:
+    """Take the IDs of every reference, pattern, and clause of a tag from the stored doc it was loaded from. Done in one
+    pass once the tag is validated, rather than by a validator on each of those models, which pydantic would have to
+    call back into Python for on every one of them"""
+    for reference, stored in zip(getattr(tag, "references", None) or [], data.get("references") or []):
+        reference.rehydrate_id(stored)
+    for pattern, stored in zip(getattr(tag, "patterns", None) or [], data.get("patterns") or []):
+        pattern.rehydrate_id(stored)
+        for clause, stored_clause in zip(pattern.clauses, stored.get("clauses") or []):
+            clause.rehydrate_id(stored_clause)
+
+
 class TagBase(Create):
     id: UUID
     created: datetime
@@ -127,15 +194,172 @@ class Tag(TagBase):
             doc = doc.data
 
         sequence = DocumentSequence(seq_no=doc["_seq_no"], primary_term=doc["_primary_term"])
-        super().__init__(
-            **doc["_source"],
-            sequence=sequence,
-            id=doc["_id"],
-            version=doc["_version"],
+
+        # Tags are only ever built from docs we've stored, so pattern, clause, and reference IDs are loaded rather
+        #   than recomputed
+        self.__pydantic_validator__.validate_python(
+            doc["_source"] | {"sequence": sequence, "id": doc["_id"], "version": doc["_version"]},
+            self_instance=self,
         )
+        rehydrate_ids(self, doc["_source"])
 
     sequence: DocumentSequence
 
 
 class TagHistory(TagBase):
-    pass
+
+    @classmethod
+    def from_source(cls, source: dict) -> "TagHistory":
+        """Load a historical version of a tag from the doc stored in the history index"""
+        instance = cls.model_validate(source)
+        rehydrate_ids(instance, source)
+        return instance
+
+
+class FieldChange(BaseModel):
+    """A field whose value differs between two versions"""
+
+    old: Any = None
+    new: Any = None
+
+
+def field_changes(old: BaseModel, new: BaseModel, exclude: set) -> Dict[str, FieldChange]:
+    """The fields that differ between two instances of the same model, compared as they're serialized"""
+    before = old.model_dump(mode="json", exclude=exclude)
+    after = new.model_dump(mode="json", exclude=exclude)
+    return {
+        field: FieldChange(old=before.get(field), new=after.get(field))
+        for field in sorted(before.keys() | after.keys())
+        if before.get(field) != after.get(field)
+    }
+
+
+class ClauseChanges(BaseModel):
+    """The clauses of a pattern that were added or removed, by ID"""
+
+    added: List[PatternClause] = []
+    removed: List[PatternClause] = []
+
+
+class ItemChange(BaseModel):
+    """A pattern or reference that's in both versions under the same ID, but isn't quite the same (eg: a pattern with a
+    new start bound, or a reference with a new description)"""
+
+    id: str
+    fields: Dict[str, FieldChange] = {}
+
+
+class PatternChange(ItemChange):
+    clauses: ClauseChanges = ClauseChanges()
+
+
+class PatternChanges(BaseModel):
+    added: List[Pattern] = []
+    removed: List[Pattern] = []
+    changed: List[PatternChange] = []
+
+
+class ReferenceChanges(BaseModel):
+    added: List[Reference] = []
+    removed: List[Reference] = []
+    changed: List[ItemChange] = []
+
+
+def item_changes(old: List[DeterministicIDModel], new: List[DeterministicIDModel]) -> dict:
+    """The items (patterns, references) added, removed, and changed between two versions, matched up by their IDs.
+    Changing what a pattern matches on or where a reference links to changes its ID, so shows as one removed and
+    another added"""
+    old_by_id = {item.id: item for item in old}
+    new_by_id = {item.id: item for item in new}
+
+    changed = []
+    for item in new:
+        before = old_by_id.get(item.id)
+        if before is None:
+            continue
+        fields = field_changes(before, item, exclude={"id", "clauses"})
+        if isinstance(item, Pattern):
+            before_clauses = {clause.id for clause in before.clauses}
+            after_clauses = {clause.id for clause in item.clauses}
+            clauses = ClauseChanges(
+                added=[clause for clause in item.clauses if clause.id not in before_clauses],
+                removed=[clause for clause in before.clauses if clause.id not in after_clauses],
+            )
+            if fields or clauses.added or clauses.removed:
+                changed.append(PatternChange(id=item.id, fields=fields, clauses=clauses))
+        elif fields:
+            changed.append(ItemChange(id=item.id, fields=fields))
+
+    return {
+        "added": [item for item in new if item.id not in old_by_id],
+        "removed": [item for item in old if item.id not in new_by_id],
+        "changed": changed,
+    }
+
+
+class TagDiff(BaseModel):
+    """What changed between two versions of a tag. Only what differs is included: top level fields with their old and
+    new values, and the patterns and references that were added, removed, or changed"""
+
+    id: UUID
+    from_version: int
+    to_version: int
+    fields: Dict[str, FieldChange] = {}
+    patterns: PatternChanges = PatternChanges()
+    references: ReferenceChanges = ReferenceChanges()
+
+    @classmethod
+    def between(cls, old: TagHistory, new: TagHistory) -> "TagDiff":
+        return cls(
+            id=new.id,
+            from_version=old.version,
+            to_version=new.version,
+            fields=field_changes(old, new, exclude={"id", "version", "patterns", "references"}),
+            patterns=PatternChanges(**item_changes(old.patterns or [], new.patterns or [])),
+            references=ReferenceChanges(**item_changes(old.references or [], new.references or [])),
+        )
+
+
+class TagSummary(BaseModel):
+    """Some of the fields of a Tag, for when only those were asked for (eg: a catalog listing that only shows names and
+    types). The ID, sequence, and version are always included, along with whichever fields were read from the doc.
+    Fields that weren't are left out of the response entirely, rather than being sent back empty"""
+
+    id: UUID
+    sequence: DocumentSequence
+    version: int
+    name: Optional[TagName] = None
+    description: Optional[TagDescription] = None
+    groups: Optional[List[TagGroup]] = None
+    type: Optional[TagTypes] = None
+    visibility: Optional[TagVisibility] = None
+    created: Optional[datetime] = None
+    author: Optional[str] = None
+    updated: Optional[datetime] = None
+    editor: Optional[str] = None
+    deleted: Optional[datetime] = None
+    related: Optional[List[str]] = None
+    state: Optional[str] = None
+    references: Optional[List[Reference]] = None
+    patterns: Optional[List[Pattern]] = None
+
+    @classmethod
+    def from_doc(cls, doc: ReturnModel | dict) -> "TagSummary":
+        """Load the summary from a doc read with only some of its fields"""
+        if isinstance(doc, ReturnModel):
+            doc = doc.data
+
+        source = doc.get("_source", {})
+        sequence = DocumentSequence(seq_no=doc["_seq_no"], primary_term=doc["_primary_term"])
+        instance = cls.model_validate(source | {"sequence": sequence, "id": doc["_id"], "version": doc["_version"]})
+        rehydrate_ids(instance, source)
+        return instance
+
+    @model_serializer(mode="wrap")
+    def only_fields_read(self, handler):
+        return {key: value for key, value in handler(self).items() if key in self.model_fields_set}
+
+
+# The fields of a Tag that can be picked out of its doc (see `TagSummary`), and those that are always there anyway
+TAG_SOURCE_FIELDS = frozenset(TagSummary.model_fields) - {"id", "sequence", "version"}
+TAG_META_FIELDS = frozenset({"id", "sequence", "version"})
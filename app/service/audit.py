@@ -1,17 +1,19 @@
 from datetime import datetime
 from uuid import UUID
 
+from app.lib.audit_writer import AuditWriter
 from app.logger import logger
-from app.service.base import BaseService
+from app.service.base import BaseService, current_unit_of_work
 
 
 class AuditService(BaseService):
 
     _index_name = "tags-audit"
+    _rollover = True
 
-    def __init__(self, user, client):
+    def __init__(self, client, writer: AuditWriter = None):
         super().__init__(client)
-        self.user = user
+        self.writer = writer
 
         # This is a work-around, since audit log creation is a decorator
         self.audit_service = self
@@ -27,7 +29,9 @@ class AuditService(BaseService):
         tag_id: UUID = None,
         version: int = None,
     ) -> None:
-        """Create a new Audit entry
+        """Create a new Audit entry. If a running writer was supplied, the entry is queued and written in the background
+        along with others, once the unit of work it's part of (if any) is committed. Otherwise, within a unit of work
+        the entry is staged and goes out with the rest of the unit's writes, and failing that it's indexed immediately
         :arg action: Action to perform
         :arg component: The component the action is being performed on (tag, tag history, audit, comment, etc)
         :arg user: The user that's performing this action
@@ -49,7 +53,14 @@ class AuditService(BaseService):
             "version": version,
         }
         logger.debug("Adding new Audit entry", **body)
-        await self._index(body=body)
+        uow = current_unit_of_work.get()
+        if self.writer is not None and self.writer.running:
+            if uow is not None:
+                uow.defer(lambda: self.writer.submit(self.index_name_write, body))
+            else:
+                await self.writer.submit(self.index_name_write, body)
+        else:
+            await self._stage(body)
 
     async def metrics(self, bucket_size=100) -> dict:
         """Agg our audit logs"""
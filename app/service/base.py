@@ -1,20 +1,154 @@
+import copy
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, List
 
 import opensearchpy
 from opensearchpy import AsyncOpenSearch
 
-from app.env import OPENSEARCH_INDEX_PREFIX
-from app.lib.exceptions import IntegrityError, ServerError, NotFound
-from app.models.pagination import PaginationArgs, FilteringArgs, SortingArgs
+from app.env import (
+    OPENSEARCH_INDEX_PREFIX,
+    OPENSEARCH_REFRESH_POLICIES,
+    LISTING_TOTAL_HITS_LIMIT,
+    CURSOR_KEEP_ALIVE,
+    EXPORT_BATCH_SIZE,
+)
+from app.lib.cache import LRUCache
+from app.lib.context import current_user
+from app.lib.exceptions import IntegrityError, ServerError, NotFound, ClientError
+from app.lib.prometheus import secondary_write_duration, secondary_write_docs
+from app.models.pagination import PaginationArgs, FilteringArgs, SortingArgs, PageCursor, TimeRangeArgs
 from app.models.sequence import DocumentSequence
+from app.logger import logger
 from app.models.service import ReturnModel
+from app.models.user import User
+
+# The unit of work (if any) that writes made by any service in the current task should be staged into
+current_unit_of_work: ContextVar["UnitOfWork | None"] = ContextVar("current_unit_of_work", default=None)
+
+# Valid refresh policies for writes, weakest to strongest
+REFRESH_POLICIES = ("false", "wait_for", "true")
+
+# Appended to the sort of cursor paginated listings, so that every hit has a unique position to continue from
+CURSOR_TIEBREAKER = {"_id": "asc"}
+
+# Indexes that roll over are picked for a time range by when they were created, which is by the cluster's clock rather
+#   than ours. Allow for that much of a difference between the two
+ROLLOVER_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def reverse_sort(sort: List[dict]) -> List[dict]:
+    """Flip the direction of every field in a sort clause"""
+    flipped = {"asc": "desc", "desc": "asc"}
+    return [{field: flipped.get(str(order).lower(), order) for field, order in clause.items()} for clause in sort]
+
+
+class UnitOfWork:
+    """Collects up secondary writes (history snapshots, audit entries, etc) that go along with a primary write, so that
+    they can all be sent to OpenSearch in a single bulk call once the primary write has succeeded. Writes that are made
+    some other way (eg: audit entries handed to the background audit writer) can be deferred until then too
+
+    :arg client: The client used to send the bulk request
+    """
+
+    def __init__(self, client: AsyncOpenSearch):
+        self.client = client
+        self.actions: List[tuple] = []
+        self.errors: List[dict] = []
+        self.refresh = "false"
+        self.deferred: List[Callable[[], Awaitable[None]]] = []
+
+    def add(
+        self,
+        index: str,
+        body: dict,
+        refresh: str = "false",
+        doc_id: str = None,
+        on_written: Callable[[], None] = None,
+    ) -> None:
+        """Stage a doc to be indexed into the supplied index when this unit of work is committed. As there's only one
+        bulk call, it's made with the strongest refresh policy of everything staged
+        :arg doc_id: Optional. The ID to index the doc with, otherwise OpenSearch picks one
+        :arg on_written: Optional. Called once the doc has been written, if it is"""
+        self.actions.append((index, body, doc_id, on_written))
+        if REFRESH_POLICIES.index(refresh) > REFRESH_POLICIES.index(self.refresh):
+            self.refresh = refresh
+
+    def defer(self, write: Callable[[], Awaitable[None]]) -> None:
+        """Make a write once this unit of work is committed, rather than right away. As with staged docs, it's never
+        made if the block the unit of work covers raises"""
+        self.deferred.append(write)
+
+    async def commit(self) -> List[dict]:
+        """Send all staged docs in one bulk call, then make any deferred writes. Returns (and records) the items that
+        failed to be written, each with the index it was destined for, the ID it was staged with (if any), the status,
+        and the error returned
+        """
+        try:
+            return await self._write()
+        finally:
+            deferred, self.deferred = self.deferred, []
+            for write in deferred:
+                await write()
+
+    async def _write(self) -> List[dict]:
+        if not self.actions:
+            return self.errors
+
+        body = []
+        for index, doc, doc_id, _ in self.actions:
+            body.append({"index": {"_index": index, "_id": doc_id} if doc_id else {"_index": index}})
+            body.append(doc)
+
+        start = time.perf_counter()
+        try:
+            res = await self.client.bulk(body=body, refresh=self.refresh)
+
+        except opensearchpy.exceptions.TransportError as e:
+            logger.error(f"Bulk write of {len(self.actions)} staged docs failed: {e}")
+            self.errors = [
+                {"index": index, "id": doc_id, "status": e.status_code, "error": str(e)}
+                for index, _, doc_id, _ in self.actions
+            ]
+            secondary_write_docs.inc("unit_of_work", "failed", amount=len(self.actions))
+            return self.errors
+
+        finally:
+            secondary_write_duration.observe(time.perf_counter() - start, "unit_of_work")
+
+        for (index, _, doc_id, on_written), item in zip(self.actions, res.get("items", [])):
+            result = item.get("index", {})
+            if result.get("error"):
+                self.errors.append(
+                    {"index": index, "id": doc_id, "status": result.get("status"), "error": result["error"]}
+                )
+            elif on_written is not None:
+                on_written()
+
+        if self.errors:
+            logger.error(f"{len(self.errors)} of {len(self.actions)} staged docs failed to write", errors=self.errors)
+
+        secondary_write_docs.inc("unit_of_work", "written", amount=len(self.actions) - len(self.errors))
+        if self.errors:
+            secondary_write_docs.inc("unit_of_work", "failed", amount=len(self.errors))
+        self.actions = []
+        return self.errors
 
 
 class AbstractBaseService(ABC):
 
     _index_name: str
 
+    # The refresh policy used for writes to this index, one of REFRESH_POLICIES. Overridable via the environment
+    _refresh_policy: str = "false"
+
+    # Whether this index is a series of indexes that roll over to a new one as they grow (see Manager), written to
+    #   through one alias and read from through another
+    _rollover: bool = False
+
     @abstractmethod
     def __init__(self):
         raise NotImplementedError("Please Implement this method")
@@ -32,36 +166,102 @@ class AbstractBaseService(ABC):
 
 class BaseService(AbstractBaseService):
 
-    def __init__(self, client: AsyncOpenSearch):
+    def __init__(self, client: AsyncOpenSearch, cache: LRUCache = None):
+        """:arg cache: Optional. Cache of whole docs by ID that `get` reads through, kept current by `_index`"""
         self.client = client
+        self.cache = cache
+
+        # The indexes behind the read alias, and when each was created, for picking those to read for a time range. New
+        #   indexes only appear when one rolls over, so this is only read from the cluster once a minute
+        self.rollover_indexes = LRUCache(max_size=1, ttl=60)
+
+    @property
+    def user(self) -> User:
+        """The user the current request is being made by. Services are shared between requests, so this comes from the
+        request context rather than being set on the service"""
+        user = current_user.get()
+        if user is None:
+            raise ServerError("User object missing from request")
+        return user
 
     @property
     def index_name_write(self) -> str:
-        """In the event that there's enough data here to warrant time stamped index names, can update that here
-        Note that if we migrate to chronological index names, we will need to update routes on CRUD calls to get the
-        'created' value for a given tag. Alternatively, this could just be blindly added into the sequence
+        """For indexes that roll over, this is the alias of the one index currently being written to. Realtime GETs
+        through it only see that index, not those that have rolled over
+        Note that if we migrate tags to chronological index names, we will need to update routes on CRUD calls to get
+        the 'created' value for a given tag. Alternatively, this could just be blindly added into the sequence
         """
+        if self._rollover:
+            return f"{OPENSEARCH_INDEX_PREFIX}{self._index_name}-write"
         return f"{OPENSEARCH_INDEX_PREFIX}{self._index_name}"
 
     @property
     def index_name_read(self) -> str:
-        """Even if we have timestamped indexes, this should be the alias name since that's where reads come from
-        Note that if we migrate to chronological index names, we will need to update routes on CRUD calls to get the
-        'created' value for a given tag. Alternatively, this could just be blindly added into the sequence
+        """For indexes that roll over, this is the alias over all of them (including any written before they rolled
+        over), since that's where reads come from
+        Note that if we migrate tags to chronological index names, we will need to update routes on CRUD calls to get
+        the 'created' value for a given tag. Alternatively, this could just be blindly added into the sequence
         """
+        if self._rollover:
+            return f"{OPENSEARCH_INDEX_PREFIX}{self._index_name}-read"
         return f"{OPENSEARCH_INDEX_PREFIX}{self._index_name}"
 
+    async def _indexes_for(self, time_range: TimeRangeArgs) -> str:
+        """The indexes to read docs created within the time range from. A doc is written to the index current at the
+        time, after it was created, so an index that rolled over before the start of the range can't hold any docs in
+        it, and is skipped (eg: reading the last day of the audit log only touches the newest index or two). The end of
+        the range can't be used the same way, as docs can be written well after they were created (eg: audit entries
+        replayed from a spill file). Without a start, or on indexes that don't roll over, this is the read alias"""
+        if not self._rollover or time_range.since is None:
+            return self.index_name_read
+
+        indexes = self.rollover_indexes.get(self.index_name_read)
+        if indexes is None:
+            settings = await self.client.indices.get_settings(index=self.index_name_read, name="index.creation_date")
+            indexes = sorted(
+                (int(value["settings"]["index"]["creation_date"]), name) for name, value in settings.items()
+            )
+            self.rollover_indexes.put(self.index_name_read, indexes)
+
+        since = time_range.since
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        since_ms = (since - ROLLOVER_CLOCK_SKEW).timestamp() * 1000
+
+        # An index is needed if the next one was created after the start of the range. The newest is always needed, and
+        #   so is the one being written to, in case there's been a rollover since the list of indexes was read
+        picked = [name for (_, name), (created, _) in zip(indexes, indexes[1:]) if created >= since_ms]
+        picked += [name for _, name in indexes[-1:]] + [self.index_name_write]
+        return ",".join(picked)
+
+    @property
+    def refresh_policy(self) -> str:
+        """The refresh policy writes to this index are made with. Nothing we write needs a forced refresh to be read
+        back, as the write response (and realtime GETs) already give us the latest version of a doc. This only decides
+        how soon a write becomes visible to searches"""
+        policy = OPENSEARCH_REFRESH_POLICIES.get(self._index_name, self._refresh_policy)
+        if policy not in REFRESH_POLICIES:
+            raise ServerError(f"Invalid refresh policy [{policy}] configured for {self._index_name}")
+        return policy
+
     @staticmethod
     def generate_listing_query(
         pagination: PaginationArgs = PaginationArgs(),
         filtering: FilteringArgs = FilteringArgs(),
         sorting: SortingArgs = SortingArgs(),
         extra_filter: dict | None = None,
+        fields: List[str] = None,
+        exclude_fields: List[str] = None,
+        time_range: TimeRangeArgs = TimeRangeArgs(),
     ):
-        """Generates the lucene query we can use for listed endpoints"""
+        """Generates the lucene query we can use for listed endpoints. The total number of matching docs is tracked
+        by the search itself, so listings don't need a separate count. If fields to include or exclude are supplied,
+        only those parts of each doc are read (an empty list of fields to include reads none of the doc). If a time
+        range is supplied, only docs created within it are listed"""
         # Begin creating our Query
         body = {
             "version": True,  # Include the doc version
+            "track_total_hits": LISTING_TOTAL_HITS_LIMIT if LISTING_TOTAL_HITS_LIMIT > 0 else True,
             "from": pagination.offset,
             "size": pagination.limit,
             "sort": [{f"{sorting.sort_by}": sorting.sort_order}],
@@ -76,25 +276,111 @@ class BaseService(AbstractBaseService):
         if extra_filter is not None:
             body["query"]["bool"]["must"].append(extra_filter)
 
+        # The time range doesn't affect how well docs match, so it's a filter (which OpenSearch can cache)
+        range_query = time_range.query()
+        if range_query is not None:
+            body["query"]["bool"]["filter"] = [range_query]
+
+        # Only read the parts of the docs that are needed, which for large docs is most of the cost of a listing
+        if fields == []:
+            body["_source"] = False
+        elif fields is not None or exclude_fields is not None:
+            body["_source"] = {"includes": fields or [], "excludes": exclude_fields or []}
+
         return body
 
     async def _index(self, body, doc_id=None, sequence: DocumentSequence = None) -> dict:
-        """Preform an index of a document (add or overwrite optionally [upsert])"""
-        res = await self.client.index(
-            index=self.index_name_write,
-            body=body,
-            id=doc_id if doc_id else None,
-            refresh=True,
-            if_primary_term=sequence.primary_term if sequence is not None else None,
-            if_seq_no=sequence.seq_no if sequence is not None else None,
-        )
+        """Preform an index of a document (add or overwrite optionally [upsert]). The returned doc is built from the
+        index response and the body we sent, so it's always the version just written regardless of refresh policy"""
+        try:
+            res = await self.client.index(
+                index=self.index_name_write,
+                body=body,
+                id=doc_id if doc_id else None,
+                refresh=self.refresh_policy,
+                if_primary_term=sequence.primary_term if sequence is not None else None,
+                if_seq_no=sequence.seq_no if sequence is not None else None,
+            )
+
+        except opensearchpy.exceptions.ConflictError:
+            # Whatever we have cached for this doc is clearly out of date
+            if self.cache is not None and doc_id:
+                self.cache.invalidate(str(doc_id))
+            raise IntegrityError(
+                "Supplied sequence does not match existing. Please fetch first, and use the returned sequence and make "
+                "the call again"
+            )
 
         # Merge the two dicts
         faked_source = {"_source": body}
         this_doc = res | faked_source
 
+        if self.cache is not None and doc_id:
+            self.cache.put(str(doc_id), copy.deepcopy(this_doc))
+
         return this_doc
 
+    async def _update(self, doc_id, script: str, params: dict, sequence: DocumentSequence) -> dict:
+        """Change a doc in place with a painless script (see `app.service.scripts`), so only the change is sent over the
+        wire rather than the whole doc. The returned doc is the version just written, as with `_index`. If the script
+        decided there was nothing to change, the doc is returned as it is with a `result` of `noop`"""
+        try:
+            res = await self.client.update(
+                index=self.index_name_write,
+                id=doc_id,
+                body={"script": {"lang": "painless", "source": script, "params": params}},
+                refresh=self.refresh_policy,
+                if_primary_term=sequence.primary_term,
+                if_seq_no=sequence.seq_no,
+                _source=True,
+            )
+
+        except opensearchpy.exceptions.NotFoundError:
+            raise NotFound(f"No document found for {doc_id}")
+
+        except opensearchpy.exceptions.ConflictError:
+            # Whatever we have cached for this doc is clearly out of date
+            if self.cache is not None:
+                self.cache.invalidate(str(doc_id))
+            raise IntegrityError(
+                "Supplied sequence does not match existing. Please fetch first, and use the returned sequence and make "
+                "the call again"
+            )
+
+        # The doc comes back alongside the outcome of the update, rather than as the response itself
+        this_doc = {key: value for key, value in res.items() if key != "get"} | {"_source": res["get"]["_source"]}
+
+        if self.cache is not None and this_doc["result"] != "noop":
+            self.cache.put(str(doc_id), copy.deepcopy(this_doc))
+
+        return this_doc
+
+    async def _stage(self, body, doc_id=None, on_written: Callable[[], None] = None) -> None:
+        """Index a new doc as part of the current unit of work if there is one, otherwise index it right away
+        :arg doc_id: Optional. The ID to index the doc with, otherwise OpenSearch picks one
+        :arg on_written: Optional. Called once the doc has been written, which within a unit of work is only once it's
+            been committed (and not at all if the write failed)"""
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            uow.add(self.index_name_write, body, refresh=self.refresh_policy, doc_id=doc_id, on_written=on_written)
+        else:
+            await self._index(body=body, doc_id=doc_id)
+            if on_written is not None:
+                on_written()
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """Context manager that collects all staged writes made within it, and commits them in one bulk call on a
+        clean exit. If the block raises, nothing staged is written"""
+        uow = UnitOfWork(self.client)
+        token = current_unit_of_work.set(uow)
+        try:
+            yield uow
+        finally:
+            current_unit_of_work.reset(token)
+
+        await uow.commit()
+
     async def count(self, query: dict = None) -> int:
         """Perform a count, optionally taking filter params
         :arg query The query used to perform the count of docs against. If unset, will count everything"""
@@ -104,33 +390,77 @@ class BaseService(AbstractBaseService):
         )
         return result.get("count", 0)
 
+    @staticmethod
+    def _sequence_of(doc: dict) -> str:
+        return f"{doc['_seq_no']},{doc['_primary_term']}"
+
+    @staticmethod
+    def _pick_fields(doc: dict, fields: List[str] | None, exclude_fields: List[str] | None) -> dict:
+        """Pick top level fields out of a whole doc, as OpenSearch does with _source_includes and _source_excludes"""
+        source = {
+            key: value
+            for key, value in doc["_source"].items()
+            if (fields is None or key in fields) and not (exclude_fields and key in exclude_fields)
+        }
+        return doc | {"_source": source}
+
     async def get(
-        self, doc_id, sequence: DocumentSequence = None, fields: List[str] = None, allow_deleted: bool = False
+        self,
+        doc_id,
+        sequence: DocumentSequence = None,
+        fields: List[str] = None,
+        allow_deleted: bool = False,
+        exclude_fields: List[str] = None,
     ) -> ReturnModel:
-        """Get a single doc by ID. If a sequence is supplied, it will be tested to ensure matches the fetched doc
+        """Get a single doc by ID. If a sequence is supplied, it will be tested to ensure matches the fetched doc. If
+        fields to include or exclude are supplied, only those parts of the doc are returned
+
+        If this service has a cache, whole docs are served from it when present. A cached doc whose sequence doesn't
+        match the supplied one may just be stale, so in that case it's read from the cluster to be sure. A cached doc
+        that matches can be trusted, as any write made with that sequence is still checked by OpenSearch
         TODO: If we start using timestamped indexes for things, need to also pass the created date for this so we
             can calculate the index we need to query"""
 
-        try:
-            res = await self.client.get(
-                index=self.index_name_read,
-                id=doc_id,
-                _source_includes=fields if fields is not None else None,
-            )
-
-            if res["_source"].get("deleted"):
-                if not allow_deleted:
-                    raise NotFound(f"No document found for {doc_id}")
-
-        except opensearchpy.exceptions.NotFoundError:
-            raise NotFound(f"No document found for {doc_id}")
-
-        if sequence is not None and f"{res['_seq_no']},{res['_primary_term']}" != sequence.string:
+        # Whether the doc is deleted is always needed, even when it's not one of the fields asked for
+        includes = fields + ["deleted"] if fields is not None else None
+        excludes = ([field for field in exclude_fields if field != "deleted"] or None) if exclude_fields else None
+        filtered = includes is not None or excludes is not None
+
+        res = None
+        if self.cache is not None:
+            cached = self.cache.get(str(doc_id))
+            if cached is not None and (sequence is None or self._sequence_of(cached) == sequence.string):
+                # Callers are free to change what they get back, so never hand out what's in the cache
+                res = copy.deepcopy(self._pick_fields(cached, includes, excludes) if filtered else cached)
+
+        if res is None:
+            try:
+                res = await self.client.get(
+                    index=self.index_name_read,
+                    id=doc_id,
+                    _source_includes=includes,
+                    _source_excludes=excludes,
+                )
+
+            except opensearchpy.exceptions.NotFoundError:
+                raise NotFound(f"No document found for {doc_id}")
+
+            if self.cache is not None and not filtered:
+                self.cache.put(str(doc_id), copy.deepcopy(res))
+
+        if res.get("_source", {}).get("deleted"):
+            if not allow_deleted:
+                raise NotFound(f"No document found for {doc_id}")
+
+        if sequence is not None and self._sequence_of(res) != sequence.string:
             raise IntegrityError(
                 "Supplied sequence does not match existing. Please fetch first, and use the returned sequence and make "
                 "the call again"
             )
 
+        if (fields is not None and "deleted" not in fields) or (exclude_fields and "deleted" in exclude_fields):
+            res["_source"].pop("deleted", None)
+
         return ReturnModel(res)
 
     async def list(
@@ -139,12 +469,27 @@ class BaseService(AbstractBaseService):
         filtering: FilteringArgs = FilteringArgs(),
         sorting: SortingArgs = SortingArgs(),
         extra_filter: dict | None = None,
+        fields: List[str] = None,
+        exclude_fields: List[str] = None,
+        time_range: TimeRangeArgs = TimeRangeArgs(),
     ) -> ReturnModel:
-        """List all docs outlined by the query params passed in"""
+        """List all docs outlined by the query params passed in. If a cursor was supplied in the pagination args, the
+        listing is read from a point in time using search_after instead of from/size (see `_list_with_cursor`). If
+        fields to include or exclude are supplied, only those parts of each doc are returned. If a time range is
+        supplied, only docs created within it are listed, from only the indexes that can hold them"""
+
+        body = self.generate_listing_query(
+            pagination, filtering, sorting, extra_filter, fields, exclude_fields, time_range
+        )
+        index = await self._indexes_for(time_range)
+        if pagination.cursor is not None:
+            return await self._list_with_cursor(body, pagination, index)
 
-        body = self.generate_listing_query(pagination, filtering, sorting, extra_filter)
         try:
-            result = await self.client.search(body=body, index=self.index_name_read, seq_no_primary_term=True)
+            # An index picked for the time range may have since been deleted by its lifecycle policy
+            result = await self.client.search(
+                body=body, index=index, seq_no_primary_term=True, ignore_unavailable=index != self.index_name_read
+            )
 
         except opensearchpy.exceptions.RequestError as e:
             raise ServerError(str(e))
@@ -155,6 +500,125 @@ class BaseService(AbstractBaseService):
 
         return ReturnModel(
             result_list,
+            total=result.get("hits", {}).get("total", {}).get("value", 0),
             limit=pagination.limit,
             offset=pagination.offset,
         )
+
+    async def scan(
+        self,
+        filtering: FilteringArgs = FilteringArgs(),
+        sorting: SortingArgs = SortingArgs(sort_order="asc"),
+        extra_filter: dict | None = None,
+        batch_size: int = EXPORT_BATCH_SIZE,
+        time_range: TimeRangeArgs = TimeRangeArgs(),
+    ) -> AsyncIterator[dict]:
+        """Iterate over every doc matching the supplied filters. Docs are read from a point in time, one batch at a
+        time with search_after, so memory use stays flat no matter how large the index is. The PIT is closed once
+        iteration stops, whether it finished or not"""
+        body = self.generate_listing_query(
+            PaginationArgs(limit=batch_size), filtering, sorting, extra_filter, time_range=time_range
+        )
+        del body["from"]
+        body["sort"] = body["sort"] + [CURSOR_TIEBREAKER]
+        body["track_total_hits"] = False
+
+        pit = await self.client.create_pit(index=await self._indexes_for(time_range), keep_alive=CURSOR_KEEP_ALIVE)
+        pit_id = pit["pit_id"]
+        try:
+            while True:
+                body["pit"] = {"id": pit_id, "keep_alive": CURSOR_KEEP_ALIVE}
+                result = await self.client.search(body=body, seq_no_primary_term=True)
+                pit_id = result.get("pit_id", pit_id)
+
+                hits = result.get("hits", {}).get("hits", [])
+                for hit in hits:
+                    yield hit
+
+                if len(hits) < batch_size:
+                    break
+                body["search_after"] = hits[-1]["sort"]
+
+        finally:
+            await self._close_pit(pit_id)
+
+    async def _close_pit(self, pit_id: str) -> None:
+        """Close a point in time that's no longer needed. If that fails, it's left to expire on its own"""
+        try:
+            await self.client.delete_pit(body={"pit_id": [pit_id]})
+        except opensearchpy.exceptions.TransportError:
+            logger.warning("Failed to close point in time, it will expire on its own")
+
+    async def _list_with_cursor(self, body: dict, pagination: PaginationArgs, index: str) -> ReturnModel:
+        """Read a page of a listing from a point in time (PIT) with search_after, so that reading any page costs the
+        same no matter how deep into the results it is. An empty cursor reads the first page, and opens a new PIT if
+        there's more to read. We ask for one more hit than the page size to find out whether there's another page in the
+        direction of travel. Once a page has no cursor to either side, the PIT is closed
+        """
+        cursor = PageCursor.decode(pagination.cursor) if pagination.cursor else None
+        backwards = cursor is not None and cursor.direction == "previous"
+
+        del body["from"]
+        body["size"] = pagination.limit + 1
+        body["sort"] = body["sort"] + [CURSOR_TIEBREAKER]
+        if backwards:
+            body["sort"] = reverse_sort(body["sort"])
+
+        if cursor is None:
+            # The first page is read straight from the indexes, as most listings fit on one page, and those never need a
+            #   PIT (which holds on to resources in the cluster until it's closed or expires). One is only opened once
+            #   there's a next page to read from it
+            pit_id = None
+            try:
+                result = await self.client.search(
+                    body=body, index=index, seq_no_primary_term=True, ignore_unavailable=index != self.index_name_read
+                )
+            except opensearchpy.exceptions.RequestError as e:
+                raise ServerError(str(e))
+
+        else:
+            # Reads from a PIT can't target an index, it's already bound to the PIT
+            body["pit"] = {"id": cursor.pit, "keep_alive": CURSOR_KEEP_ALIVE}
+            body["search_after"] = cursor.after
+            try:
+                result = await self.client.search(body=body, seq_no_primary_term=True)
+
+            except opensearchpy.exceptions.NotFoundError:
+                raise ClientError("The supplied cursor has expired. Please start again from the first page")
+
+            except opensearchpy.exceptions.RequestError as e:
+                raise ClientError(f"The supplied cursor can not be used with this listing: {e}")
+
+            # The PIT ID can change between reads, so always hand out the latest
+            pit_id = result.get("pit_id", cursor.pit)
+
+        hits = result.get("hits", {}).get("hits", [])
+        has_more = len(hits) > pagination.limit
+        hits = hits[: pagination.limit]
+        if backwards:
+            hits.reverse()
+
+        has_next = hits and (has_more if not backwards else True)
+        has_previous = hits and (has_more if backwards else cursor is not None)
+
+        if has_next and pit_id is None:
+            pit = await self.client.create_pit(index=index, keep_alive=CURSOR_KEEP_ALIVE)
+            pit_id = pit["pit_id"]
+
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = PageCursor(pit=pit_id, after=hits[-1]["sort"], direction="next").encoded_string
+        if has_previous:
+            previous_cursor = PageCursor(pit=pit_id, after=hits[0]["sort"], direction="previous").encoded_string
+
+        # Nothing can be read from the PIT again once no cursor refers to it, so it's closed rather than left to expire
+        if pit_id is not None and not has_next and not has_previous:
+            await self._close_pit(pit_id)
+
+        return ReturnModel(
+            hits,
+            total=result.get("hits", {}).get("total", {}).get("value", 0),
+            limit=pagination.limit,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
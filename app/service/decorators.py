@@ -4,6 +4,22 @@ from app.logger import logger
 from app.models.service import ReturnModel
 
 
+def unit_of_work(wrapped):
+    """Decorator that should wrap our other decorators on mutating service methods. The history and audit writes made
+    by them are staged rather than written one by one, and once the wrapped method has succeeded, they're all sent to
+    OpenSearch in a single bulk call. Any of those writes that failed are set on the returned object's `write_errors`"""
+
+    @wraps(wrapped)
+    async def inner(self, *args, **kwargs) -> ReturnModel:
+        async with self.unit_of_work() as uow:
+            ret: ReturnModel = await wrapped(self, *args, **kwargs)
+
+        ret.write_errors = uow.errors
+        return ret
+
+    return inner
+
+
 def add_to_history(wrapped):
     """Decorator we use to decorate our Tag methods. So long as a tag method returns the complete JSON response from
     ES for any one given tag (the successfully updated object), this decorator will then use it and add it to the
@@ -1,26 +1,107 @@
 from fastapi import Request
 
+from app.env import (
+    METRICS_REFRESH_INTERVAL,
+    METRICS_CACHE_TTL,
+    TAG_CACHE_SIZE,
+    TAG_CACHE_TTL,
+    HISTORY_SNAPSHOT_CACHE_SIZE,
+    HISTORY_DIFF_CACHE_SIZE,
+)
+from app.lib.audit_writer import audit_writer
+from app.lib.cache import RefreshingCache, LRUCache
 from app.lib.exceptions import ServerError
 from app.lib.opensearch import client
+from app.lib.prometheus import registry, CallbackCounter, CallbackGauge
 from app.service.audit import AuditService
 from app.service.tag import TagService
 from app.service.tag_history import TagHistoryService
 
+# Recently read and written Tags, shared by every request
+tag_cache = LRUCache(max_size=TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL)
+
+# Snapshots of Tags in the history index. They never change once written, so are cached for as long as there's room
+history_snapshot_cache = LRUCache(max_size=HISTORY_SNAPSHOT_CACHE_SIZE, ttl=float("inf"))
+
+# Diffs between versions of Tags, which never change either
+history_diff_cache = LRUCache(max_size=HISTORY_DIFF_CACHE_SIZE, ttl=float("inf"))
+
+# Services hold no per-request state (the user a call is made on behalf of comes from the request context), so one of
+#   each is built up front, and shared by every request
+tag_history_service = TagHistoryService(client, history_snapshot_cache, diffs=history_diff_cache)
+audit_service = AuditService(client, audit_writer)
+tag_service = TagService(client, tag_history_service, audit_service, tag_cache)
+
 
 def get_tag_service(request: Request) -> TagService:
     """Dependable to get an instance of the Tag service"""
     if not getattr(request.state, "user", False):
         raise ServerError("User object missing from request")
-    return TagService(request.state.user, client, TagHistoryService(client), AuditService(request.state.user, client))
+    return tag_service
 
 
 def get_tag_history_service(request: Request) -> TagHistoryService:
     """Dependable to get an instance of the Tag service"""
-    return TagHistoryService(client)
+    return tag_history_service
 
 
 def get_audit_service(request: Request) -> AuditService:
     """Dependable to get an instance of the Tag service"""
     if not getattr(request.state, "user", False):
         raise ServerError("User object missing from request")
-    return AuditService(request.state.user, client)
+    return audit_service
+
+
+# Aggregating the catalog metrics is expensive, so they're served from a cache that's refreshed in the background
+tag_metrics_cache = RefreshingCache(
+    "tag metrics",
+    tag_service.metrics,
+    refresh_interval=METRICS_REFRESH_INTERVAL,
+    ttl=METRICS_CACHE_TTL,
+)
+
+
+def get_tag_metrics_cache() -> RefreshingCache:
+    """Dependable to get the cache of Tag metrics"""
+    return tag_metrics_cache
+
+
+# Expose how well the caches are doing
+caches = {
+    "tags": tag_cache,
+    "tag_metrics": tag_metrics_cache,
+    "history_snapshots": history_snapshot_cache,
+    "history_diffs": history_diff_cache,
+}
+registry.register(
+    CallbackCounter(
+        "egregore_cache_hits_total",
+        "Reads served from a cache",
+        lambda: {(name,): cache.hits for name, cache in caches.items()},
+        labels=("cache",),
+    )
+)
+registry.register(
+    CallbackCounter(
+        "egregore_cache_misses_total",
+        "Reads that a cache couldn't serve",
+        lambda: {(name,): cache.misses for name, cache in caches.items()},
+        labels=("cache",),
+    )
+)
+registry.register(
+    CallbackGauge(
+        "egregore_cache_hit_ratio",
+        "Share of all reads from a cache (since startup) that it served",
+        lambda: {(name,): cache.hits / max(cache.hits + cache.misses, 1) for name, cache in caches.items()},
+        labels=("cache",),
+    )
+)
+registry.register(
+    CallbackGauge(
+        "egregore_cache_entries",
+        "Entries currently held by the tag cache",
+        lambda: {("tags",): len(tag_cache)},
+        labels=("cache",),
+    )
+)
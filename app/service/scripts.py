@@ -0,0 +1,41 @@
+"""Painless scripts used to change one item of a list field of a doc (eg: one pattern of a tag) in place with `_update`,
+rather than reading the whole doc, changing it, and indexing it all again. The source of each script never changes, only
+its params, so OpenSearch compiles each of them once and caches it
+
+Every script takes the same params
+- field: The name of the list field to change (eg: patterns)
+- meta: Top level fields to set on the doc along with the change (eg: who made it, and when)
+- id: The ID of the item to replace or remove
+- item: The item to add, or replace the existing one with
+
+If there's nothing to change (the item doesn't exist, or the doc is deleted), the script does nothing (the update's
+result is `noop`), and no new version of the doc is written
+"""
+
+# Nothing may be changed on a deleted doc
+_SKIP_DELETED = "if (ctx._source.deleted != null) { ctx.op = 'none'; return; }"
+
+APPEND_ITEM = (
+    f"{_SKIP_DELETED}"
+    " if (ctx._source[params.field] == null) { ctx._source[params.field] = []; }"
+    " ctx._source[params.field].add(params.item);"
+    " ctx._source.putAll(params.meta);"
+)
+
+REPLACE_ITEM = (
+    f"{_SKIP_DELETED}"
+    " def items = ctx._source[params.field];"
+    " if (items == null) { ctx.op = 'none'; return; }"
+    " for (item in items) {"
+    " if (item.id == params.id) { item.putAll(params.item); ctx._source.putAll(params.meta); return; }"
+    " }"
+    " ctx.op = 'none';"
+)
+
+REMOVE_ITEM = (
+    f"{_SKIP_DELETED}"
+    " def items = ctx._source[params.field];"
+    " String id = params.id;"
+    " if (items == null || !items.removeIf(item -> item.id == id)) { ctx.op = 'none'; return; }"
+    " ctx._source.putAll(params.meta);"
+)
@@ -1,24 +1,43 @@
+import asyncio
+from collections import Counter
 from datetime import datetime
+from typing import AsyncIterator, List
 from uuid import UUID, uuid4
 
-from app.lib.exceptions import NotFound
+import opensearchpy
+
+from app.env import IMPORT_CHUNK_SIZE, IMPORT_CONCURRENCY
+from app.lib.cache import LRUCache
+from app.lib.exceptions import ClientError, NotFound
 from app.logger import logger
 from app.models.pagination import SortingArgs, FilteringArgs, PaginationArgs
 from app.models.sequence import DocumentSequence
 from app.models.service import ReturnModel
 from app.service.audit import AuditService
 from app.service.base import BaseService
-from app.service.decorators import audit, add_to_history
-from app.service.tag_history import TagHistoryService
+from app.service.decorators import audit, add_to_history, unit_of_work
+from app.service.scripts import APPEND_ITEM, REMOVE_ITEM, REPLACE_ITEM
+from app.service.tag_history import TagHistoryService, history_doc_id
+
+# How each change made by `TagService.apply_item_ops` is described in the audit log
+PAST_TENSE = {"add": "added", "update": "updated", "remove": "removed"}
 
 
 class TagService(BaseService):
 
     _index_name = "tags-latest"
 
-    def __init__(self, user, client, history_service: TagHistoryService, audit_service: AuditService):
-        super().__init__(client)
-        self.user = user
+    # Tag listings are what users look at right after making an edit, so writes here wait until they're searchable
+    _refresh_policy = "wait_for"
+
+    def __init__(
+        self,
+        client,
+        history_service: TagHistoryService,
+        audit_service: AuditService,
+        cache: LRUCache = None,
+    ):
+        super().__init__(client, cache)
         self.history_service = history_service
         self.audit_service = audit_service
 
@@ -36,6 +55,28 @@ class TagService(BaseService):
         tag.data["_source"] = self._update_meta(tag.data["_source"])
         return tag
 
+    async def _change_item(
+        self,
+        tag_id: UUID,
+        sequence: DocumentSequence,
+        script: str,
+        field: str,
+        item_id: str = None,
+        item: dict = None,
+    ) -> dict:
+        """Change one item of a list field of a tag (eg: add, replace, or remove a pattern) in place, updating all of
+        the metadata fields along the way. Only the change is sent to OpenSearch, not the whole tag"""
+        meta = self._update_meta({})
+        params = {"field": field, "meta": meta, "id": item_id, "item": item}
+        ret = await self._update(tag_id, script, params, sequence)
+
+        if ret["result"] == "noop":
+            if ret["_source"].get("deleted"):
+                raise NotFound(f"No document found for {tag_id}")
+            raise NotFound(f"No {field.removesuffix('s')} found with the supplied ID")
+
+        return ret
+
     async def count(self, include_deleted: bool = False) -> int:
         """Counts all tags, by default excluding those that are deleted
         :arg include_deleted if True, include deleted tags in the count"""
@@ -44,63 +85,51 @@ class TagService(BaseService):
             query = {"query": {"bool": {"must_not": {"exists": {"field": "deleted"}}}}}
         return await super(TagService, self).count(query)
 
-    async def count_patterns(self) -> dict:
-        """Perform a count of all patterns in the Tags index (just sum the total number of patterns across all tags)
-        TODO: This is inefficient. Ensure this is cached
+    async def metrics(self) -> dict:
+        """Gather up counts of tags (deleted and not), and of all patterns and clauses across all tags, along with how
+        many of those are unique. This is all done in a single search. The nested aggregations still aren't cheap, so
+        callers should cache the result
         """
-        agg = await self.client.search(
+        not_deleted = {"bool": {"must_not": {"exists": {"field": "deleted"}}}}
+        res = await self.client.search(
             index=self.index_name_read,
             body={
                 "_source": False,
                 "size": 0,
-                "query": {"nested": {"path": "patterns", "query": {"match_all": {}}}},
+                "track_total_hits": True,
                 "aggregations": {
+                    "deleted": {"filter": {"exists": {"field": "deleted"}}},
+                    "not_deleted": {"filter": not_deleted},
                     "nested_patterns_count": {
                         "nested": {"path": "patterns"},
                         "aggregations": {"unique_patterns": {"cardinality": {"field": "patterns.id"}}},
-                    }
-                },
-            },
-        )
-
-        return {
-            "patterns": {
-                "count": agg.get("aggregations", {}).get("nested_patterns_count", {}).get("doc_count", 0),
-                "unique": agg.get("aggregations", {})
-                .get("nested_patterns_count", {})
-                .get("unique_patterns", {})
-                .get("value", 0),
-            }
-        }
-
-    async def count_clauses(self) -> dict:
-        """
-        TODO: This is inefficient. Ensure this is cached
-        :return:
-        """
-        agg = await self.client.search(
-            index=self.index_name_read,
-            body={
-                "_source": False,
-                "size": 0,
-                "query": {"nested": {"path": "patterns.clauses", "query": {"match_all": {}}}},
-                "aggregations": {
+                    },
                     "nested_clauses_count": {
                         "nested": {"path": "patterns.clauses"},
-                        "aggregations": {"clauses_count": {"cardinality": {"field": "patterns.clauses.id"}}},
-                    }
+                        "aggregations": {"unique_clauses": {"cardinality": {"field": "patterns.clauses.id"}}},
+                    },
                 },
             },
         )
 
+        aggs = res.get("aggregations", {})
+        patterns = aggs.get("nested_patterns_count", {})
+        clauses = aggs.get("nested_clauses_count", {})
         return {
             "clauses": {
-                "count": agg.get("aggregations", {}).get("nested_clauses_count", {}).get("doc_count", 0),
-                "unique": agg.get("aggregations", {})
-                .get("nested_clauses_count", {})
-                .get("clauses_count", {})
-                .get("value", 0),
-            }
+                "count": clauses.get("doc_count", 0),
+                "unique": clauses.get("unique_clauses", {}).get("value", 0),
+            },
+            "patterns": {
+                "count": patterns.get("doc_count", 0),
+                "unique": patterns.get("unique_patterns", {}).get("value", 0),
+            },
+            "tags": {
+                "count": res.get("hits", {}).get("total", {}).get("value", 0),
+                "active": aggs.get("not_deleted", {}).get("doc_count", 0),
+                "deleted": aggs.get("deleted", {}).get("doc_count", 0),
+                "published": "TODO",
+            },
         }
 
     async def list(
@@ -109,18 +138,34 @@ class TagService(BaseService):
         filtering: FilteringArgs = FilteringArgs(),
         sorting: SortingArgs = SortingArgs(),
         include_deleted: bool = True,
+        fields: List[str] = None,
+        exclude_fields: List[str] = None,
     ) -> ReturnModel:
-        """Perform a tag listing"""
+        """Perform a tag listing, optionally of only some of the fields of each tag"""
 
         extra_filter = None
         if not include_deleted:
             extra_filter = {"bool": {"must_not": {"exists": {"field": "deleted"}}}}
 
-        total_count: int = await self.count(include_deleted=include_deleted)
-        results = await super(TagService, self).list(pagination, filtering, sorting, extra_filter=extra_filter)
+        return await super(TagService, self).list(
+            pagination, filtering, sorting, extra_filter=extra_filter, fields=fields, exclude_fields=exclude_fields
+        )
+
+    def scan(
+        self,
+        filtering: FilteringArgs = FilteringArgs(),
+        sorting: SortingArgs = SortingArgs(sort_order="asc"),
+        include_deleted: bool = True,
+    ) -> AsyncIterator[dict]:
+        """Iterate over every tag"""
+
+        extra_filter = None
+        if not include_deleted:
+            extra_filter = {"bool": {"must_not": {"exists": {"field": "deleted"}}}}
 
-        return ReturnModel(results.data, total=total_count, limit=results.limit, offset=results.offset)
+        return super(TagService, self).scan(filtering, sorting, extra_filter=extra_filter)
 
+    @unit_of_work
     @audit("read", "tag")
     @add_to_history
     async def create(self, tag_data: dict) -> ReturnModel:
@@ -134,48 +179,99 @@ class TagService(BaseService):
 
         return ReturnModel(new_tag, audit_message="Creating new Tag")
 
+    async def bulk_create(self, tags: List[dict]) -> List[dict]:
+        """Create many tags at once. Tags are written in chunks through the bulk API, with a bounded number of chunks in
+        flight at any one time. Each created tag gets its history and audit entries, written in one bulk call per chunk
+        :arg tags: The (already validated) bodies of the tags to create
+        :return: The outcome for each tag in the order supplied, with its new `id`, a `status`, and any `error`. A tag
+            whose history failed to write is still created, with the failed writes in its `error`
+        """
+        semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+        async def create_chunk(chunk: List[dict]) -> List[dict]:
+            async with semaphore:
+                return await self._bulk_create_chunk(chunk)
+
+        chunks = [tags[i : i + IMPORT_CHUNK_SIZE] for i in range(0, len(tags), IMPORT_CHUNK_SIZE)]
+        results = await asyncio.gather(*[create_chunk(chunk) for chunk in chunks])
+        return [result for chunk in results for result in chunk]
+
+    async def _bulk_create_chunk(self, tags: List[dict]) -> List[dict]:
+        body = []
+        new_ids = []
+        for tag_data in tags:
+            new_id = uuid4()
+            new_ids.append(new_id)
+            tag_data = self._update_meta(tag_data)
+            tag_data["author"] = self.user.username
+            tag_data["created"] = tag_data["updated"]
+            body.append({"create": {"_index": self.index_name_write, "_id": str(new_id)}})
+            body.append(tag_data)
+
+        logger.info(f"Creating {len(tags)} Tags in bulk")
+        try:
+            res = await self.client.bulk(body=body, refresh=self.refresh_policy)
+
+        except opensearchpy.exceptions.TransportError as e:
+            logger.error(f"Bulk creation of {len(tags)} Tags failed: {e}")
+            return [{"id": None, "status": "error", "error": str(e)} for _ in tags]
+
+        results = []
+        # The created tags by the ID of their history doc, so any of those that fail to write can be reported on them
+        by_history_id = {}
+        async with self.unit_of_work() as uow:
+            for new_id, tag_data, item in zip(new_ids, tags, res.get("items", [])):
+                result = item.get("create", {})
+                if result.get("error"):
+                    results.append({"id": None, "status": "error", "error": result["error"]})
+                    continue
+
+                results.append({"id": new_id, "status": "created", "error": None})
+                by_history_id[history_doc_id(new_id, result["_version"])] = results[-1]
+                created = {"_id": str(new_id), "_version": result["_version"], "_source": tag_data}
+                await self.history_service.add(ReturnModel(created))
+                await self.audit_service.add(
+                    action="create",
+                    component="tag",
+                    message=f"Imported Tag [{tag_data['name']}]",
+                    user=self.user.username,
+                    tag_id=new_id,
+                    version=result["_version"],
+                )
+
+        # Those tags were still created, just without their history, so they're reported as created along with what
+        #   failed. Audit entries are left to the audit writer, which spills any it can't write to be replayed later
+        for error in uow.errors:
+            created = by_history_id.get(error["id"])
+            if created is not None:
+                created["error"] = created["error"] or {"write_errors": []}
+                created["error"]["write_errors"].append(error)
+
+        return results
+
+    @unit_of_work
     @audit("update", "tag", subcomponent="references", subcomponent_action="create")
     @add_to_history
     async def create_reference(self, tag_id: UUID, sequence: DocumentSequence, payload: dict) -> ReturnModel:
         """Create a new reference for the supplied tag"""
-        existing = await self._get_tag_for_editing(tag_id, sequence)
-        existing = existing.data["_source"]
-
         logger.info("Creating new reference for Tag", tag_id=tag_id)
-
-        # Since tags may not have a references field at all yet, we need to ensure it exists
-        existing["references"] = existing.get("references", [])
-
-        # Create a payload we pass off to our update call that contains only the top level field
-        existing["references"].append(payload)
-
-        ret = await self._index(doc_id=tag_id, body=existing, sequence=sequence)
+        ret = await self._change_item(tag_id, sequence, APPEND_ITEM, "references", item=payload)
         return ReturnModel(
             ret, audit_message=f"Tag [{tag_id}] had {list(payload.keys())} modified by [{self.user.username}]"
         )
 
+    @unit_of_work
     @audit("update", "tag", subcomponent="patterns", subcomponent_action="create")
     @add_to_history
     async def create_pattern(self, tag_id: UUID, sequence: DocumentSequence, payload: dict) -> ReturnModel:
         """Create a new pattern for the supplied tag"""
-        existing = await self._get_tag_for_editing(tag_id, sequence)
-        existing = existing.data["_source"]
-
         logger.info("Creating new pattern for Tag", tag_id=tag_id)
-
-        # Since tags may not have a patterns field at all yet, we need to ensure it exists
-        existing["patterns"] = existing.get("patterns", [])
-
-        # Create a payload we pass off to our update call that contains only the top level field
-        existing["patterns"].append(payload)
-
-        ret = await self._index(doc_id=tag_id, body=existing, sequence=sequence)
-        ret["_audit_message"] = "whatever"
-
+        ret = await self._change_item(tag_id, sequence, APPEND_ITEM, "patterns", item=payload)
         return ReturnModel(
             ret, audit_message=f"Tag [{tag_id}] had {list(payload.keys())} modified by [{self.user.username}]"
         )
 
+    @unit_of_work
     @audit("update", "tag")
     @add_to_history
     async def update(self, tag_id: UUID, sequence: DocumentSequence, payload: dict) -> ReturnModel:
@@ -189,31 +285,69 @@ class TagService(BaseService):
             ret, audit_message=f"Tag [{tag_id}] had {list(payload.keys())} modified by [{self.user.username}]"
         )
 
+    @unit_of_work
     @audit("update", "tag", subcomponent="references", subcomponent_action="update")
     @add_to_history
     async def update_reference(
         self, tag_id: UUID, sequence: DocumentSequence, reference_id: str, payload: dict
     ) -> ReturnModel:
+        logger.info("Updating reference of Tag", tag_id=tag_id, reference_id=reference_id)
+        ret = await self._change_item(tag_id, sequence, REPLACE_ITEM, "references", item_id=reference_id, item=payload)
+        return ReturnModel(
+            ret, audit_message=f"Tag [{tag_id}] had reference {reference_id} modified by [{self.user.username}]"
+        )
+
+    @unit_of_work
+    @audit("update", "tag", subcomponent="patterns", subcomponent_action="update")
+    @add_to_history
+    async def update_pattern(
+        self, tag_id: UUID, sequence: DocumentSequence, pattern_id: str, payload: dict
+    ) -> ReturnModel:
+        logger.info("Updating pattern of Tag", tag_id=tag_id, pattern_id=pattern_id)
+        ret = await self._change_item(tag_id, sequence, REPLACE_ITEM, "patterns", item_id=pattern_id, item=payload)
+        return ReturnModel(
+            ret, audit_message=f"Tag [{tag_id}] had pattern {pattern_id} modified by [{self.user.username}]"
+        )
+
+    @unit_of_work
+    @audit("update", "tag", subcomponent="patterns", subcomponent_action="batch")
+    @add_to_history
+    async def apply_item_ops(self, tag_id: UUID, sequence: DocumentSequence, ops: List[dict]) -> ReturnModel:
+        """Apply a batch of changes to the patterns and references of a tag, in order, as a single edit. The tag is
+        written once, so the whole batch gets one sequence check, one history version, and one audit entry. If any
+        change can't be made, none of them are
+        :arg ops: The changes, each with an `op` (add, update, remove), a `path` (patterns, references), and the `id`
+            and/or `value` the op needs"""
+        if not ops:
+            raise ClientError("No changes were supplied")
+
+        logger.info(f"Applying {len(ops)} changes to Tag", tag_id=tag_id)
         tag = await self._get_tag_for_editing(tag_id, sequence=sequence)
         tag = tag.data["_source"]
 
-        if not tag["references"]:
-            raise NotFound("No references found for the supplied Tag")
-
-        # Find the reference by ID
-        for ref in tag["references"]:
-            if ref["id"] == reference_id:
-                ref.update(payload)
-                break
-        else:
-            raise NotFound("No reference found with the supplied ID")
+        done = Counter()
+        for position, op in enumerate(ops):
+            field = op["path"]
+            items = tag.get(field) or []
+            if op["op"] == "add":
+                items.append(op["value"])
+            else:
+                index = next((i for i, item in enumerate(items) if item.get("id") == op["id"]), None)
+                if index is None:
+                    raise NotFound(f"Change {position}: No {field.removesuffix('s')} found with the ID [{op['id']}]")
+                if op["op"] == "update":
+                    items[index].update(op["value"])
+                else:
+                    del items[index]
+
+            tag[field] = items
+            done[f"{field} {PAST_TENSE[op['op']]}"] += 1
 
         ret = await self._index(doc_id=tag_id, body=tag, sequence=sequence)
+        summary = ", ".join(f"{count} {change}" for change, count in done.items())
+        return ReturnModel(ret, audit_message=f"Tag [{tag_id}] had {summary} by [{self.user.username}]")
 
-        return ReturnModel(
-            ret, audit_message=f"Tag [{tag_id}] had reference {reference_id} modified by [{self.user.username}]"
-        )
-
+    @unit_of_work
     @audit("delete", "tag")
     @add_to_history
     async def delete(self, tag_id: UUID, sequence: DocumentSequence) -> ReturnModel:
@@ -227,21 +361,18 @@ class TagService(BaseService):
         deleted = await self._index(doc_id=tag_id, body=tag, sequence=sequence)
         return ReturnModel(deleted, audit_message=f"Tag [{tag['name']}] deleted")
 
+    @unit_of_work
     @audit("update", "tag", subcomponent="references", subcomponent_action="delete")
     @add_to_history
     async def delete_reference(self, tag_id: UUID, sequence: DocumentSequence, reference_id: str) -> ReturnModel:
-        tag = await self._get_tag_for_editing(tag_id, sequence=sequence)
-        tag = tag.data["_source"]
-
-        if not tag["references"]:
-            raise NotFound("No references found for the supplied Tag")
-
-        # Remove the reference by ID
-        new_references = [ref for ref in tag["references"] if ref["id"] != reference_id]
-        if len(new_references) == len(tag["references"]):
-            raise NotFound("No reference found with the supplied ID")
-
-        tag["references"] = new_references
-        ret = await self._index(doc_id=tag_id, body=tag, sequence=sequence)
-
+        logger.info("Deleting reference of Tag", tag_id=tag_id, reference_id=reference_id)
+        ret = await self._change_item(tag_id, sequence, REMOVE_ITEM, "references", item_id=reference_id)
         return ReturnModel(ret, audit_message=f"Tag [{tag_id}] had reference {reference_id} deleted")
+
+    @unit_of_work
+    @audit("update", "tag", subcomponent="patterns", subcomponent_action="delete")
+    @add_to_history
+    async def delete_pattern(self, tag_id: UUID, sequence: DocumentSequence, pattern_id: str) -> ReturnModel:
+        logger.info("Deleting pattern of Tag", tag_id=tag_id, pattern_id=pattern_id)
+        ret = await self._change_item(tag_id, sequence, REMOVE_ITEM, "patterns", item_id=pattern_id)
+        return ReturnModel(ret, audit_message=f"Tag [{tag_id}] had pattern {pattern_id} deleted")
@@ -1,19 +1,250 @@
+import json
+from difflib import SequenceMatcher
+from typing import AsyncIterator, Dict, List, Tuple
+from uuid import UUID
+
+import opensearchpy
+
+from app.env import HISTORY_SNAPSHOT_INTERVAL, EXPORT_BATCH_SIZE
+from app.lib.cache import LRUCache
+from app.lib.exceptions import NotFound, ServerError
 from app.logger import logger
+from app.models.pagination import FilteringArgs
 from app.models.service import ReturnModel
+from app.models.tag import TagDiff, TagHistory
 from app.service.base import BaseService
 
+# The fields of a tag that can grow large. Versions stored against a snapshot only keep the changes made to these since
+#   the snapshot, everything else is kept whole so it can still be searched and sorted on
+DELTA_FIELDS = ("patterns", "references")
+
+
+def history_doc_id(tag_id, version: int) -> str:
+    """The ID of the history doc of a version of a tag"""
+    return f"{tag_id}-{version}"
+
+
+def snapshot_version_of(version: int, interval: int) -> int:
+    """The version of the snapshot that the supplied version of a tag is stored against. Versions 1, 1 + interval,
+    1 + 2 * interval, etc. are themselves snapshots"""
+    return version - (version - 1) % interval
+
+
+def diff_items(base: List[dict], items: List[dict]) -> List[list]:
+    """The changes that turn one list of items into another, as [start, end, items] replacements of slices of the first
+    list. Items are compared whole, so an item that changed is replaced"""
+    matcher = SequenceMatcher(
+        None,
+        [json.dumps(item, sort_keys=True) for item in base],
+        [json.dumps(item, sort_keys=True) for item in items],
+        autojunk=False,
+    )
+    return [[i1, i2, items[j1:j2]] for op, i1, i2, j1, j2 in matcher.get_opcodes() if op != "equal"]
+
+
+def patch_items(base: List[dict], changes: List[list]) -> List[dict]:
+    """Apply changes from `diff_items` to the list they were worked out against"""
+    items = list(base)
+    # The last slices first, so the positions of those before them still hold
+    for start, end, replacement in reversed(changes):
+        items[start:end] = replacement
+    return items
+
+
+def encode_version(snapshot: dict, source: dict, snapshot_version: int) -> dict:
+    """Store a version of a tag as the changes to its large fields since the supplied snapshot"""
+    doc = {key: value for key, value in source.items() if key not in DELTA_FIELDS}
+    doc["snapshot_version"] = snapshot_version
+    doc["changes"] = {
+        field: diff_items(snapshot.get(field) or [], source[field]) if source[field] is not None else None
+        for field in DELTA_FIELDS
+        if field in source
+    }
+    return doc
+
+
+def decode_version(snapshot: dict, doc: dict) -> dict:
+    """Rebuild the whole of a version of a tag stored with `encode_version`, from the same snapshot"""
+    source = {key: value for key, value in doc.items() if key not in ("snapshot_version", "changes")}
+    for field, changes in doc["changes"].items():
+        source[field] = patch_items(snapshot.get(field) or [], changes) if changes is not None else None
+    return source
+
 
 class TagHistoryService(BaseService):
+    """Every version of every tag. A whole copy (snapshot) of a tag is kept every `snapshot_interval` versions, and the
+    versions in between are kept as the changes since their snapshot (see `encode_version`), which is a small fraction
+    of the size for tags with lots of patterns. Reads rebuild whole versions from those (see `expand`)
+
+    :arg snapshots: Optional. Cache of snapshots by history doc ID. New versions are worked out against their snapshot,
+        so this saves reading it back for every one of them
+    :arg diffs: Optional. Cache of diffs between versions of a tag (see `diff`). Versions never change once written, so
+        neither do the diffs between them
+    """
 
     _index_name = "tags-history"
+    _rollover = True
+
+    def __init__(
+        self,
+        client,
+        snapshots: LRUCache = None,
+        snapshot_interval: int = HISTORY_SNAPSHOT_INTERVAL,
+        diffs: LRUCache = None,
+    ):
+        super().__init__(client)
+        self.snapshots = snapshots
+        self.snapshot_interval = snapshot_interval
+        self.diffs = diffs
+
+    def _remember(self, doc_id: str, snapshot: dict) -> None:
+        if self.snapshots is not None:
+            self.snapshots.put(doc_id, snapshot)
+
+    async def _read(self, versions: List[Tuple[str, int]]) -> List[dict]:
+        """Read the history docs of the supplied (tag ID, version) pairs, leaving out any that don't exist. They're read
+        by ID in realtime from the index being written to, which holds all of the recent versions. Those that aren't
+        there (they're in an index that has since rolled over, or were stored before history docs had IDs of their
+        own) are searched for"""
+        try:
+            res = await self.client.mget(
+                index=self.index_name_write, body={"ids": [history_doc_id(*version) for version in versions]}
+            )
+            hits = [doc for doc in res.get("docs", []) if doc.get("found")]
+        except opensearchpy.exceptions.NotFoundError:
+            hits = []
+
+        found = {(hit["_source"]["id"], hit["_source"]["version"]) for hit in hits}
+        missing = [(str(tag_id), version) for tag_id, version in versions if (str(tag_id), version) not in found]
+        if missing:
+            should = [
+                {"bool": {"filter": [{"term": {"id": tag_id}}, {"term": {"version": version}}]}}
+                for tag_id, version in missing
+            ]
+            res = await self.client.search(
+                index=self.index_name_read, body={"query": {"bool": {"should": should}}, "size": len(missing)}
+            )
+            hits += res.get("hits", {}).get("hits", [])
+        return hits
+
+    async def _get_snapshot(self, tag_id, version: int) -> dict | None:
+        """Get the snapshot of the supplied version of a tag, or None if there isn't one"""
+        doc_id = history_doc_id(tag_id, version)
+        snapshot = self.snapshots.get(doc_id) if self.snapshots is not None else None
+        if snapshot is not None:
+            return snapshot
+
+        hits = await self._read([(tag_id, version)])
+        if not hits or "changes" in hits[0]["_source"]:
+            return None
+        self._remember(doc_id, hits[0]["_source"])
+        return hits[0]["_source"]
 
     async def add(self, ret: ReturnModel) -> None:
-        """Add the supplied doc to the history index
+        """Add the supplied doc to the history index, either as a snapshot, or as the changes since its snapshot. If the
+        snapshot it should be stored against can't be found (eg: its write failed), it becomes a snapshot itself. When
+        called within a unit of work, the write is staged and goes out with the rest of the unit's writes
         :arg ret The whole doc body returned from an index operation (including the _ fields)
         """
-        history_body = ret.data["_source"].copy()  # Need to copy this as this is a mutable object
+        # A copy of the doc, exactly as it will be stored (and read back), so it can be compared with other versions
+        history_body = json.loads(self.client.transport.serializer.dumps(ret.data["_source"]))
         history_body["version"] = ret.data["_version"]
         history_body["id"] = ret.data["_id"]
+        doc_id = history_doc_id(history_body["id"], history_body["version"])
+
+        snapshot_version = snapshot_version_of(history_body["version"], self.snapshot_interval)
+        snapshot = None
+        if snapshot_version != history_body["version"]:
+            snapshot = await self._get_snapshot(history_body["id"], snapshot_version)
+
+        if snapshot is None:
+            logger.debug(
+                "Adding snapshot of Tag to history", tag_id=history_body["id"], version=history_body["version"]
+            )
+            await self._stage(history_body, doc_id, on_written=lambda: self._remember(doc_id, history_body))
+        else:
+            logger.debug("Adding changes to Tag to history", tag_id=history_body["id"], version=history_body["version"])
+            await self._stage(encode_version(snapshot, history_body, snapshot_version), doc_id)
+
+    async def expand(self, hits: List[dict]) -> List[dict]:
+        """The whole of each of the supplied history docs (as read from the index), rebuilding those stored as changes
+        from their snapshots. Snapshots that aren't among the docs are read in one go"""
+        snapshots = {}
+        for hit in hits:
+            if "changes" not in hit["_source"]:
+                snapshots[history_doc_id(hit["_source"]["id"], hit["_source"]["version"])] = hit["_source"]
+
+        missing = {}
+        for hit in hits:
+            if "changes" in hit["_source"]:
+                version = (hit["_source"]["id"], hit["_source"]["snapshot_version"])
+                doc_id = history_doc_id(*version)
+                if doc_id not in snapshots and doc_id not in missing:
+                    cached = self.snapshots.get(doc_id) if self.snapshots is not None else None
+                    if cached is not None:
+                        snapshots[doc_id] = cached
+                    else:
+                        missing[doc_id] = version
+
+        if missing:
+            for hit in await self._read(list(missing.values())):
+                doc_id = history_doc_id(hit["_source"]["id"], hit["_source"]["version"])
+                snapshots[doc_id] = hit["_source"]
+                self._remember(doc_id, hit["_source"])
+
+        sources = []
+        for hit in hits:
+            source = hit["_source"]
+            if "changes" not in source:
+                sources.append(source)
+                continue
+
+            snapshot = snapshots.get(history_doc_id(source["id"], source["snapshot_version"]))
+            if snapshot is None:
+                raise ServerError(
+                    f"Version {source['version']} of Tag [{source['id']}] can't be rebuilt, as the snapshot it was "
+                    f"stored against (version {source['snapshot_version']}) is missing"
+                )
+            sources.append(decode_version(snapshot, source))
+
+        return sources
+
+    async def get_versions(self, tag_id: UUID, versions: List[int]) -> Dict[int, dict]:
+        """The whole of the supplied versions of a tag, by version. Versions that don't exist are left out"""
+        hits = await self._read([(tag_id, version) for version in versions])
+
+        return {source["version"]: source for source in await self.expand(hits)}
+
+    async def diff(self, tag_id: UUID, from_version: int, to_version: int) -> TagDiff:
+        """What changed between two versions of a tag (see `TagDiff`). Only those two versions are read"""
+        key = (str(tag_id), from_version, to_version)
+        cached = self.diffs.get(key) if self.diffs is not None else None
+        if cached is not None:
+            return cached
+
+        sources = await self.get_versions(tag_id, list(dict.fromkeys([from_version, to_version])))
+        for version in (from_version, to_version):
+            if version not in sources:
+                raise NotFound(f"No version {version} found for Tag [{tag_id}]")
+
+        diff = TagDiff.between(
+            TagHistory.from_source(sources[from_version]), TagHistory.from_source(sources[to_version])
+        )
+        if self.diffs is not None:
+            self.diffs.put(key, diff)
+        return diff
+
+    async def scan_versions(
+        self, filtering: FilteringArgs = FilteringArgs(), batch_size: int = EXPORT_BATCH_SIZE
+    ) -> AsyncIterator[dict]:
+        """Iterate over the whole of every version of every tag (see `scan` and `expand`)"""
+        batch = []
+        async for hit in self.scan(filtering, batch_size=batch_size):
+            batch.append(hit)
+            if len(batch) >= batch_size:
+                for source in await self.expand(batch):
+                    yield source
+                batch = []
 
-        logger.debug("Adding changes to Tag to history", tag_id=history_body["id"], tag_version=history_body["version"])
-        await self._index(body=history_body)
+        for source in await self.expand(batch):
+            yield source
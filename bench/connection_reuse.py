@@ -0,0 +1,58 @@
+"""Load test of the shared client's connection pool against a live OpenSearch cluster
+
+Fires requests at the cluster through a client built exactly like the app's (see app/lib/opensearch.py), and traces the
+pool to count how many sockets were opened versus reused. With a healthy pool, the number of sockets opened stays at or
+below the pool size no matter how many requests are made
+
+    python -m bench.connection_reuse --requests 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+from app.env import OPENSEARCH_POOL_SIZE
+from app.lib.opensearch import create_client
+
+
+async def main(args):
+    counts = {"created": 0, "reused": 0}
+
+    async def on_create(session, context, params):
+        counts["created"] += 1
+
+    async def on_reuse(session, context, params):
+        counts["reused"] += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_create)
+    trace.on_connection_reuseconn.append(on_reuse)
+
+    client = create_client(trace_configs=[trace], maxsize=args.pool_size)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call():
+        async with semaphore:
+            await client.cluster.health()
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[call() for _ in range(args.requests)])
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.close()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, pool size {args.pool_size}")
+    print(f"  rps:              {args.requests / elapsed:10.1f}")
+    print(f"  sockets opened:   {counts['created']:10d}")
+    print(f"  sockets reused:   {counts['reused']:10d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="Total number of requests to make")
+    parser.add_argument("--concurrency", type=int, default=50, help="Max number of in-flight requests")
+    parser.add_argument("--pool-size", type=int, default=OPENSEARCH_POOL_SIZE, help="Max sockets in the pool")
+    asyncio.run(main(parser.parse_args()))
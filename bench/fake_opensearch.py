@@ -0,0 +1,685 @@
+"""An in-memory stand-in for an OpenSearch cluster, for running the app offline in benchmarks
+
+It plugs in underneath the client as its connection class, so everything above it (serialization, retries, error
+mapping, the services, the app) runs for real, only the HTTP round trip to the cluster is replaced. It understands just
+enough of the REST API for what the app does: indexing (with sequence checks), realtime gets (and mgets), updates
+(partial docs, and Python stand-ins for the app's painless scripts), searches (bool queries, sorting, from/size,
+search_after, points in time, and the aggregations the services use), counts, bulk writes (and deletes), and the index
+management the app does at startup (creating indexes behind aliases, rolling them over, their creation dates, and ISM
+policies, which are stored but never run; roll indexes over by hand instead). Every call can be made to take a fixed
+amount of time, to stand in for network and cluster latency
+
+Calls are counted per operation. Set `current_operation` before driving a request through the app, and every call the
+cluster receives while handling it is attributed to that operation. Calls made outside of a request (eg: by the
+background audit writer) are attributed to "background"
+
+    cluster = FakeCluster(latency=0.002)
+    use_fake_cluster(client, cluster)
+"""
+
+import asyncio
+import copy
+import json
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Tuple
+from uuid import uuid4
+
+from opensearchpy import AsyncOpenSearch
+from opensearchpy._async.http_aiohttp import AsyncConnection
+
+from app.service import scripts
+
+# The operation cluster calls made in the current context are counted against
+current_operation: ContextVar[str] = ContextVar("current_operation", default="background")
+
+PRIMARY_TERM = 1
+
+
+def _append_item(source: dict, params: dict) -> bool:
+    if source.get("deleted") is not None:
+        return False
+    source[params["field"]] = (source.get(params["field"]) or []) + [params["item"]]
+    source.update(params["meta"])
+    return True
+
+
+def _replace_item(source: dict, params: dict) -> bool:
+    if source.get("deleted") is not None:
+        return False
+    for item in source.get(params["field"]) or []:
+        if item.get("id") == params["id"]:
+            item.update(params["item"])
+            source.update(params["meta"])
+            return True
+    return False
+
+
+def _remove_item(source: dict, params: dict) -> bool:
+    if source.get("deleted") is not None:
+        return False
+    items = source.get(params["field"]) or []
+    kept = [item for item in items if item.get("id") != params["id"]]
+    if len(kept) == len(items):
+        return False
+    source[params["field"]] = kept
+    source.update(params["meta"])
+    return True
+
+
+# What each of the app's painless scripts does, by the source of the script. Each changes the source in place, and
+#   returns whether anything was changed
+SCRIPTS: dict[str, Callable[[dict, dict], bool]] = {
+    scripts.APPEND_ITEM: _append_item,
+    scripts.REPLACE_ITEM: _replace_item,
+    scripts.REMOVE_ITEM: _remove_item,
+}
+
+
+class ResponseError(Exception):
+    """Raised by handlers to return an error status, which the connection turns into the client's usual exceptions"""
+
+    def __init__(self, status: int, error_type: str, reason: str = ""):
+        self.status = status
+        self.body = {"error": {"type": error_type, "reason": reason}, "status": status}
+
+
+def values_at(source: Any, path: str) -> List[Any]:
+    """All the values found at a dotted path in a doc, stepping through any lists along the way"""
+    if "." not in path and isinstance(source, dict):
+        value = source.get(path)
+        return [] if value is None else value if isinstance(value, list) else [value]
+
+    values = [source]
+    for key in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                found.extend(item.get(key) for item in value if isinstance(item, dict))
+            elif isinstance(value, dict):
+                found.append(value.get(key))
+        values = [value for value in found if value is not None]
+
+    flat = []
+    for value in values:
+        flat.extend(value if isinstance(value, list) else [value])
+    return flat
+
+
+def compile_query(query: dict | None) -> Callable[[dict], bool]:
+    """Turn the subset of the query DSL the app uses into a predicate over a doc's source. Queries are compiled once per
+    search rather than walked for every doc, so the fake costs as little as possible next to the app being measured"""
+    if not query or "match_all" in query:
+        return lambda source: True
+
+    kind, spec = next(iter(query.items()))
+    match kind:
+        case "bool":
+            clauses = {key: spec.get(key, []) for key in ("must", "filter", "should", "must_not")}
+            clauses = {
+                key: [compile_query(q) for q in (v if isinstance(v, list) else [v])] for key, v in clauses.items()
+            }
+            must, must_not, should = clauses["must"] + clauses["filter"], clauses["must_not"], clauses["should"]
+            return lambda source: (
+                all(q(source) for q in must)
+                and not any(q(source) for q in must_not)
+                and (not should or any(q(source) for q in should))
+            )
+        case "exists":
+            return lambda source: bool(values_at(source, spec["field"]))
+        case "term" | "match":
+            field, value = next(iter(spec.items()))
+            value = value.get("value", value.get("query")) if isinstance(value, dict) else value
+            return lambda source: value in values_at(source, field)
+        case "terms":
+            field, wanted = next(iter(spec.items()))
+            return lambda source: any(value in wanted for value in values_at(source, field))
+        case "range":
+            field, bounds = next(iter(spec.items()))
+            checks = {"gt": str.__gt__, "gte": str.__ge__, "lt": str.__lt__, "lte": str.__le__}
+            bounds = [(checks[op], str(bound)) for op, bound in bounds.items() if op in checks]
+            return lambda source: any(
+                all(check(str(value), bound) for check, bound in bounds) for value in values_at(source, field)
+            )
+        case "query_string":
+            # Not lucene, but a case-insensitive search for each term anywhere in the doc is close enough for load
+            terms = [t.strip('"*').lower() for t in re.split(r"\s+|\bAND\b|\bOR\b", spec["query"]) if t]
+            return lambda source: all(term in json.dumps(source).lower() for term in terms)
+
+    raise ResponseError(400, "parsing_exception", f"Unsupported query [{kind}]")
+
+
+class FakeCluster:
+    """The state of the fake cluster, and handlers for the API calls it supports
+
+    :arg latency: Seconds every call takes, before any work is done
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.indexes: dict[str, dict[str, dict]] = {}
+        # The indexes behind each alias, with whether each is the one written to through it (None if that isn't set)
+        self.aliases: dict[str, dict[str, bool | None]] = {}
+        # When each index was created, in epoch milliseconds
+        self.created: dict[str, int] = {}
+        self.policies: dict[str, dict] = {}
+        self.pits: dict[str, List[Tuple[str, dict]]] = {}
+        self.calls: Counter = Counter()
+        self.calls_by_api: Counter = Counter()
+        self._seq_no = 0
+
+    def reset_counts(self) -> None:
+        self.calls.clear()
+        self.calls_by_api.clear()
+
+    # Routing
+
+    routes = [
+        ("POST", re.compile(r"^/_bulk$"), "bulk"),
+        ("POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_bulk$"), "bulk"),
+        ("POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_search/point_in_time$"), "create_pit"),
+        ("DELETE", re.compile(r"^/_search/point_in_time$"), "delete_pit"),
+        ("GET|POST", re.compile(r"^/_search$"), "search"),
+        ("GET|POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_search$"), "search"),
+        ("GET|POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_count$"), "count"),
+        ("GET", re.compile(r"^/(?P<index>[^_/][^/]*)/_doc/(?P<doc_id>[^/]+)$"), "get"),
+        ("GET|POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_mget$"), "mget"),
+        ("PUT|POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_doc/(?P<doc_id>[^/]+)$"), "index"),
+        ("POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_doc$"), "index"),
+        ("POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_update/(?P<doc_id>[^/]+)$"), "update"),
+        ("GET", re.compile(r"^/_cluster/health$"), "health"),
+        ("PUT", re.compile(r"^/(?P<index>[^_/][^/]*)$"), "create_index"),
+        ("HEAD", re.compile(r"^/(?P<index>[^_/][^/]*)$"), "index_exists"),
+        ("HEAD", re.compile(r"^/_alias/(?P<name>[^/]+)$"), "alias_exists"),
+        ("PUT", re.compile(r"^/(?P<index>[^_/][^/]*)/_alias/(?P<name>[^/]+)$"), "put_alias"),
+        ("POST", re.compile(r"^/(?P<index>[^_/][^/]*)/_rollover$"), "rollover"),
+        ("GET", re.compile(r"^/(?P<index>[^_/][^/]*)/_settings/(?P<name>[^/]+)$"), "get_settings"),
+        ("GET", re.compile(r"^/_plugins/_ism/policies/(?P<policy>[^/]+)$"), "get_policy"),
+        ("PUT", re.compile(r"^/_plugins/_ism/policies/(?P<policy>[^/]+)$"), "put_policy"),
+        ("DELETE", re.compile(r"^/_plugins/_ism/policies/(?P<policy>[^/]+)$"), "delete_policy"),
+    ]
+
+    async def handle(self, method: str, path: str, params: dict, body: bytes | str | None) -> Tuple[int, Any]:
+        """Route a request to its handler, returning the status and the (unserialized) response body"""
+        for methods, pattern, api in self.routes:
+            found = pattern.match(path)
+            if method in methods.split("|") and found:
+                break
+        else:
+            return 404, {"error": {"type": "no_handler_found", "reason": f"{method} {path}"}, "status": 404}
+
+        self.calls[current_operation.get()] += 1
+        self.calls_by_api[api] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(body, bytes):
+            body = body.decode()
+        try:
+            return 200, getattr(self, api)(body=body, params=params or {}, **found.groupdict())
+        except ResponseError as e:
+            return e.status, e.body
+
+    # Resolving index names
+
+    def _resolve(self, name: str | None) -> List[str]:
+        """The indexes behind a comma separated list of index names and aliases (all of them if there's no name)"""
+        if name is None:
+            return list(self.indexes)
+
+        indexes = []
+        for part in name.split(","):
+            for index in self.aliases.get(part, {part: None}):
+                if index not in indexes:
+                    indexes.append(index)
+        return indexes
+
+    def _single_index(self, name: str) -> str:
+        """The one index behind an index name or alias, for operations on a single doc"""
+        indexes = self._resolve(name)
+        if len(indexes) != 1:
+            raise ResponseError(
+                400,
+                "illegal_argument_exception",
+                f"alias [{name}] has more than one index associated with it, can't execute a single index op",
+            )
+        return indexes[0]
+
+    def _write_index(self, name: str) -> str:
+        """The index written to through an index name or alias"""
+        members = self.aliases.get(name)
+        if members is None:
+            return name
+        writers = [index for index, is_write_index in members.items() if is_write_index or len(members) == 1]
+        if not writers:
+            raise ResponseError(400, "illegal_argument_exception", f"no write index is defined for alias [{name}]")
+        return writers[0]
+
+    def _create(self, index: str) -> None:
+        self.indexes.setdefault(index, {})
+        self.created.setdefault(index, int(time.time() * 1000))
+
+    # Handlers
+
+    def _write(self, index: str, doc_id: str | None, source: dict, params: dict) -> dict:
+        self._create(index)
+        docs = self.indexes[index]
+        doc_id = doc_id or uuid4().hex
+        current = docs.get(doc_id)
+        self._check_sequence(doc_id, current, params)
+
+        self._seq_no += 1
+        docs[doc_id] = {
+            "_id": doc_id,
+            "_version": current["_version"] + 1 if current else 1,
+            "_seq_no": self._seq_no,
+            "_source": source,
+        }
+        return {
+            "_index": index,
+            "_id": doc_id,
+            "_version": docs[doc_id]["_version"],
+            "result": "updated" if current else "created",
+            "_seq_no": self._seq_no,
+            "_primary_term": PRIMARY_TERM,
+        }
+
+    def _delete(self, index: str, doc_id: str) -> dict:
+        current = self.indexes.get(index, {}).pop(doc_id, None)
+        self._seq_no += 1
+        return {
+            "_index": index,
+            "_id": doc_id,
+            "_version": current["_version"] + 1 if current else 1,
+            "result": "deleted" if current else "not_found",
+            "_seq_no": self._seq_no,
+            "_primary_term": PRIMARY_TERM,
+        }
+
+    @staticmethod
+    def _check_sequence(doc_id: str, current: dict | None, params: dict) -> None:
+        if "if_seq_no" in params:
+            if current is None or (str(current["_seq_no"]), str(PRIMARY_TERM)) != (
+                str(params["if_seq_no"]),
+                str(params.get("if_primary_term")),
+            ):
+                raise ResponseError(409, "version_conflict_engine_exception", f"[{doc_id}]: version conflict")
+
+    def _hit(self, index: str, doc: dict) -> dict:
+        return {
+            "_index": index,
+            "_id": doc["_id"],
+            "_version": doc["_version"],
+            "_seq_no": doc["_seq_no"],
+            "_primary_term": PRIMARY_TERM,
+            "_source": doc["_source"],
+        }
+
+    def index(self, body: str, params: dict, index: str, doc_id: str = None) -> dict:
+        return self._write(self._write_index(index), doc_id, json.loads(body), params)
+
+    def get(self, body: str, params: dict, index: str, doc_id: str) -> dict:
+        index = self._single_index(index)
+        doc = self.indexes.get(index, {}).get(doc_id)
+        if doc is None:
+            raise ResponseError(404, "not_found", f"[{doc_id}]")
+
+        hit = self._hit(index, doc) | {"found": True}
+        if "_source_includes" in params or "_source_excludes" in params:
+            hit["_source"] = self._filter_source(
+                hit["_source"],
+                self._param_list(params, "_source_includes"),
+                self._param_list(params, "_source_excludes"),
+            )
+        return hit
+
+    def mget(self, body: str, params: dict, index: str) -> dict:
+        index = self._single_index(index)
+        docs = []
+        for doc_id in json.loads(body)["ids"]:
+            try:
+                docs.append(self.get(body=None, params=params, index=index, doc_id=doc_id))
+            except ResponseError:
+                docs.append({"_index": index, "_id": doc_id, "found": False})
+        return {"docs": docs}
+
+    def update(self, body: str, params: dict, index: str, doc_id: str) -> dict:
+        index = self._write_index(index)
+        current = self.indexes.get(index, {}).get(doc_id)
+        if current is None:
+            raise ResponseError(404, "document_missing_exception", f"[{doc_id}]: document missing")
+        self._check_sequence(doc_id, current, params)
+
+        request = json.loads(body)
+        source = copy.deepcopy(current["_source"])
+        if "doc" in request:
+            source.update(request["doc"])
+            changed = True
+        else:
+            run = SCRIPTS.get(request.get("script", {}).get("source"))
+            if run is None:
+                raise ResponseError(400, "illegal_argument_exception", "Only the app's own scripts are supported")
+            changed = run(source, request["script"].get("params", {}))
+
+        if changed:
+            result = self._write(index, doc_id, source, {}) | {"result": "updated"}
+        else:
+            result = {key: value for key, value in self._hit(index, current).items() if key != "_source"}
+            result["result"] = "noop"
+
+        if "_source" in params:
+            written = self.indexes[index][doc_id]
+            result["get"] = {"_seq_no": written["_seq_no"], "_primary_term": PRIMARY_TERM, "found": True}
+            result["get"]["_source"] = written["_source"]
+        return result
+
+    def bulk(self, body: str, params: dict, index: str = None) -> dict:
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items, errors = [], False
+        while lines:
+            action, meta = next(iter(lines.pop(0).items()))
+            source = lines.pop(0) if action != "delete" else None
+            target = self._write_index(meta.get("_index", index))
+            doc_id = meta.get("_id")
+            try:
+                if action == "delete":
+                    result = self._delete(target, doc_id)
+                    items.append({action: result | {"status": 200 if result["result"] == "deleted" else 404}})
+                    continue
+                if action == "create" and doc_id in self.indexes.get(target, {}):
+                    raise ResponseError(409, "version_conflict_engine_exception", f"[{doc_id}]: document exists")
+                result = self._write(target, doc_id, source, {})
+                items.append({action: result | {"status": 201 if result["result"] == "created" else 200}})
+            except ResponseError as e:
+                errors = True
+                items.append({action: {"_index": target, "_id": doc_id, "status": e.status, "error": e.body["error"]}})
+        return {"took": 1, "errors": errors, "items": items}
+
+    def create_pit(self, body: str, params: dict, index: str) -> dict:
+        pit_id = uuid4().hex
+        # A point in time is a frozen view of the index, later writes aren't seen through it. Writes replace docs rather
+        #   than changing them, so a shallow copy is enough
+        self.pits[pit_id] = [
+            (name, doc) for name in self._resolve(index) for doc in self.indexes.get(name, {}).values()
+        ]
+        return {"pit_id": pit_id, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0}}
+
+    def delete_pit(self, body: str, params: dict) -> dict:
+        pit_ids = json.loads(body).get("pit_id", []) if body else []
+        return {
+            "pits": [{"pit_id": pit_id, "successful": self.pits.pop(pit_id, None) is not None} for pit_id in pit_ids]
+        }
+
+    def count(self, body: str, params: dict, index: str) -> dict:
+        matches = compile_query(json.loads(body).get("query") if body else None)
+        docs = [doc for name in self._resolve(index) for doc in self.indexes.get(name, {}).values()]
+        return {"count": len([doc for doc in docs if matches(doc["_source"])])}
+
+    def health(self, body: str, params: dict) -> dict:
+        return {"cluster_name": "fake", "status": "green", "number_of_nodes": 1}
+
+    def search(self, body: str, params: dict, index: str = None) -> dict:
+        body = json.loads(body) if body else {}
+        pit = body.get("pit")
+        if pit is not None:
+            if pit["id"] not in self.pits:
+                raise ResponseError(404, "search_context_missing_exception", "No search context found")
+            docs = self.pits[pit["id"]]
+        else:
+            docs = [(name, doc) for name in self._resolve(index) for doc in self.indexes.get(name, {}).values()]
+
+        matches = compile_query(body.get("query"))
+        hits = [(name, doc) for name, doc in docs if matches(doc["_source"])]
+        sort = body.get("sort", [])
+        keyed = sorted(((self._sort_key(doc, sort), name, doc) for name, doc in hits), key=lambda hit: hit[0])
+        if "search_after" in body:
+            after = self._sort_key(dict(zip([next(iter(c)) for c in sort], body["search_after"])), sort, raw=True)
+            keyed = [hit for hit in keyed if hit[0] > after]
+
+        start = body.get("from", 0)
+        size = body.get("size", 10)
+        page = []
+        for _, name, doc in keyed[start : start + size]:
+            hit = self._hit(name, doc)
+            if body.get("_source") is False:
+                del hit["_source"]
+            elif isinstance(body.get("_source"), dict):
+                filtering = body["_source"]
+                hit["_source"] = self._filter_source(
+                    hit["_source"], filtering.get("includes"), filtering.get("excludes")
+                )
+            hit["sort"] = [
+                doc["_id"] if field == "_id" else (values_at(doc["_source"], field) or [None])[0]
+                for field in [next(iter(c)) for c in sort]
+            ]
+            page.append(hit)
+
+        result = {
+            "took": 1,
+            "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": page},
+        }
+        aggs = body.get("aggregations", body.get("aggs"))
+        if aggs:
+            result["aggregations"] = self._aggregate([doc["_source"] | {"_id": doc["_id"]} for _, doc in hits], aggs)
+        if pit is not None:
+            result["pit_id"] = pit["id"]
+        return result
+
+    def create_index(self, body: str, params: dict, index: str) -> dict:
+        if index in self.indexes:
+            raise ResponseError(400, "resource_already_exists_exception", f"index [{index}] already exists")
+        self._create(index)
+        for alias, spec in (json.loads(body) if body else {}).get("aliases", {}).items():
+            self.aliases.setdefault(alias, {})[index] = spec.get("is_write_index")
+        return {"acknowledged": True, "shards_acknowledged": True, "index": index}
+
+    def index_exists(self, body: str, params: dict, index: str) -> dict:
+        if not all(name in self.indexes for name in self._resolve(index)):
+            raise ResponseError(404, "index_not_found_exception", f"no such index [{index}]")
+        return {}
+
+    def alias_exists(self, body: str, params: dict, name: str) -> dict:
+        if name not in self.aliases:
+            raise ResponseError(404, "aliases_not_found_exception", f"alias [{name}] missing")
+        return {}
+
+    def put_alias(self, body: str, params: dict, index: str, name: str) -> dict:
+        for target in self._resolve(index):
+            self.aliases.setdefault(name, {})[target] = None
+        return {"acknowledged": True}
+
+    def rollover(self, body: str, params: dict, index: str) -> dict:
+        """Roll the write alias over to a new index, as ISM does. The alias moves to the new index, unless the old one
+        is explicitly its write index, in which case it stays behind the alias as well. The new index joins every other
+        alias the old one is behind, as its index template would add it to the read alias"""
+        old = self._write_index(index)
+        new = re.sub(r"\d+$", lambda found: f"{int(found.group()) + 1:06d}", old)
+        self._create(new)
+        for alias, members in self.aliases.items():
+            if alias == index and members[old]:
+                members[old], members[new] = False, True
+            elif alias == index:
+                del members[old]
+                members[new] = None
+            elif old in members:
+                members[new] = None
+        return {"acknowledged": True, "old_index": old, "new_index": new, "rolled_over": True}
+
+    def get_settings(self, body: str, params: dict, index: str, name: str) -> dict:
+        # Only the creation date is kept
+        return {
+            index: {"settings": {"index": {"creation_date": str(self.created[index])}}}
+            for index in self._resolve(index)
+            if index in self.indexes
+        }
+
+    def get_policy(self, body: str, params: dict, policy: str) -> dict:
+        if policy not in self.policies:
+            raise ResponseError(404, "status_exception", "Policy not found")
+        return self.policies[policy]
+
+    def put_policy(self, body: str, params: dict, policy: str) -> dict:
+        self._seq_no += 1
+        self.policies[policy] = {"_id": policy, "_seq_no": self._seq_no, "_primary_term": PRIMARY_TERM}
+        self.policies[policy] |= json.loads(body)
+        return self.policies[policy]
+
+    def delete_policy(self, body: str, params: dict, policy: str) -> dict:
+        if self.policies.pop(policy, None) is None:
+            raise ResponseError(404, "not_found", "Policy not found")
+        return {"result": "deleted"}
+
+    # Helpers for searching
+
+    @staticmethod
+    def _param_list(params: dict, name: str) -> List[str] | None:
+        """Read a comma separated list from the query string, which the client sends as bytes"""
+        value = params.get(name)
+        if value is None:
+            return None
+        return (value.decode() if isinstance(value, bytes) else value).split(",")
+
+    @staticmethod
+    def _filter_source(source: dict, includes: List[str] | None, excludes: List[str] | None) -> dict:
+        """Pick top level fields out of a doc. Only plain field names are supported, not wildcards or nested paths"""
+        return {
+            key: value
+            for key, value in source.items()
+            if (not includes or key in includes) and not (excludes and key in excludes)
+        }
+
+    @staticmethod
+    def _sort_key(doc: dict, sort: List[dict], raw: bool = False) -> tuple:
+        """Build a key that orders docs the way the sort clause asks. Descending fields are inverted, and missing values
+        always sort last, as they do in OpenSearch"""
+        key = []
+        for clause in sort:
+            field, order = next(iter(clause.items()))
+            order = order.get("order", "asc") if isinstance(order, dict) else order
+            if raw:
+                value = doc.get(field)
+            elif field == "_id":
+                value = doc["_id"]
+            else:
+                value = (values_at(doc["_source"], field) or [None])[0]
+            key.append(Descending(value) if order == "desc" else Ascending(value))
+        return tuple(key)
+
+    def _aggregate(self, docs: List[dict], aggs: dict) -> dict:
+        results = {}
+        for name, spec in aggs.items():
+            sub_aggs = spec.get("aggregations", spec.get("aggs"))
+            kind, options = next((key, value) for key, value in spec.items() if key not in ("aggregations", "aggs"))
+            match kind:
+                case "filter":
+                    matches = compile_query(options)
+                    scoped = [doc for doc in docs if matches(doc)]
+                    results[name] = {"doc_count": len(scoped)}
+                case "nested":
+                    scoped = list(self._nested(docs, options["path"]))
+                    results[name] = {"doc_count": len(scoped)}
+                case "cardinality":
+                    scoped = None
+                    results[name] = {
+                        "value": len({json.dumps(v) for doc in docs for v in values_at(doc, options["field"])})
+                    }
+                case "value_count":
+                    scoped = None
+                    results[name] = {"value": sum(len(values_at(doc, options["field"])) for doc in docs)}
+                case "terms":
+                    scoped = None
+                    buckets = Counter(v for doc in docs for v in set(values_at(doc, options["field"])))
+                    results[name] = {"buckets": []}
+                    for key, count in buckets.most_common(options.get("size", 10)):
+                        bucket = {"key": key, "doc_count": count}
+                        if sub_aggs:
+                            in_bucket = [doc for doc in docs if key in values_at(doc, options["field"])]
+                            bucket |= self._aggregate(in_bucket, sub_aggs)
+                        results[name]["buckets"].append(bucket)
+                case _:
+                    raise ResponseError(400, "parsing_exception", f"Unsupported aggregation [{kind}]")
+
+            if sub_aggs and scoped is not None:
+                results[name] |= self._aggregate(scoped, sub_aggs)
+        return results
+
+    @staticmethod
+    def _nested(docs: List[dict], path: str) -> Iterator[dict]:
+        """Every object found at a nested path, each wrapped back up in its path so full field names still resolve"""
+        *parents, leaf = path.split(".")
+        for doc in docs:
+            for item in values_at(doc, path):
+                wrapped = {leaf: item}
+                for parent in reversed(parents):
+                    wrapped = {parent: wrapped}
+                yield wrapped
+
+
+class Ascending:
+    """Sort key wrapper that orders values ascending, with missing values last"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def _key(self):
+        return (self.value is None, "" if self.value is None else self.value)
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __gt__(self, other):
+        return self._key() > other._key()
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+
+class Descending(Ascending):
+    """Sort key wrapper that orders values descending, with missing values still last"""
+
+    __slots__ = ()
+
+    def __lt__(self, other):
+        if (self.value is None) != (other.value is None):
+            return other.value is None
+        return self.value is not None and self.value > other.value
+
+    def __gt__(self, other):
+        return other < self
+
+
+class FakeConnection(AsyncConnection):
+    """A client connection that hands requests to a `FakeCluster` instead of sending them over the network
+
+    :arg cluster: The fake cluster requests are handled by
+    """
+
+    def __init__(self, *args, cluster: FakeCluster = None, **kwargs):
+        # Drop the options only the real (aiohttp) connection knows about
+        for key in ("keepalive_timeout", "trace_configs", "maxsize", "loop", "pool_maxsize", "ssl_show_warn"):
+            kwargs.pop(key, None)
+        for key in ("verify_certs", "ssl_assert_hostname", "ca_certs", "http_auth"):
+            kwargs.pop(key, None)
+        super().__init__(*args, **kwargs)
+        self.cluster = cluster
+
+    async def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        status, data = await self.cluster.handle(method, url, params, body)
+        raw = json.dumps(data)
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, raw, "application/json")
+        return status, {"content-type": "application/json"}, raw
+
+    async def close(self) -> None:
+        pass
+
+
+def use_fake_cluster(client: AsyncOpenSearch, cluster: FakeCluster) -> None:
+    """Point a client at a fake cluster. Must be called before the client makes its first request"""
+    client.transport.connection_class = FakeConnection
+    client.transport.kwargs["cluster"] = cluster
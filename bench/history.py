@@ -0,0 +1,116 @@
+"""Measures how much space the history of a tag takes up, and how long a page of it takes to rebuild, at each snapshot
+interval
+
+A tag with a number of patterns is edited over and over (a pattern added, changed or removed at a time, the way most
+edits go), and every version is added to the history at each interval. An interval of 1 stores a whole copy of every
+version, which is how history used to be stored. Everything is written to and read from a fake cluster (see
+bench.fake_opensearch), so this runs offline, and the sizes are those of the docs as stored
+
+    python -m bench.history --edits 200 --patterns 100 --intervals 1,5,10,20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from uuid import uuid4
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.infra.manager import Manager  # noqa: E402
+from app.lib.cache import LRUCache  # noqa: E402
+from app.lib.opensearch import client  # noqa: E402
+from app.logger import logger  # noqa: E402
+from app.models.pagination import PaginationArgs, SortingArgs  # noqa: E402
+from app.models.service import ReturnModel  # noqa: E402
+from app.models.tag import Import  # noqa: E402
+from app.service.tag_history import TagHistoryService  # noqa: E402
+from bench.fake_opensearch import FakeCluster, use_fake_cluster  # noqa: E402
+from bench.load import new_tag  # noqa: E402
+
+
+def new_pattern(number: int) -> dict:
+    return {
+        "id": str(uuid4()),
+        "operator": "AND",
+        "clauses": [{"field": "url", "operator": "=", "value": f"edit-{number}.example.com"}],
+    }
+
+
+def versions(edits: int, patterns: int):
+    """Every version of a tag as it's edited, the same sequence of edits each time"""
+    rng = random.Random(0)
+    source = Import(**new_tag(0, patterns)).model_dump(mode="json")
+    source["created"] = source["updated"] = datetime.utcnow().isoformat()
+    yield source
+    for number in range(edits):
+        source = json.loads(json.dumps(source))
+        source["updated"] = datetime.utcnow().isoformat()
+        kind = number % 3
+        if kind == 0 or not source["patterns"]:
+            source["patterns"].append(new_pattern(number))
+        elif kind == 1:
+            source["patterns"][rng.randrange(len(source["patterns"]))] |= {"operator": "OR"}
+        else:
+            source["patterns"].pop(rng.randrange(len(source["patterns"])))
+        yield source
+
+
+async def run(cluster: FakeCluster, interval: int, edits: int, patterns: int, page_size: int) -> tuple:
+    history_service = TagHistoryService(client, LRUCache(max_size=1000, ttl=float("inf")), snapshot_interval=interval)
+    tag_id = str(uuid4())
+
+    start = time.perf_counter()
+    for version, source in enumerate(versions(edits, patterns), start=1):
+        await history_service.add(ReturnModel({"_id": tag_id, "_version": version, "_source": source}))
+    write_time = time.perf_counter() - start
+
+    docs = [doc for index in cluster.indexes.values() for doc in index.values() if doc["_source"]["id"] == tag_id]
+    stored = sum(len(json.dumps(doc["_source"])) for doc in docs)
+
+    # The latest page of versions, rebuilt without any help from the cache (as after a restart)
+    history_service.snapshots = None
+    start = time.perf_counter()
+    res = await history_service.list(
+        PaginationArgs(limit=page_size),
+        sorting=SortingArgs(sort_by="version", sort_order="desc"),
+        extra_filter={"term": {"id": tag_id}},
+    )
+    rebuilt = await history_service.expand(res.data)
+    read_time = time.perf_counter() - start
+    assert len(rebuilt) == min(page_size, edits + 1)
+
+    return len(docs), stored, write_time, read_time
+
+
+async def main(args):
+    cluster = FakeCluster(latency=0)
+    use_fake_cluster(client, cluster)
+    await Manager(client, logger).create_rollover_indexes()
+
+    print(f"{'interval':>8} {'docs':>6} {'stored KB':>10} {'vs whole':>9} {'write ms':>9} {'page ms':>8}")
+    baseline = None
+    for interval in args.intervals:
+        docs, stored, write_time, read_time = await run(cluster, interval, args.edits, args.patterns, args.page_size)
+        baseline = baseline or stored
+        print(
+            f"{interval:>8} {docs:>6} {stored / 1024:>10.1f} {stored / baseline:>8.0%} "
+            f"{write_time * 1000:>9.1f} {read_time * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edits", type=int, default=200, help="Number of times the tag is edited")
+    parser.add_argument("--patterns", type=int, default=100, help="Number of patterns the tag starts with")
+    parser.add_argument(
+        "--intervals",
+        type=lambda value: [int(interval) for interval in value.split(",")],
+        default=[1, 5, 10, 20],
+        help="Comma separated snapshot intervals to compare, the first is the baseline",
+    )
+    parser.add_argument("--page-size", type=int, default=50, help="Versions on the page of history that's rebuilt")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,275 @@
+"""Load test of the whole app (middlewares, routes, services) against an in-memory fake OpenSearch cluster
+
+The app is driven directly over ASGI, in process, so nothing but the app itself is being measured, and it runs offline.
+Tags are imported through the API first, then a number of workers fire a weighted mix of operations at it
+
+- list: A page of the tag listing, from a random offset
+- get: A tag by ID
+- patch: An update to a tag, using the sequence from the last time that worker wrote it
+- metrics: The tag metrics
+
+Every cluster call the fake receives is attributed to the operation that caused it, and reported as calls per request
+(calls made by background tasks, like the audit writer, are reported on their own). Results can be stored as a baseline
+in bench/baselines, and later runs compared against it. Baselines are only comparable with runs made on the same box
+with the same options
+
+    python -m bench.load --requests 5000 --concurrency 20 --latency 2 --mix list=40,get=40,patch=15,metrics=5
+    python -m bench.load --save default
+    python -m bench.load --compare default
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Tuple
+
+BASELINES = Path(__file__).parent / "baselines"
+
+# Logging every request to stdout would drown out the report, so it's quietened unless asked for
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("CYCLE_INDEX_TEMPLATES", "false")
+
+from app.env import get_mapping  # noqa: E402
+from app.infra.manager import Manager  # noqa: E402
+from app.logger import logger  # noqa: E402
+from bench.fake_opensearch import FakeCluster, current_operation, use_fake_cluster  # noqa: E402
+
+
+async def call(
+    app, method: str, path: str, query: str = "", body: dict = None, headers: dict = None
+) -> Tuple[int, bytes]:
+    """Make a single request to an ASGI app, returning the status and body of the response"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")]
+        + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    response = {"status": 0, "body": bytearray()}
+    sent = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # The client only goes away once it's read the whole response
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return response["status"], bytes(response["body"])
+
+
+def new_tag(number: int, patterns: int) -> dict:
+    return {
+        "name": f"Load Test Tag {number}",
+        "description": "Seeded for a load test",
+        "groups": ["bench"],
+        "type": "Malware Family",
+        "visibility": "Public",
+        "patterns": [
+            {
+                "operator": "AND",
+                "clauses": [
+                    {"field": "url", "operator": "=", "value": f"{number}-{p}.example.com"},
+                    {"field": "port", "operator": "=", "value": str(443 + p)},
+                ],
+            }
+            for p in range(patterns)
+        ],
+    }
+
+
+async def seed(app, tags: int, patterns: int) -> List[dict]:
+    """Import tags through the API (a tag created on its own can't have patterns), returning the ID and sequence of
+    each"""
+    status, body = await call(app, "POST", "/tags/_bulk", body=[new_tag(number, patterns) for number in range(tags)])
+    imported = json.loads(body)
+    if status != 200 or imported["failed"]:
+        raise RuntimeError(f"Seeding failed with a {status}: {body[:500]}")
+
+    seeded = []
+    for item in imported["items"]:
+        status, body = await call(app, "GET", f"/tags/{item['id']}")
+        seeded.append({"id": item["id"], "sequence": json.loads(body)["sequence"]})
+    return seeded
+
+
+async def worker(app, number: int, args, ops: List[str], weights: List[int], tags: List[dict], results, remaining):
+    rng = random.Random(args.seed + number)
+    # Each worker only writes its own tags, so its sequences never go stale because of another worker
+    owned = tags[number :: args.concurrency] or tags
+
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        op = rng.choices(ops, weights)[0]
+        token = current_operation.set(op)
+        start = time.perf_counter()
+        match op:
+            case "list":
+                offset = rng.randrange(0, max(len(tags) - args.page_size, 1))
+                status, body = await call(app, "GET", "/tags/", f"limit={args.page_size}&offset={offset}")
+            case "get":
+                status, body = await call(app, "GET", f"/tags/{rng.choice(tags)['id']}")
+            case "patch":
+                tag = rng.choice(owned)
+                status, body = await call(
+                    app,
+                    "PATCH",
+                    f"/tags/{tag['id']}",
+                    f"sequence={tag['sequence']}",
+                    {"description": f"Updated by worker {number} at {time.time()}"},
+                )
+                if status == 200:
+                    tag["sequence"] = json.loads(body)["sequence"]
+            case "metrics":
+                status, body = await call(app, "GET", "/metrics/tags")
+            case _:
+                raise ValueError(f"Unknown operation [{op}]")
+        results[op].append((time.perf_counter() - start, status))
+        current_operation.reset(token)
+
+
+def percentile(latencies: List[float], pct: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(name: str, samples: List[tuple], calls: int, elapsed: float) -> dict:
+    latencies = [s[0] * 1000 for s in samples]
+    return {
+        "name": name,
+        "requests": len(samples),
+        "errors": len([s for s in samples if s[1] >= 400]),
+        "rps": len(samples) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "calls_per_request": calls / len(samples) if samples else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    from app.app import app
+    from app.lib.opensearch import client
+
+    cluster = FakeCluster(latency=args.latency / 1000)
+    use_fake_cluster(client, cluster)
+    await Manager(client, logger).create_rollover_indexes()
+
+    mix = {op: int(weight) for op, weight in get_mapping(args.mix).items()}
+    ops, weights = list(mix), list(mix.values())
+
+    async with app.router.lifespan_context(app):
+        tags = await seed(app, args.tags, args.patterns)
+        cluster.reset_counts()
+
+        results = defaultdict(list)
+        remaining = [args.requests]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[worker(app, n, args, ops, weights, tags, results, remaining) for n in range(args.concurrency)]
+        )
+        elapsed = time.perf_counter() - start
+
+    every = [sample for op in ops for sample in results[op]]
+    return {
+        "options": {
+            key: getattr(args, key) for key in ("requests", "concurrency", "latency", "mix", "tags", "patterns")
+        },
+        "total": summarize("total", every, sum(cluster.calls[op] for op in ops), elapsed),
+        "operations": {op: summarize(op, results[op], cluster.calls[op], elapsed) for op in ops if results[op]},
+        "background_calls": cluster.calls["background"],
+        "calls_by_api": dict(cluster.calls_by_api),
+    }
+
+
+def report(result: dict, baseline: dict = None) -> None:
+    opts = result["options"]
+    print(
+        f"{opts['requests']} requests, concurrency {opts['concurrency']}, {opts['latency']}ms cluster latency, "
+        f"mix {opts['mix']}, {opts['tags']} tags x {opts['patterns']} patterns"
+    )
+    print(
+        f"  {'':10} {'requests':>9} {'errors':>7} {'rps':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/req':>10}"
+    )
+
+    rows = list(result["operations"].values()) + [result["total"]]
+    for row in rows:
+        print(
+            f"  {row['name']:10} {row['requests']:9d} {row['errors']:7d} {row['rps']:9.1f} {row['p50']:8.2f} "
+            f"{row['p95']:8.2f} {row['p99']:8.2f} {row['calls_per_request']:10.2f}"
+        )
+        if baseline is None:
+            continue
+        before = baseline["total"] if row["name"] == "total" else baseline["operations"].get(row["name"])
+        if before is None:
+            continue
+        deltas = []
+        for key in ("rps", "p50", "p95", "p99", "calls_per_request"):
+            change = (row[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f"{change:+7.1f}%")
+        print(f"  {'':10} {'':9} {'':7} {deltas[0]:>9} {deltas[1]:>8} {deltas[2]:>8} {deltas[3]:>8} {deltas[4]:>10}")
+
+    print(f"  background cluster calls: {result['background_calls']}")
+    print(f"  cluster calls by api: {json.dumps(result['calls_by_api'], sort_keys=True)}")
+
+
+def main(args):
+    baseline = None
+    if args.compare:
+        baseline = json.loads((BASELINES / f"{args.compare}.json").read_text())
+        if baseline["options"] != {key: getattr(args, key) for key in baseline["options"]}:
+            print(f"Warning: baseline [{args.compare}] was made with different options: {baseline['options']}")
+
+    result = asyncio.run(run(args))
+    report(result, baseline)
+
+    if args.save:
+        BASELINES.mkdir(exist_ok=True)
+        (BASELINES / f"{args.save}.json").write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Saved baseline [{args.save}]")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="Total number of requests to make")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of workers making requests")
+    parser.add_argument("--latency", type=float, default=2, help="Milliseconds every cluster call takes")
+    parser.add_argument("--mix", default="list=40,get=40,patch=15,metrics=5", help="Weighted mix of operations")
+    parser.add_argument("--tags", type=int, default=200, help="Number of tags to seed")
+    parser.add_argument("--patterns", type=int, default=10, help="Patterns per seeded tag")
+    parser.add_argument("--page-size", type=int, default=20, help="Tags per page when listing")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random choice of operations")
+    parser.add_argument("--save", metavar="NAME", help="Store the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="Compare the results against a stored baseline")
+    main(parser.parse_args())
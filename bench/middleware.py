@@ -0,0 +1,182 @@
+"""Micro-benchmark of the overhead the request logging middleware adds to every request
+
+A trivial route is served three ways, and hammered over ASGI in process
+
+- none: No middleware at all, the floor
+- before: The previous `@app.middleware("http")` implementation (kept below for comparison), with a uuid4 request ID,
+  `time.time()`, and loguru writing synchronously to the log file
+- after: The current `RequestPipeline` middleware (with no stages), logging through the `QueuedSink`
+- auth: As above, with the authentication stage checking an API key, resolved through a warm user cache
+
+Logs go to --log-file (default: the null device, so only the cost of producing them is measured). Runs offline
+
+    python -m bench.middleware --requests 20000 --concurrency 20
+    python -m bench.middleware --json --log-file /tmp/bench.log
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from uuid import uuid4
+
+os.environ.setdefault("LOG_LEVEL", "INFO")
+
+from fastapi import FastAPI, Request, Response  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.api.middlewares import authentication  # noqa: E402
+from app.api.middlewares.authentication import CachedUserResolver, StaticUserResolver  # noqa: E402
+from app.api.middlewares.pipeline import RequestPipeline  # noqa: E402
+from app.lib.context import current_timings  # noqa: E402
+from app.lib.exceptions import APIException, ServerError  # noqa: E402
+from app.lib.prometheus import requests_in_flight, request_duration  # noqa: E402
+from app.lib.timing import RequestTimings  # noqa: E402
+from app.logger import logger, QueuedSink  # noqa: E402
+from app.models.user import User  # noqa: E402
+from bench.load import call  # noqa: E402
+
+
+def attach_legacy_request_logging(app: FastAPI):
+    """The request logging middleware as it was before being rewritten as a plain ASGI middleware"""
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next) -> Response:
+        request_id = str(uuid4())
+        start_time = time.time()
+
+        timings = RequestTimings()
+        current_timings.set(timings)
+        requests_in_flight.inc()
+
+        with logger.contextualize(request_id=request_id):
+            try:
+                response = await call_next(request)
+
+            except Exception as e:
+                response = {
+                    "requestID": request_id,
+                    "success": False,
+                    "details": {
+                        "statusCode": 500,
+                        "errorCode": ServerError.error_code,
+                        "errorMessage": "Internal Server Error",
+                        "errorDetails": "",
+                    },
+                }
+                if isinstance(e, APIException):
+                    response["details"]["statusCode"] = e.status_code
+                response = JSONResponse(content=response, status_code=response["details"]["statusCode"])
+
+            finally:
+                process_time = (time.time() - start_time) * 1000
+                formatted_process_time = "{0:.2f}".format(process_time)
+                timing = timings.summary()
+                response.headers["X-Request-ID"] = request_id
+                response.headers["Server-Timing"] = timings.server_timing(timing)
+
+                route = request.scope.get("route")
+                raw_path = (request.scope["root_path"] + route.path) if route else None
+                requests_in_flight.dec()
+                request_duration.observe(
+                    timing["total"] / 1000, request.method, raw_path or "unmatched", str(response.status_code)
+                )
+
+                logger.bind(
+                    **{
+                        "method": request.method,
+                        "path": request.url.path,
+                        "raw_path": raw_path or request.url.path,
+                        "code": response.status_code,
+                        "duration": formatted_process_time,
+                        "username": None,
+                        "cluster_ms": round(timing["cluster"], 2),
+                        "cluster_calls": timing["cluster_calls"],
+                        "cluster_took_ms": timing["cluster_took"],
+                        "serialization_ms": round(timing["serialization"], 2),
+                        "app_ms": round(timing["app"], 2),
+                        "opensearch": [vars(call) for call in timings.calls],
+                    }
+                ).info(
+                    f"{request.method} {request.url.path} -> [{response.status_code}] in {formatted_process_time}ms",
+                    duration=formatted_process_time,
+                )
+                return response
+
+
+API_KEY = "bench-api-key"
+
+
+def build_app(variant: str, args) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping() -> dict:
+        return {"pong": True}
+
+    logger.remove()
+    stream = open(args.log_file, "w")
+    if variant == "before":
+        attach_legacy_request_logging(app)
+        logger.add(stream, level="INFO", serialize=args.json)
+    elif variant == "after":
+        app.add_middleware(RequestPipeline)
+        logger.add(QueuedSink(stream, serialize=args.json), level="INFO")
+    elif variant == "auth":
+        authentication.user_resolver = CachedUserResolver(
+            StaticUserResolver({API_KEY: User(username="bench", roles=["admin"])}),
+            max_size=10,
+            ttl=300,
+            negative_ttl=30,
+        )
+        app.add_middleware(RequestPipeline, stages=[authentication.authenticate])
+        logger.add(QueuedSink(stream, serialize=args.json), level="INFO")
+    return app
+
+
+async def run(app: FastAPI, args) -> tuple:
+    latencies = []
+    remaining = [args.requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            status, _ = await call(app, "GET", "/ping", headers={"X-API-Key": API_KEY})
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert status == 200, status
+
+    # Warm up, so the first requests don't skew things
+    for _ in range(100):
+        await call(app, "GET", "/ping", headers={"X-API-Key": API_KEY})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return args.requests / elapsed, statistics.median(latencies), quantiles[98]
+
+
+def main(args):
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {'JSON' if args.json else 'text'} logs")
+    print(f"  {'':8} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8} {'overhead/req':>13}")
+
+    floor = None
+    for variant in ("none", "before", "after", "auth"):
+        rps, p50, p99 = asyncio.run(run(build_app(variant, args), args))
+        floor = floor or rps
+        overhead = (1 / rps - 1 / floor) * 1_000_000
+        print(f"  {variant:8} {rps:9.1f} {p50:8.2f} {p99:8.2f} {overhead:11.1f}us")
+
+    logger.remove()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Total number of requests per variant")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of workers making requests")
+    parser.add_argument("--json", action="store_true", help="Log as JSON, like LOG_OUTPUT=json")
+    parser.add_argument("--log-file", default=os.devnull, help="Where the logs are written")
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""Measures write throughput against a live OpenSearch cluster under each refresh policy
+
+Uses the same connection settings as the app (see app/env.py), and writes into a scratch index that's deleted when done.
+Both single doc index calls (how tags are written) and bulk calls (how history and audit entries are written) are timed
+
+    python -m bench.refresh_policy --docs 2000 --batch-size 100 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from app.env import OPENSEARCH_INDEX_PREFIX
+from app.lib.opensearch import client
+from app.service.base import REFRESH_POLICIES
+
+INDEX = f"{OPENSEARCH_INDEX_PREFIX}bench-refresh-policy"
+
+
+def make_doc() -> dict:
+    return {
+        "created": datetime.utcnow().isoformat(),
+        "action": "update",
+        "component": "tag",
+        "tag_id": str(uuid4()),
+        "message": "Benchmark entry",
+        "user": "bench",
+    }
+
+
+async def run_single(policy: str, docs: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write():
+        async with semaphore:
+            await client.index(index=INDEX, body=make_doc(), refresh=policy)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[write() for _ in range(docs)])
+    return docs / (time.perf_counter() - start)
+
+
+async def run_bulk(policy: str, docs: int, batch_size: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write(size):
+        body = []
+        for _ in range(size):
+            body.append({"index": {"_index": INDEX}})
+            body.append(make_doc())
+        async with semaphore:
+            await client.bulk(body=body, refresh=policy)
+
+    batches = [min(batch_size, docs - i) for i in range(0, docs, batch_size)]
+    start = time.perf_counter()
+    await asyncio.gather(*[write(size) for size in batches])
+    return docs / (time.perf_counter() - start)
+
+
+async def main(args):
+    await client.indices.create(index=INDEX, ignore=400)
+    try:
+        print(f"{'policy':<10} {'single docs/s':>15} {'bulk docs/s':>15}")
+        for policy in REFRESH_POLICIES:
+            single = await run_single(policy, args.docs, args.concurrency)
+            bulk = await run_bulk(policy, args.docs, args.batch_size, args.concurrency)
+            print(f"{policy:<10} {single:>15.1f} {bulk:>15.1f}")
+    finally:
+        await client.indices.delete(index=INDEX, ignore=404)
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000, help="Number of docs written per policy and mode")
+    parser.add_argument("--batch-size", type=int, default=100, help="Docs per bulk call")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max number of in-flight requests")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""Micro-benchmark of turning a page of tags read from the index into a response
+
+The same docs are served by two routes, and fetched over ASGI in process at each page size
+
+- model: How listings used to be served. Each tag is loaded into a `Tag`, and the page is returned as a model, which
+  FastAPI validates against the response model, then serializes
+- direct: How listings are served now. The page is returned as a `ModelResponse`, serialized straight from the models
+- summary: A listing asked for only some fields (`?fields=name,type,groups,updated`). The docs are cut down to those
+  fields as OpenSearch would, then loaded into `TagSummary`s
+
+Alongside those, the time to just load the page of docs into `Tag`s is measured on its own (build). Nothing touches
+OpenSearch, so only the cost of building and serializing the response is measured. Runs offline
+
+    python -m bench.serialization --sizes 10,100,1000 --patterns 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+from uuid import uuid4
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi import FastAPI  # noqa: E402
+
+from app.lib.responses import ModelResponse  # noqa: E402
+from app.models.pagination import PaginatedTagList, PaginatedTagSummaryList  # noqa: E402
+from app.models.tag import Import, Tag, TagSummary  # noqa: E402
+from bench.load import call, new_tag  # noqa: E402
+
+
+def stored_doc(number: int, patterns: int) -> dict:
+    """A tag as it comes back from a search of the tags index"""
+    now = datetime.utcnow().isoformat()
+    source = Import(**new_tag(number, patterns)).model_dump(mode="json") | {
+        "created": now,
+        "updated": now,
+        "author": "bench",
+        "editor": "bench",
+        "state": None,
+    }
+    return {"_id": str(uuid4()), "_version": 1, "_seq_no": number, "_primary_term": 1, "_source": source}
+
+
+SUMMARY_FIELDS = ["name", "type", "groups", "updated"]
+
+
+def projected_doc(doc: dict) -> dict:
+    """The same doc, as it comes back when only the summary fields are read"""
+    return doc | {"_source": {key: value for key, value in doc["_source"].items() if key in SUMMARY_FIELDS}}
+
+
+def build_app(docs: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model")
+    async def model(size: int) -> PaginatedTagList:
+        return PaginatedTagList(limit=size, offset=0, total=len(docs), items=[Tag(doc) for doc in docs[:size]])
+
+    @app.get("/direct", response_model=PaginatedTagList)
+    async def direct(size: int) -> ModelResponse:
+        items = [Tag(doc) for doc in docs[:size]]
+        return ModelResponse(PaginatedTagList.model_construct(limit=size, offset=0, total=len(docs), items=items))
+
+    projected = [projected_doc(doc) for doc in docs]
+
+    @app.get("/summary", response_model=PaginatedTagSummaryList)
+    async def summary(size: int) -> ModelResponse:
+        items = [TagSummary.from_doc(doc) for doc in projected[:size]]
+        return ModelResponse(
+            PaginatedTagSummaryList.model_construct(limit=size, offset=0, total=len(docs), items=items)
+        )
+
+    return app
+
+
+async def measure(app: FastAPI, path: str, size: int, seconds: float) -> tuple:
+    """Request the page repeatedly for a while, returning the median and best time per request, and the body"""
+    times = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(times) < 5:
+        start = time.perf_counter()
+        status, body = await call(app, "GET", path, f"size={size}")
+        times.append((time.perf_counter() - start) * 1000)
+        assert status == 200, body[:500]
+    return statistics.median(times), min(times), body
+
+
+def measure_build(docs: list, size: int, seconds: float) -> float:
+    """Load the page into tags repeatedly for a while, returning the best time"""
+    times = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(times) < 5:
+        start = time.perf_counter()
+        [Tag(doc) for doc in docs[:size]]
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+async def main(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    docs = [stored_doc(number, args.patterns) for number in range(max(sizes))]
+    app = build_app(docs)
+
+    print(f"Page of tags with {args.patterns} patterns each, median (best) ms per request")
+    print(f"  {'size':>6} {'build':>8} {'model':>18} {'direct':>18} {'speedup':>8} {'summary':>18} {'KB':>15}")
+    for size in sizes:
+        build = measure_build(docs, size, args.seconds / 2)
+        model, model_best, model_body = await measure(app, "/model", size, args.seconds)
+        direct, direct_best, direct_body = await measure(app, "/direct", size, args.seconds)
+        # Both have to send back exactly the same thing for the comparison to mean anything
+        assert json.loads(model_body) == json.loads(direct_body), "Responses differ"
+        summary, summary_best, summary_body = await measure(app, "/summary", size, args.seconds)
+        print(
+            f"  {size:>6} ({build:6.2f}) {model:9.2f} ({model_best:6.2f}) {direct:9.2f} ({direct_best:6.2f}) "
+            f"{model / direct:7.1f}x {summary:9.2f} ({summary_best:6.2f}) "
+            f"{len(direct_body) / 1024:7.1f}/{len(summary_body) / 1024:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma separated page sizes to measure")
+    parser.add_argument("--patterns", type=int, default=5, help="Number of patterns on each tag")
+    parser.add_argument("--seconds", type=float, default=2.0, help="How long to spend measuring each page size")
+    asyncio.run(main(parser.parse_args()))